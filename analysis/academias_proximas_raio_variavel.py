@@ -1,116 +1,182 @@
 # analysis/academias_proximas_raio_variavel.py
+#
+# Uso:
+#   python analysis/academias_proximas_raio_variavel.py                  -> pergunta o raio
+#   python analysis/academias_proximas_raio_variavel.py --raios 0.5 1 2 5 -> varredura de vários raios
 
+import argparse
+import numpy as np
 import pandas as pd
-from geopy.distance import geodesic
-import sqlite3
-from tqdm import tqdm
+import sys
 import os
 
-# Caminho do banco de dados SQLite
-DB_PATH = "./unidades.db"
+# Adiciona o diretório raiz ao path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analysis.busca_raio import pares_indexados, montar_pares
+from analysis import snapshot_unidades
+
 EXPORT_DIR = "./exportados"
 
-if not os.path.exists(EXPORT_DIR):
-    os.makedirs(EXPORT_DIR)
-
-# Conectar ao banco
-conn = sqlite3.connect(DB_PATH)
-
-# Carregar dados relevantes
-df = pd.read_sql_query("""
-    SELECT id, rede, nome, endereco, latitude, longitude, estado_cdn
-    FROM unidades
-""", conn)
-
-conn.close()
-
-# Converter latitude e longitude para float
-df['latitude'] = df['latitude'].astype(float)
-df['longitude'] = df['longitude'].astype(float)
-
-# Função para calcular distância entre duas coordenadas
-def distancia_km(coord1, coord2):
-    return geodesic(coord1, coord2).km
-
-# Receber raio do usuário
-while True:
-    try:
-        raio_km = float(input("Digite o raio em km para verificar proximidade: "))
-        break
-    except ValueError:
-        print("Valor inválido. Digite um número.")
-
-print(f"🔍 Calculando pares de unidades dentro de {raio_km} km...")
-
-# Lista de pares próximos
-proximos = []
-
-# Iterar sobre todas as combinações de unidades
-for i, row_i in tqdm(df.iterrows(), total=len(df), desc="Unidades processadas"):
-    coord_i = (row_i['latitude'], row_i['longitude'])
-    for j, row_j in df.loc[i+1:].iterrows():
-        coord_j = (row_j['latitude'], row_j['longitude'])
-        d = distancia_km(coord_i, coord_j)
-        if d <= raio_km:
-            proximos.append({
-                'id_1': row_i['id'],
-                'rede_1': row_i['rede'],
-                'nome_1': row_i['nome'],
-                'id_2': row_j['id'],
-                'rede_2': row_j['rede'],
-                'nome_2': row_j['nome'],
-                'distancia_km': round(d, 3),
-                'estado': row_i['estado_cdn']
-            })
-
-# Transformar em DataFrame
-df_proximos = pd.DataFrame(proximos)
-
-# Exportar CSV com pares próximos
-csv_pares = os.path.join(EXPORT_DIR, f"unidades_proximas_{raio_km}km.csv")
-df_proximos.to_csv(csv_pares, index=False)
-print(f"✅ Total de pares próximos encontrados: {len(df_proximos)}")
-print(f"📤 CSV exportado em {csv_pares}")
-
-# Métricas por rede
-metrics_rede = []
-for rede in df['rede'].unique():
-    total_pares = df_proximos[(df_proximos['rede_1'] == rede) | (df_proximos['rede_2'] == rede)].shape[0]
-    metrics_rede.append({'rede': rede, 'pares_proximos': total_pares})
-
-df_metrics_rede = pd.DataFrame(metrics_rede)
-csv_rede = os.path.join(EXPORT_DIR, f"metrics_rede_{raio_km}km.csv")
-df_metrics_rede.to_csv(csv_rede, index=False)
-print(f"📊 Métricas por rede exportadas em {csv_rede}")
-
-# Métricas por estado
-metrics_estado = []
-for estado in df['estado_cdn'].unique():
-    total_pares = df_proximos[df_proximos['estado'] == estado].shape[0]
-    metrics_estado.append({'estado': estado, 'pares_proximos': total_pares})
-
-df_metrics_estado = pd.DataFrame(metrics_estado)
-csv_estado = os.path.join(EXPORT_DIR, f"metrics_estado_{raio_km}km.csv")
-df_metrics_estado.to_csv(csv_estado, index=False)
-print(f"📊 Métricas por estado exportadas em {csv_estado}")
-
-# Métricas por estado + rede
-metrics_estado_rede = []
-for estado in df['estado_cdn'].unique():
-    df_estado = df_proximos[df_proximos['estado'] == estado]
-    for rede in df['rede'].unique():
-        total_pares = df_estado[
-            (df_estado['rede_1'] == rede) | (df_estado['rede_2'] == rede)
-        ].shape[0]
-        metrics_estado_rede.append({
-            'estado': estado,
-            'rede': rede,
-            'pares_proximos': total_pares
-        })
-
-df_metrics_estado_rede = pd.DataFrame(metrics_estado_rede)
-csv_estado_rede = os.path.join(EXPORT_DIR, f"metrics_estado_rede_{raio_km}km.csv")
-df_metrics_estado_rede.to_csv(csv_estado_rede, index=False)
-print(f"📊 Métricas por estado + rede exportadas em {csv_estado_rede}")
-
-print("🎉 Processamento concluído!")
+
+def carregar_unidades():
+    # Snapshot colunar de unidades (coordenadas já em float)
+    return snapshot_unidades.carregar_unidades(
+        colunas=['id', 'rede', 'nome', 'endereco', 'latitude', 'longitude', 'estado_cdn']
+    )
+
+
+def perguntar_raio():
+    # Receber raio do usuário
+    while True:
+        try:
+            return float(input("Digite o raio em km para verificar proximidade: "))
+        except ValueError:
+            print("Valor inválido. Digite um número.")
+
+
+def _codigos(valores, categorias):
+    """Código inteiro de cada valor na lista de categorias (-1 se ausente/nulo)."""
+    return pd.Categorical(valores, categories=categorias).codes.astype(np.intp)
+
+
+def _contar_por_rede(chave_base, c1, c2, n_chaves):
+    """
+    Conta pares em que a rede aparece em rede_1 ou rede_2 — um par da mesma
+    rede conta uma vez só, como no filtro (rede_1 == rede) | (rede_2 == rede).
+    """
+    mesma = c1 == c2
+    return (np.bincount(chave_base + c1, minlength=n_chaves)
+            + np.bincount(chave_base + c2, minlength=n_chaves)
+            - np.bincount((chave_base + c1)[mesma], minlength=n_chaves))
+
+
+def calcular_metricas(df, df_proximos):
+    """
+    Métricas de pares próximos com códigos inteiros e bincount, em uma
+    passada pelos pares. Retorna (por rede, por estado, por estado + rede,
+    por par de redes), na mesma ordem de linhas dos antigos loops.
+    """
+    redes = list(df['rede'].unique())
+    estados = list(df['estado_cdn'].unique())
+    estados_validos = [e for e in estados if pd.notna(e)]
+    n_redes, n_estados = len(redes), len(estados_validos)
+
+    c1 = _codigos(df_proximos['rede_1'], redes)
+    c2 = _codigos(df_proximos['rede_2'], redes)
+    ce = _codigos(df_proximos['estado'], estados_validos)
+
+    # Por rede
+    por_rede = _contar_por_rede(0, c1, c2, n_redes)
+    df_metrics_rede = pd.DataFrame({'rede': redes, 'pares_proximos': por_rede})
+
+    # Por estado (estado nulo nunca casa com nenhum par, como no filtro ==)
+    com_estado = ce >= 0
+    por_estado = np.bincount(ce[com_estado], minlength=n_estados)
+    contagem_estado = dict(zip(estados_validos, por_estado))
+    df_metrics_estado = pd.DataFrame({
+        'estado': estados,
+        'pares_proximos': [int(contagem_estado.get(e, 0)) if pd.notna(e) else 0 for e in estados]
+    })
+
+    # Por estado + rede
+    por_estado_rede = _contar_por_rede(ce[com_estado] * n_redes, c1[com_estado], c2[com_estado],
+                                       n_estados * n_redes).reshape(n_estados, n_redes)
+    linhas = []
+    for estado in estados:
+        posicao = estados_validos.index(estado) if pd.notna(estado) else None
+        for k, rede in enumerate(redes):
+            total = int(por_estado_rede[posicao, k]) if posicao is not None else 0
+            linhas.append({'estado': estado, 'rede': rede, 'pares_proximos': total})
+    df_metrics_estado_rede = pd.DataFrame(linhas, columns=['estado', 'rede', 'pares_proximos'])
+
+    # Por par de redes (sem ordem: Bluefit–Selfit == Selfit–Bluefit)
+    menor, maior = np.minimum(c1, c2), np.maximum(c1, c2)
+    por_par = np.bincount(menor * n_redes + maior, minlength=n_redes * n_redes).reshape(n_redes, n_redes)
+    a, b = np.triu_indices(n_redes)
+    df_metrics_pares = pd.DataFrame({
+        'rede_a': [redes[k] for k in a],
+        'rede_b': [redes[k] for k in b],
+        'pares_proximos': por_par[a, b]
+    })
+
+    return df_metrics_rede, df_metrics_estado, df_metrics_estado_rede, df_metrics_pares
+
+
+def exportar_metricas(df, df_proximos, raio_km):
+    df_metrics_rede, df_metrics_estado, df_metrics_estado_rede, df_metrics_pares = \
+        calcular_metricas(df, df_proximos)
+
+    # Métricas por rede
+    csv_rede = os.path.join(EXPORT_DIR, f"metrics_rede_{raio_km}km.csv")
+    df_metrics_rede.to_csv(csv_rede, index=False)
+    print(f"📊 Métricas por rede exportadas em {csv_rede}")
+
+    # Métricas por estado
+    csv_estado = os.path.join(EXPORT_DIR, f"metrics_estado_{raio_km}km.csv")
+    df_metrics_estado.to_csv(csv_estado, index=False)
+    print(f"📊 Métricas por estado exportadas em {csv_estado}")
+
+    # Métricas por estado + rede
+    csv_estado_rede = os.path.join(EXPORT_DIR, f"metrics_estado_rede_{raio_km}km.csv")
+    df_metrics_estado_rede.to_csv(csv_estado_rede, index=False)
+    print(f"📊 Métricas por estado + rede exportadas em {csv_estado_rede}")
+
+    # Métricas por par de redes
+    csv_pares_redes = os.path.join(EXPORT_DIR, f"metrics_pares_redes_{raio_km}km.csv")
+    df_metrics_pares.to_csv(csv_pares_redes, index=False)
+    print(f"📊 Métricas por par de redes exportadas em {csv_pares_redes}")
+
+
+def processar_raios(df, raios):
+    """
+    Calcula os pares uma única vez no maior raio e, para cada raio menor,
+    pega o prefixo das distâncias ordenadas. Exporta pares e métricas de
+    cada raio e devolve o resumo {raio: total de pares}.
+    """
+    raios = sorted(set(raios))
+    print(f"🔍 Calculando pares de unidades dentro de {raios[-1]} km...")
+
+    # Pares da tabela pares_proximos (até RAIO_MAX_PARES_KM) ou do cKDTree + geodesic
+    i, j, d = pares_indexados(df, raios[-1])
+    ordem = np.argsort(d, kind='stable')
+    d_ordenado = d[ordem]
+
+    resumo = {}
+    for raio_km in raios:
+        # Prefixo das distâncias ≤ raio, de volta na ordem (i, j) do CSV
+        selecao = np.sort(ordem[:np.searchsorted(d_ordenado, raio_km, side='right')])
+        df_proximos = montar_pares(df, i[selecao], j[selecao], d[selecao])
+
+        # Exportar CSV com pares próximos
+        csv_pares = os.path.join(EXPORT_DIR, f"unidades_proximas_{raio_km}km.csv")
+        df_proximos.to_csv(csv_pares, index=False)
+        print(f"\n✅ [{raio_km} km] Total de pares próximos encontrados: {len(df_proximos)}")
+        print(f"📤 CSV exportado em {csv_pares}")
+
+        exportar_metricas(df, df_proximos, raio_km)
+        resumo[raio_km] = len(df_proximos)
+
+    return resumo
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pares de academias próximas por raio (km)")
+    parser.add_argument("--raios", type=float, nargs="+",
+                        help="lista de raios em km (sem interação); ex: --raios 0.5 1 2 5")
+    args = parser.parse_args()
+
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+
+    df = carregar_unidades()
+    raios = args.raios or [perguntar_raio()]
+    resumo = processar_raios(df, raios)
+
+    if len(resumo) > 1:
+        df_resumo = pd.DataFrame({'raio_km': list(resumo.keys()), 'pares_proximos': list(resumo.values())})
+        csv_resumo = os.path.join(EXPORT_DIR, "resumo_raios.csv")
+        df_resumo.to_csv(csv_resumo, index=False)
+        print(f"\n📈 Pares por raio:\n{df_resumo.to_string(index=False)}")
+        print(f"📊 Resumo exportado em {csv_resumo}")
+
+    print("🎉 Processamento concluído!")
@@ -0,0 +1,87 @@
+# =========================
+# busca_raio.py
+# =========================
+"""
+Busca de pares de unidades dentro de um raio usando índice espacial.
+
+O índice (cKDTree na esfera unitária + refinamento geodesic) fica em
+database/indice_espacial.py, que também mantém a tabela pares_proximos;
+aqui ficam as funções que montam os pares no formato das análises. Até
+RAIO_MAX_PARES_KM os pares vêm direto da tabela (consulta indexada); acima
+disso, ou com a tabela vazia, são calculados com o índice.
+"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+# Adiciona o diretório raiz ao path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.indice_espacial import (  # noqa: F401  (reexportadas para as análises)
+    R_TERRA_KM, MARGEM_ESFERA, coordenadas_esfera, raio_para_corda, construir_indice,
+    pares_candidatos, distancias_geodesic, buscar_pares,
+)
+from database.db import Database, RAIO_MAX_PARES_KM
+from analysis.snapshot_unidades import DB_PATH
+
+COLUNAS_PARES = ['id_1', 'rede_1', 'nome_1', 'id_2', 'rede_2', 'nome_2', 'distancia_km', 'estado']
+
+
+# =========================
+# DataFrame de pares
+# =========================
+def montar_pares(df, i, j, d):
+    """Monta o DataFrame de pares no formato de unidades_proximas_{raio}km.csv."""
+    return pd.DataFrame({
+        'id_1': df['id'].to_numpy()[i],
+        'rede_1': df['rede'].to_numpy()[i],
+        'nome_1': df['nome'].to_numpy()[i],
+        'id_2': df['id'].to_numpy()[j],
+        'rede_2': df['rede'].to_numpy()[j],
+        'nome_2': df['nome'].to_numpy()[j],
+        'distancia_km': [round(x, 3) for x in d.tolist()],
+        'estado': df['estado_cdn'].to_numpy()[i]
+    }, columns=COLUNAS_PARES)
+
+
+def pares_no_raio(df, raio_km):
+    """Pares de unidades de df a até raio_km, com as colunas do CSV de pares."""
+    i, j, d = pares_indexados(df, raio_km)
+    return montar_pares(df, i, j, d)
+
+
+# =========================
+# Pares da tabela pares_proximos
+# =========================
+def pares_da_tabela(df, raio_km, db_path=DB_PATH):
+    """
+    (i, j, d) posicionais em df lidos de pares_proximos, ordenados por (i, j);
+    pares com alguma unidade fora de df ficam de fora. None se a tabela
+    estiver vazia (nunca foi montada).
+    """
+    pares = Database(f"sqlite:///{db_path}").buscar_pares_proximos(raio_km)
+    if not pares:
+        return None
+    id_1, id_2, d = (np.asarray(coluna) for coluna in zip(*pares))
+    posicoes = pd.Index(df['id'])
+    i, j = posicoes.get_indexer(id_1), posicoes.get_indexer(id_2)
+    presentes = (i >= 0) & (j >= 0)
+    i, j, d = i[presentes], j[presentes], d[presentes].astype(float)
+    i, j = np.minimum(i, j), np.maximum(i, j)
+    ordem = np.lexsort((j, i))
+    return i[ordem], j[ordem], d[ordem]
+
+
+def pares_indexados(df, raio_km, db_path=DB_PATH):
+    """
+    Mesmo resultado de buscar_pares(df['latitude'], df['longitude'], raio_km):
+    até RAIO_MAX_PARES_KM lê a tabela pares_proximos, senão (ou se ela estiver
+    vazia) usa o cKDTree.
+    """
+    if raio_km <= RAIO_MAX_PARES_KM and os.path.exists(db_path):
+        pares = pares_da_tabela(df, raio_km, db_path)
+        if pares is not None:
+            return pares
+    return buscar_pares(df['latitude'], df['longitude'], raio_km)
@@ -1,76 +1,123 @@
 # -*- coding: utf-8 -*-
-import sqlite3
+import sys
+import os
 import pandas as pd
 import folium
-from geopy.distance import geodesic
-from itertools import combinations
-
-# Conecta ao banco
-conn = sqlite3.connect("./unidades.db")
-df = pd.read_sql_query("""
-    SELECT id, rede, nome, endereco, latitude, longitude, bairro_cdn, cidade_cdn, estado_cdn, pais_cdn
-    FROM unidades
-""", conn)
-conn.close()
-
-# Filtra registros com coordenadas válidas
-df = df.dropna(subset=["latitude", "longitude"])
-df["latitude"] = df["latitude"].astype(float)
-df["longitude"] = df["longitude"].astype(float)
+
+# Adiciona o diretório raiz ao path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analysis.busca_raio import pares_indexados
+from analysis.snapshot_unidades import carregar_unidades
+
+# Modo de renderização:
+# - "camadas"    → uma camada GeoJSON por rede + todas as ligações em um único MultiLineString
+#                  (tamanho do HTML e tempo de render quase não crescem com o número de unidades)
+# - "marcadores" → um CircleMarker por unidade e uma PolyLine por par (modo antigo)
+MODO_RENDER = "camadas"
+
+# Casas decimais das coordenadas no GeoJSON (5 ≈ 1 m)
+CASAS_COORD = 5
+
+# Snapshot colunar de unidades, só com coordenadas válidas
+df = carregar_unidades(colunas=["id", "rede", "nome", "latitude", "longitude"], com_coordenadas=True)
 df["coords"] = list(zip(df.latitude, df.longitude))
 
 # Define raio de proximidade (1 km)
 RAIO_KM = 1.0
 
-# Lista para armazenar pares de academias próximas
-pares_proximos = []
-
-# Calcula distância entre todas as combinações possíveis
-for (idx1, row1), (idx2, row2) in combinations(df.iterrows(), 2):
-    dist = geodesic(row1["coords"], row2["coords"]).km
-    if dist <= RAIO_KM:
-        pares_proximos.append({
-            "academia_1": row1["nome"],
-            "rede_1": row1["rede"],
-            "coords_1": row1["coords"],
-            "academia_2": row2["nome"],
-            "rede_2": row2["rede"],
-            "coords_2": row2["coords"],
-            "distancia_km": round(dist, 3)
-        })
-
-df_proximas = pd.DataFrame(pares_proximos)
+# Pares de academias próximas da tabela pares_proximos (ou cKDTree + geodesic)
+i, j, d = pares_indexados(df, RAIO_KM)
+df_proximas = pd.DataFrame({
+    "academia_1": df["nome"].to_numpy()[i],
+    "rede_1": df["rede"].to_numpy()[i],
+    "coords_1": df["coords"].to_numpy()[i],
+    "academia_2": df["nome"].to_numpy()[j],
+    "rede_2": df["rede"].to_numpy()[j],
+    "coords_2": df["coords"].to_numpy()[j],
+    "distancia_km": [round(x, 3) for x in d.tolist()]
+})
 
 # Cria mapa centrado no Brasil
-mapa = folium.Map(location=[-15.7801, -47.9292], zoom_start=4)
+mapa = folium.Map(location=[-15.7801, -47.9292], zoom_start=4, prefer_canvas=True)
 
 # Define cores por rede
 cores = {}
 paleta = ['red', 'blue', 'green', 'purple', 'orange', 'darkred', 'lightred',
           'beige', 'darkblue', 'darkgreen', 'cadetblue', 'darkpurple', 'white', 'pink']
-for i, rede in enumerate(df['rede'].unique()):
-    cores[rede] = paleta[i % len(paleta)]
-
-# Adiciona marcadores
-for _, row in df.iterrows():
-    folium.CircleMarker(
-        location=row["coords"],
-        radius=5,
-        color=cores[row["rede"]],
-        fill=True,
-        fill_opacity=0.7,
-        popup=f"{row['nome']} ({row['rede']})"
-    ).add_to(mapa)
-
-# Adiciona linhas conectando pares próximos
-for _, row in df_proximas.iterrows():
-    folium.PolyLine(
-        locations=[row["coords_1"], row["coords_2"]],
-        color="gray",
-        weight=1,
-        opacity=0.5,
-        popup=f"{row['academia_1']} ↔ {row['academia_2']} ({row['distancia_km']} km)"
-    ).add_to(mapa)
+for k, rede in enumerate(df['rede'].unique()):
+    cores[rede] = paleta[k % len(paleta)]
+
+
+def ponto_geojson(lat, lon):
+    return [round(lon, CASAS_COORD), round(lat, CASAS_COORD)]
+
+
+if MODO_RENDER == "camadas":
+    # Uma camada por rede, com todas as unidades em um único FeatureCollection
+    for rede, grupo in df.groupby("rede", sort=False, observed=True):
+        colecao = {
+            "type": "FeatureCollection",
+            "features": [
+                {
+                    "type": "Feature",
+                    "geometry": {"type": "Point", "coordinates": ponto_geojson(lat, lon)},
+                    "properties": {"nome": nome, "rede": rede}
+                }
+                for nome, lat, lon in zip(grupo["nome"], grupo["latitude"], grupo["longitude"])
+            ]
+        }
+        camada = folium.FeatureGroup(name=f"{rede} ({len(grupo)})")
+        folium.GeoJson(
+            colecao,
+            marker=folium.CircleMarker(radius=5, fill=True, fill_opacity=0.7),
+            style_function=lambda _, cor=cores[rede]: {"color": cor, "fillColor": cor},
+            popup=folium.GeoJsonPopup(fields=["nome", "rede"], labels=False)
+        ).add_to(camada)
+        camada.add_to(mapa)
+
+    # Todas as ligações entre pares próximos em um único MultiLineString
+    ligacoes = {
+        "type": "Feature",
+        "geometry": {
+            "type": "MultiLineString",
+            "coordinates": [
+                [ponto_geojson(*c1), ponto_geojson(*c2)]
+                for c1, c2 in zip(df_proximas["coords_1"], df_proximas["coords_2"])
+            ]
+        },
+        "properties": {"pares": len(df_proximas)}
+    }
+    camada_ligacoes = folium.FeatureGroup(name=f"Pares ≤ {RAIO_KM} km ({len(df_proximas)})")
+    folium.GeoJson(
+        ligacoes,
+        style_function=lambda _: {"color": "gray", "weight": 1, "opacity": 0.5}
+    ).add_to(camada_ligacoes)
+    camada_ligacoes.add_to(mapa)
+
+    folium.LayerControl(collapsed=False).add_to(mapa)
+
+else:
+    # Adiciona marcadores
+    for _, row in df.iterrows():
+        folium.CircleMarker(
+            location=row["coords"],
+            radius=5,
+            color=cores[row["rede"]],
+            fill=True,
+            fill_opacity=0.7,
+            popup=f"{row['nome']} ({row['rede']})"
+        ).add_to(mapa)
+
+    # Adiciona linhas conectando pares próximos
+    for _, row in df_proximas.iterrows():
+        folium.PolyLine(
+            locations=[row["coords_1"], row["coords_2"]],
+            color="gray",
+            weight=1,
+            opacity=0.5,
+            popup=f"{row['academia_1']} ↔ {row['academia_2']} ({row['distancia_km']} km)"
+        ).add_to(mapa)
 
 # Salva mapa
 mapa.save("./exportados/mapa_academias_proximas.html")
@@ -1,12 +1,22 @@
 # =========================
 # matriz_distancias.py
 # =========================
-import sqlite3
 import pandas as pd
 import numpy as np
 import os
+import sys
+import hashlib
+from multiprocessing import Pool, shared_memory
+from scipy import sparse
 from scipy.spatial.distance import cdist
 
+# Adiciona o diretório raiz ao path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import MATRIZ_MODO, DIST_MAX_ESPARSA
+from analysis.busca_raio import pares_candidatos
+from analysis.snapshot_unidades import carregar_unidades
+
 # =========================
 # Configurações
 # =========================
@@ -14,22 +24,32 @@ DB_PATH = "./unidades.db"
 EXPORT_DIR = "./exportados"
 UNIDADES_PKL = os.path.join(EXPORT_DIR, "unidades.pkl")
 MATRIZ_FILE = os.path.join(EXPORT_DIR, "matriz_completa.pkl")
+MATRIZ_ESPARSA_FILE = os.path.join(EXPORT_DIR, "matriz_esparsa.npz")
+MATRIZ_CACHE_FILE = os.path.join(EXPORT_DIR, "matriz_completa_cache.pkl")
+
+# Acima desta fração de unidades alteradas, recalcular tudo sai mais barato
+FRACAO_MAX_INCREMENTAL = 0.5
+
+# A atualização incremental mantém a matriz antiga e a nova em memória ao
+# mesmo tempo; se as duas juntas passarem disto, recalcula tudo em blocos
+# (só a matriz nova em memória)
+MEMORIA_MAX_INCREMENTAL = 2 * 1024 ** 3   # bytes
+
+# Cálculo em blocos de linhas: memória de pico ~ BLOCO_LINHAS x n por processo
+BLOCO_LINHAS = 512
+N_PROCESSOS = os.cpu_count() or 1
+MATRIZ_DTYPE = np.float64   # np.float32 usa metade da memória
 
 os.makedirs(EXPORT_DIR, exist_ok=True)
 
 # =========================
 # Função para carregar dados
 # =========================
-def load_unidades():
-    conn = sqlite3.connect(DB_PATH)
-    df = pd.read_sql_query("""
-        SELECT id, rede, nome, latitude, longitude, estado_cdn
-        FROM unidades
-    """, conn)
-    conn.close()
-    df['latitude'] = df['latitude'].astype(float)
-    df['longitude'] = df['longitude'].astype(float)
-    return df
+def load_unidades(com_coordenadas=False):
+    return carregar_unidades(
+        colunas=['id', 'rede', 'nome', 'latitude', 'longitude', 'estado_cdn'],
+        com_coordenadas=com_coordenadas, db_path=DB_PATH
+    )
 
 # =========================
 # Haversine vetorizado
@@ -46,23 +66,328 @@ def haversine_vectorized(lat_lon):
     R = 6371  # Raio da Terra em km
     return R * c
 
+# =========================
+# Haversine só para uma lista de pares (mesma fórmula da matriz densa)
+# =========================
+def haversine_pares(lat_lon, i, j):
+    lat = np.radians(lat_lon[:, 0])
+    lon = np.radians(lat_lon[:, 1])
+    dlat = lat[i] - lat[j]
+    dlon = lon[i] - lon[j]
+    a = np.sin(dlat/2)**2 + np.cos(lat[i])*np.cos(lat[j])*np.sin(dlon/2)**2
+    c = 2 * np.arcsin(np.sqrt(a))
+    R = 6371  # Raio da Terra em km
+    return R * c
+
+# =========================
+# Haversine em blocos de linhas (memória limitada, vários processos)
+# =========================
+R_TERRA_KM = 6371
+
+# Estado de cada processo do pool (preenchido por _iniciar_processo)
+_processo = {}
+
+def _preparar_coords(lat_lon, dtype):
+    """Matriz 3 x n com latitude e longitude em radianos e cos(latitude)."""
+    lat = np.radians(lat_lon[:, 0])
+    lon = np.radians(lat_lon[:, 1])
+    return np.vstack([lat, lon, np.cos(lat)]).astype(dtype)
+
+def _haversine_bloco(coords, inicio, fim):
+    """Distâncias das linhas [inicio, fim) contra todas as colunas (mesma fórmula da matriz densa)."""
+    return _haversine_linhas(coords[:, inicio:fim], coords)
+
+def _haversine_linhas(coords_linhas, coords):
+    """Distâncias de cada ponto de coords_linhas contra todos os pontos de coords."""
+    lat_l, lon_l, cos_l = coords_linhas
+    lat, lon, cos_lat = coords
+    a = lat_l[:, None] - lat[None, :]
+    a /= 2
+    np.sin(a, out=a)
+    a **= 2
+    t = lon_l[:, None] - lon[None, :]
+    t /= 2
+    np.sin(t, out=t)
+    t **= 2
+    cos_prod = cos_l[:, None] * cos_lat[None, :]
+    cos_prod *= t
+    a += cos_prod
+    del t, cos_prod
+    np.sqrt(a, out=a)
+    np.arcsin(a, out=a)
+    a *= 2
+    a *= R_TERRA_KM
+    return a
+
+def _blocos(n, bloco):
+    return [(inicio, min(inicio + bloco, n)) for inicio in range(0, n, bloco)]
+
+def _iniciar_processo(nome_shm, forma, dtype, saida, dist_max):
+    shm = shared_memory.SharedMemory(name=nome_shm)
+    _processo['shm'] = shm
+    _processo['coords'] = np.ndarray(forma, dtype=dtype, buffer=shm.buf)
+    _processo['dist_max'] = dist_max
+    if saida is not None:
+        n = forma[1]
+        _processo['memmap'] = np.memmap(saida, dtype=dtype, mode='r+', shape=(n, n))
+
+def _processar_bloco(intervalo):
+    return _calcular_bloco(_processo['coords'], intervalo, _processo.get('memmap'), _processo['dist_max'])
+
+def _calcular_bloco(coords, intervalo, memmap, dist_max):
+    """
+    Calcula um bloco de linhas e entrega conforme o modo de saída:
+    esparso (pares ≤ dist_max), direto no memmap, ou o bloco denso para o processo pai.
+    """
+    inicio, fim = intervalo
+    bloco = _haversine_bloco(coords, inicio, fim)
+    if dist_max is not None:
+        linhas, colunas = np.nonzero(bloco <= dist_max)
+        linhas += inicio
+        diferentes = linhas != colunas
+        linhas, colunas = linhas[diferentes], colunas[diferentes]
+        return intervalo, (linhas, colunas, bloco[linhas - inicio, colunas])
+    if memmap is not None:
+        memmap[inicio:fim] = bloco
+        memmap.flush()
+        return intervalo, None
+    return intervalo, bloco
+
+def haversine_blocos(lat_lon, bloco=BLOCO_LINHAS, dtype=MATRIZ_DTYPE, n_processos=N_PROCESSOS,
+                     saida=None, dist_max=None):
+    """
+    Matriz de distâncias Haversine calculada em blocos de `bloco` linhas.
+
+    As coordenadas ficam em memória compartilhada e cada processo do pool
+    calcula blocos inteiros, então a memória extra é de alguns blocos por
+    processo em vez de vários temporários n x n.
+
+    Saída:
+      - dist_max informado → matriz CSR (índices posicionais) só com pares ≤ dist_max;
+      - saida = caminho    → np.memmap n x n escrito diretamente pelos processos;
+      - saida = ndarray    → preenchido pelo processo pai;
+      - padrão             → novo ndarray n x n.
+    """
+    dtype = np.dtype(dtype)
+    coords = _preparar_coords(np.asarray(lat_lon, dtype=float), dtype)
+    n = coords.shape[1]
+    intervalos = _blocos(n, bloco)
+
+    caminho_memmap = None
+    if dist_max is None:
+        if isinstance(saida, str):
+            caminho_memmap = saida
+            saida = np.memmap(caminho_memmap, dtype=dtype, mode='w+', shape=(n, n))
+        elif saida is None:
+            saida = np.empty((n, n), dtype=dtype)
+    acumulado = []
+
+    def receber(intervalo, resultado):
+        if dist_max is not None:
+            acumulado.append(resultado)
+        elif resultado is not None:
+            inicio, fim = intervalo
+            saida[inicio:fim] = resultado
+
+    if n_processos <= 1 or len(intervalos) <= 1:
+        for intervalo in intervalos:
+            receber(*_calcular_bloco(coords, intervalo, None, dist_max))
+    else:
+        shm = shared_memory.SharedMemory(create=True, size=max(coords.nbytes, 1))
+        try:
+            np.ndarray(coords.shape, dtype=dtype, buffer=shm.buf)[:] = coords
+            if caminho_memmap is not None:
+                saida.flush()
+            with Pool(n_processos, initializer=_iniciar_processo,
+                      initargs=(shm.name, coords.shape, dtype, caminho_memmap, dist_max)) as pool:
+                for intervalo, resultado in pool.imap_unordered(_processar_bloco, intervalos):
+                    receber(intervalo, resultado)
+        finally:
+            shm.close()
+            shm.unlink()
+
+    if dist_max is not None:
+        if acumulado:
+            linhas, colunas, valores = (np.concatenate(partes) for partes in zip(*acumulado))
+        else:
+            linhas = colunas = np.empty(0, dtype=np.intp)
+            valores = np.empty(0, dtype=dtype)
+        return sparse.csr_matrix((valores, (linhas, colunas)), shape=(n, n))
+    return saida
+
+# =========================
+# Cache da matriz densa por impressão digital das coordenadas
+# =========================
+def impressao_digital(df):
+    """
+    Hash SHA-256 de (id, latitude, longitude, nome) das unidades, na ordem de df.
+    O nome entra porque rotula as linhas/colunas do pickle.
+    """
+    h = hashlib.sha256()
+    h.update(df['id'].to_numpy(dtype=np.int64).tobytes())
+    h.update(df[['latitude', 'longitude']].to_numpy(dtype=np.float64).tobytes())
+    h.update("\0".join(df['nome'].astype(str)).encode('utf-8'))
+    return h.hexdigest()
+
+def _ler_cache():
+    if not (os.path.exists(MATRIZ_FILE) and os.path.exists(MATRIZ_CACHE_FILE)):
+        return None
+    return pd.read_pickle(MATRIZ_CACHE_FILE)
+
+def _salvar_cache(df, matriz_array, impressao):
+    matriz = pd.DataFrame(matriz_array, index=df['nome'], columns=df['nome'])
+    matriz.to_pickle(MATRIZ_FILE)
+    pd.to_pickle({
+        'impressao': impressao,
+        'dtype': matriz_array.dtype.str,
+        'ids': df['id'].to_numpy(dtype=np.int64),
+        'coords': df[['latitude', 'longitude']].to_numpy(dtype=np.float64),
+    }, MATRIZ_CACHE_FILE)
+    return matriz
+
+def atualizar_matriz_completa(df, bloco=BLOCO_LINHAS, dtype=MATRIZ_DTYPE):
+    """
+    Devolve a matriz densa de df usando matriz_completa.pkl como cache.
+
+    - impressão digital igual → usa o pickle como está;
+    - poucas unidades adicionadas, removidas ou com coordenada alterada →
+      copia os pares que não mudaram e recalcula só as linhas/colunas dessas unidades;
+    - sem cache, mudança grande ou matriz antiga + nova acima de
+      MEMORIA_MAX_INCREMENTAL → recalcula tudo com haversine_blocos.
+    """
+    impressao = impressao_digital(df)
+    cache = _ler_cache()
+    if cache is not None and cache['impressao'] == impressao:
+        print("⚡ Matriz em dia com o banco. Carregando pickle...")
+        return pd.read_pickle(MATRIZ_FILE)
+
+    coords_novas = df[['latitude', 'longitude']].to_numpy(dtype=np.float64)
+    ids_novos = df['id'].to_numpy(dtype=np.int64)
+    n = len(df)
+
+    if cache is not None:
+        posicao_antiga = pd.Series(np.arange(len(cache['ids'])), index=cache['ids'])
+        pos_antiga = posicao_antiga.reindex(ids_novos).to_numpy()
+        existia = ~np.isnan(pos_antiga)
+        pos_antiga = np.where(existia, pos_antiga, 0).astype(np.intp)
+        mesma_coord = existia & (cache['coords'][pos_antiga] == coords_novas).all(axis=1)
+
+        reaproveitar = np.flatnonzero(mesma_coord)
+        recalcular = np.flatnonzero(~mesma_coord)
+        removidas = len(cache['ids']) - existia.sum()
+
+        # Caches antigos não guardam o dtype: supõe float64
+        memoria = (len(cache['ids']) ** 2 * np.dtype(cache.get('dtype', np.float64)).itemsize
+                   + n ** 2 * np.dtype(dtype).itemsize)
+        if memoria > MEMORIA_MAX_INCREMENTAL:
+            print(f"⚠️ Matriz antiga + nova ocupariam {memoria / 1024 ** 2:.0f} MB "
+                  f"(limite {MEMORIA_MAX_INCREMENTAL / 1024 ** 2:.0f} MB): recalculando tudo")
+        elif len(recalcular) <= FRACAO_MAX_INCREMENTAL * n:
+            print(f"♻️ Atualizando matriz: {(~existia).sum()} novas, {removidas} removidas, "
+                  f"{(existia & ~mesma_coord).sum()} com coordenada alterada")
+            antiga = pd.read_pickle(MATRIZ_FILE).to_numpy()
+            matriz_array = np.empty((n, n), dtype=dtype)
+
+            origem = pos_antiga[reaproveitar]
+            for inicio, fim in _blocos(len(reaproveitar), bloco):
+                linhas_novas = reaproveitar[inicio:fim]
+                linhas_antigas = origem[inicio:fim]
+                matriz_array[linhas_novas[:, None], reaproveitar] = antiga[linhas_antigas[:, None], origem]
+            del antiga
+
+            coords = _preparar_coords(coords_novas, dtype)
+            for inicio, fim in _blocos(len(recalcular), bloco):
+                linhas = recalcular[inicio:fim]
+                distancias = _haversine_linhas(coords[:, linhas], coords)
+                matriz_array[linhas, :] = distancias
+                matriz_array[:, linhas] = distancias.T
+
+            return _salvar_cache(df, matriz_array, impressao)
+
+    print(f"🔍 Calculando matriz de distâncias (blocos de {bloco} linhas, {N_PROCESSOS} processos)...")
+    matriz_array = haversine_blocos(coords_novas, bloco=bloco, dtype=dtype)
+    return _salvar_cache(df, matriz_array, impressao)
+
+# =========================
+# Matriz esparsa (só pares ≤ dist_max), indexada pelo id da unidade
+# =========================
+def calcular_matriz_esparsa(df, dist_max=DIST_MAX_ESPARSA):
+    """
+    Retorna uma matriz CSR simétrica de shape (max_id + 1, max_id + 1) em que
+    matriz[id_a, id_b] é a distância Haversine entre as unidades, apenas para
+    pares diferentes a até dist_max km. Distância 0 entre unidades diferentes
+    fica guardada como zero explícito.
+    """
+    coords = df[['latitude', 'longitude']].to_numpy()
+    ids = df['id'].to_numpy()
+
+    i, j = pares_candidatos(coords[:, 0], coords[:, 1], dist_max)
+    d = haversine_pares(coords, i, j)
+    dentro = d <= dist_max
+    i, j, d = i[dentro], j[dentro], d[dentro]
+
+    n = int(ids.max()) + 1 if len(ids) else 0
+    linhas = np.concatenate([ids[i], ids[j]])
+    colunas = np.concatenate([ids[j], ids[i]])
+    valores = np.concatenate([d, d])
+    return sparse.csr_matrix((valores, (linhas, colunas)), shape=(n, n))
+
+def carregar_matriz_esparsa(caminho=MATRIZ_ESPARSA_FILE):
+    return sparse.load_npz(caminho).tocsr()
+
+# =========================
+# Leitura da matriz como lista de pares (densa ou esparsa)
+# =========================
+def carregar_matriz(modo=MATRIZ_MODO):
+    """Carrega a matriz salva no modo configurado (DataFrame denso ou CSR por id)."""
+    if modo == "esparsa":
+        return carregar_matriz_esparsa(MATRIZ_ESPARSA_FILE)
+    return pd.read_pickle(MATRIZ_FILE)
+
+def pares_da_matriz(matriz, df, dist_max, bloco=BLOCO_LINHAS):
+    """
+    Retorna (i, j, d) para todos os pares de unidades diferentes de df com
+    distância ≤ dist_max, nas duas ordens (i, j) e (j, i). i e j são posições
+    em df. A matriz densa é varrida em blocos de linhas; a esparsa é recortada
+    pelos ids de df.
+    """
+    if sparse.issparse(matriz):
+        ids = df['id'].to_numpy()
+        sub = matriz[ids][:, ids].tocoo()
+        dentro = sub.data <= dist_max
+        return sub.row[dentro].astype(np.intp), sub.col[dentro].astype(np.intp), sub.data[dentro]
+
+    if matriz.index.equals(pd.Index(df['nome'])) and matriz.columns.equals(pd.Index(df['nome'])):
+        valores = matriz.to_numpy()
+    else:
+        valores = matriz.loc[df['nome'], df['nome']].to_numpy()
+
+    partes = []
+    for inicio, fim in _blocos(len(valores), bloco):
+        linhas, colunas = np.nonzero(valores[inicio:fim] <= dist_max)
+        linhas += inicio
+        diferentes = linhas != colunas
+        linhas, colunas = linhas[diferentes], colunas[diferentes]
+        partes.append((linhas, colunas, valores[linhas, colunas]))
+    if not partes:
+        vazio = np.empty(0, dtype=np.intp)
+        return vazio, vazio, np.empty(0)
+    return tuple(np.concatenate(p) for p in zip(*partes))
+
 # =========================
 # Execução
 # =========================
 if __name__ == "__main__":
     print("🔗 Carregando dados do banco...")
-    df = load_unidades()
-    df = df.dropna(subset=['latitude', 'longitude']).reset_index(drop=True)
+    df = load_unidades(com_coordenadas=True)
     df.to_pickle(UNIDADES_PKL)
     print(f"✅ Dados salvos: {len(df)} unidades")
 
-    if os.path.exists(MATRIZ_FILE):
-        print("⚡ Matriz já existe. Carregando pickle...")
-        matriz = pd.read_pickle(MATRIZ_FILE)
+    if MATRIZ_MODO == "esparsa":
+        print(f"🔍 Calculando matriz esparsa de distâncias (≤ {DIST_MAX_ESPARSA} km)...")
+        matriz = calcular_matriz_esparsa(df, DIST_MAX_ESPARSA)
+        sparse.save_npz(MATRIZ_ESPARSA_FILE, matriz)
+        print(f"✅ Matriz esparsa salva em {MATRIZ_ESPARSA_FILE} ({matriz.nnz // 2} pares)")
     else:
-        print("🔍 Calculando matriz de distâncias (vetorizado)...")
-        coords = df[['latitude', 'longitude']].to_numpy()
-        matriz_array = haversine_vectorized(coords)
-        matriz = pd.DataFrame(matriz_array, index=df['nome'], columns=df['nome'])
-        matriz.to_pickle(MATRIZ_FILE)
-        print(f"✅ Matriz calculada e salva em {MATRIZ_FILE}")
+        matriz = atualizar_matriz_completa(df)
+        print(f"✅ Matriz pronta em {MATRIZ_FILE}")
@@ -5,13 +5,22 @@ import pandas as pd
 import numpy as np
 import plotly.graph_objects as go
 import os
-from config import EXPORT_DIR, ESTADO_DEFAULT
+import sys
+
+# Adiciona o diretório raiz ao path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import EXPORT_DIR, ESTADO_DEFAULT, MATRIZ_MODO, DIST_MAX_ESPARSA
+from analysis.matriz_distancias import carregar_matriz, pares_da_matriz
 
 # =========================
 # Configuração principal
 # =========================
 DIST_MAX_ULTIMA_FAIXA = 30  # km (usuário define aqui!)
 
+# Redes base dos heatmaps (None = todas). O cubo já tem todas, então trocar não recalcula nada.
+REDES_BASE = ["Smartfit"]
+
 # Quebras padrão (em km) -> sempre respeitar esses pontos
 BREAKPOINTS = [1, 5, 10, 15, 20, 30, 40, 50]
 
@@ -31,68 +40,89 @@ def gerar_faixas(max_dist):
     return faixas_dict
 
 FAIXAS_DISTANCIA = gerar_faixas(DIST_MAX_ULTIMA_FAIXA)
+LIMITES_FAIXAS = np.array([high for (low, high) in FAIXAS_DISTANCIA.values()], dtype=float)
 
 EXPORT_DIR = "./exportados"
 os.makedirs(EXPORT_DIR, exist_ok=True)
+CUBO_FILE = os.path.join(EXPORT_DIR, f"cubo_faixas_max{DIST_MAX_ULTIMA_FAIXA}km.npz")
 
 # =========================
-# Carregar dados
+# Cubo rede base x rede alvo x faixa em uma passada
 # =========================
-df = pd.read_pickle(os.path.join(EXPORT_DIR, "unidades.pkl"))
-matriz_completa = pd.read_pickle(os.path.join(EXPORT_DIR, "matriz_completa.pkl"))
+def calcular_cubo(codigos_rede, n_redes, i, j, d, limites, codigos_estado=None, n_estados=0):
+    """
+    Conta os pares (i, j) por rede de i, rede de j e faixa de distância.
+    A faixa vem de searchsorted nos limites: ≤ limites[0] é a primeira,
+    (limites[k-1], limites[k]] é a k-ésima; acima do último não conta.
 
-# =========================
-# Filtrar por estado se necessário
-# =========================
-estado = ESTADO_DEFAULT
-if estado:
-    df = df[df['estado_cdn'] == estado]
-    matriz_completa = matriz_completa.loc[df['nome'], df['nome']]
+    Com codigos_estado, também devolve o cubo por estado (estado x base x
+    alvo x faixa), contando só pares com as duas unidades no mesmo estado —
+    o mesmo que filtrar as unidades pelo estado antes de contar.
+    """
+    n_faixas = len(limites)
+    faixa = np.searchsorted(limites, d, side='left')
+    dentro = faixa < n_faixas
+    i, j, faixa = i[dentro], j[dentro], faixa[dentro]
 
-# =========================
-# Escolher rede base (ex: SmartFit)
-# =========================
-rede_base = "Smartfit"
-ids_base = df[df['rede'] == rede_base]['nome']
-redes = sorted(df['rede'].unique())
+    celula = (codigos_rede[i] * n_redes + codigos_rede[j]) * n_faixas + faixa
+    cubo = np.bincount(celula, minlength=n_redes * n_redes * n_faixas)
+    cubo = cubo.reshape(n_redes, n_redes, n_faixas)
+    if codigos_estado is None:
+        return cubo, None
 
-# =========================
-# Função para contar unidades por faixa de distância
-# =========================
-def contar_faixas(submatriz):
-    contagem = {}
-    for i, (faixa_nome, (min_km, max_km)) in enumerate(FAIXAS_DISTANCIA.items()):
-        if i == 0:  # primeira faixa inclui o limite inferior
-            mask = (submatriz <= max_km)
-        else:       # faixas intermediárias
-            mask = (submatriz > min_km) & (submatriz <= max_km)
-        contagem[faixa_nome] = mask.sum().sum()
-    return contagem
+    estado_i = codigos_estado[i]
+    mesmo_estado = (estado_i >= 0) & (estado_i == codigos_estado[j])
+    celula_estado = estado_i[mesmo_estado] * (n_redes * n_redes * n_faixas) + celula[mesmo_estado]
+    cubo_estado = np.bincount(celula_estado, minlength=n_estados * n_redes * n_redes * n_faixas)
+    return cubo, cubo_estado.reshape(n_estados, n_redes, n_redes, n_faixas)
 
 # =========================
-# Criar matriz de contagens para a rede base
+# Carregar dados e montar o cubo (todas as unidades)
 # =========================
-matriz_faixas = pd.DataFrame(index=redes, columns=FAIXAS_DISTANCIA.keys(), dtype=float)
-
-for rede_alvo in redes:
-    ids_alvo = df[df['rede'] == rede_alvo]['nome']
-    sub = matriz_completa.loc[ids_base, ids_alvo]
+df = pd.read_pickle(os.path.join(EXPORT_DIR, "unidades.pkl"))
+if MATRIZ_MODO == "esparsa" and DIST_MAX_ESPARSA < DIST_MAX_ULTIMA_FAIXA:
+    print(f"⚠️ Matriz esparsa guarda só até {DIST_MAX_ESPARSA} km (< {DIST_MAX_ULTIMA_FAIXA} km)")
+matriz = carregar_matriz(MATRIZ_MODO)
 
-    if rede_base == rede_alvo:
-        sub = sub.where(~np.eye(len(sub), dtype=bool))
+redes_todas = sorted(df['rede'].unique())
+estados_todos = sorted(df['estado_cdn'].dropna().unique())
+codigos_rede = pd.Categorical(df['rede'], categories=redes_todas).codes.astype(np.intp)
+codigos_estado = pd.Categorical(df['estado_cdn'], categories=estados_todos).codes.astype(np.intp)
 
-    contagem = contar_faixas(sub)
-    matriz_faixas.loc[rede_alvo] = contagem
+i, j, d = pares_da_matriz(matriz, df, LIMITES_FAIXAS[-1])
+cubo, cubo_estado = calcular_cubo(codigos_rede, len(redes_todas), i, j, d, LIMITES_FAIXAS,
+                                  codigos_estado, len(estados_todos))
+np.savez(CUBO_FILE, contagem=cubo, contagem_estado=cubo_estado, redes=np.array(redes_todas),
+         estados=np.array(estados_todos), faixas=np.array(list(FAIXAS_DISTANCIA.keys())))
+print(f"🧊 Cubo de faixas salvo em {CUBO_FILE}")
 
 # =========================
-# Converter para porcentagem
+# Fatiar o cubo para o estado escolhido
 # =========================
-matriz_faixas_percent = matriz_faixas.div(matriz_faixas.sum(axis=1), axis=0) * 100
+estado = ESTADO_DEFAULT
+if estado:
+    redes = sorted(df.loc[df['estado_cdn'] == estado, 'rede'].unique())
+    if estado in estados_todos:
+        cubo_sel = cubo_estado[estados_todos.index(estado)]
+    else:
+        cubo_sel = np.zeros_like(cubo)
+else:
+    redes = redes_todas
+    cubo_sel = cubo
+posicoes = [redes_todas.index(r) for r in redes]
+
+def matriz_faixas_rede(rede_base):
+    """Fatia do cubo: redes alvo x faixas para a rede base."""
+    if rede_base in redes_todas:
+        valores = cubo_sel[redes_todas.index(rede_base)][posicoes]
+    else:
+        valores = np.zeros((len(redes), len(LIMITES_FAIXAS)))
+    return pd.DataFrame(valores, index=redes, columns=FAIXAS_DISTANCIA.keys(), dtype=float)
 
 # =========================
 # Função para gerar heatmap e salvar HTML
 # =========================
-def plot_heatmap(matriz, tipo="quantidade", titulo="Distribuição de Academias por Faixa de Distância"):
+def plot_heatmap(matriz, rede_base, tipo="quantidade", titulo="Distribuição de Academias por Faixa de Distância"):
     if tipo == "percentual":
         zmin, zmax = 0, 100
         texttemplate = "%{text:.1f}%"
@@ -132,7 +162,10 @@ def plot_heatmap(matriz, tipo="quantidade", titulo="Distribuição de Academias
     print(f"🌐 Heatmap ({tipo}) salvo em {html_file}")
 
 # =========================
-# Gerar ambos os heatmaps separadamente
+# Gerar ambos os heatmaps para cada rede base
 # =========================
-plot_heatmap(matriz_faixas, tipo="quantidade")
-plot_heatmap(matriz_faixas_percent, tipo="percentual")
+for rede_base in (REDES_BASE or redes_todas):
+    matriz_faixas = matriz_faixas_rede(rede_base)
+    matriz_faixas_percent = matriz_faixas.div(matriz_faixas.sum(axis=1), axis=0) * 100
+    plot_heatmap(matriz_faixas, rede_base, tipo="quantidade")
+    plot_heatmap(matriz_faixas_percent, rede_base, tipo="percentual")
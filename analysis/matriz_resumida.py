@@ -4,7 +4,13 @@
 import pandas as pd
 import numpy as np
 import os
-from config import EXPORT_DIR, DIST_MAX_DEFAULT, ESTADO_DEFAULT
+import sys
+
+# Adiciona o diretório raiz ao path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import EXPORT_DIR, DIST_MAX_DEFAULT, ESTADO_DEFAULT, MATRIZ_MODO, DIST_MAX_ESPARSA
+from analysis.matriz_distancias import carregar_matriz, pares_da_matriz
 
 EXPORT_DIR = "./exportados"
 DIST_MAX_DEFAULT = 10  # km
@@ -13,54 +19,78 @@ UNIDADES_FILE = os.path.join(EXPORT_DIR, "unidades.pkl")
 AGREGADA_FILE = os.path.join(EXPORT_DIR, "matriz_agregada.pkl")
 
 # =========================
-# Carregar dados
+# Agregação rede x rede em uma única passada pelos pares
 # =========================
-df = pd.read_pickle(UNIDADES_FILE)
-matriz_completa = pd.read_pickle(MATRIZ_FILE)
+def agregar_redes(codigos, n_redes, i, j, d):
+    """
+    Recebe o código da rede de cada unidade e os pares válidos (i, j, d) já
+    sem a diagonal e dentro do raio. Retorna arrays n_redes x n_redes com:
+      - mínimo: menor distância entre as redes;
+      - média: média das médias por coluna (unidade da rede j), como o
+        antigo sub.mean().mean() sobre a submatriz com NaN fora do raio;
+      - contagem: número de pares (linha, coluna) válidos.
+    Células sem nenhum par ficam NaN no mínimo e na média.
+    """
+    n_unidades = len(codigos)
+    n_celulas = n_redes * n_redes
+    rede_i = codigos[i]
+    celula = rede_i * n_redes + codigos[j]
 
-# =========================
-# Filtrar por estado se necessário
-# =========================
-# Exemplo: estado = "SP"
-estado = ESTADO_DEFAULT
-if estado:
-    df = df[df['estado_cdn'] == estado]
-    matriz_completa = matriz_completa.loc[df['nome'], df['nome']]
+    contagem = np.bincount(celula, minlength=n_celulas)
 
-# =========================
-# Agregar rede x rede (corrigido)
-# =========================
-redes = sorted(df['rede'].unique())
-matriz_agregada_min = pd.DataFrame(index=redes, columns=redes, dtype=float)
-matriz_agregada_mean = pd.DataFrame(index=redes, columns=redes, dtype=float)
+    minimo = np.full(n_celulas, np.inf)
+    np.minimum.at(minimo, celula, d)
+    minimo[contagem == 0] = np.nan
 
-for rede_i in redes:
-    ids_i = df[df['rede'] == rede_i]['nome']
-    for rede_j in redes:
-        ids_j = df[df['rede'] == rede_j]['nome']
-        sub = matriz_completa.loc[ids_i, ids_j]
+    # Média por coluna: uma chave por (rede da linha, unidade da coluna)
+    coluna = rede_i * n_unidades + j
+    soma_coluna = np.bincount(coluna, weights=d, minlength=n_redes * n_unidades)
+    n_coluna = np.bincount(coluna, minlength=n_redes * n_unidades)
+    com_valor = np.flatnonzero(n_coluna)
+    media_coluna = soma_coluna[com_valor] / n_coluna[com_valor]
 
-        # Aplicar limite de distância
-        sub_limited = sub[sub <= DIST_MAX_DEFAULT]
+    celula_coluna = (com_valor // n_unidades) * n_redes + codigos[com_valor % n_unidades]
+    soma_medias = np.bincount(celula_coluna, weights=media_coluna, minlength=n_celulas)
+    n_colunas = np.bincount(celula_coluna, minlength=n_celulas)
+    media = np.full(n_celulas, np.nan)
+    media[n_colunas > 0] = soma_medias[n_colunas > 0] / n_colunas[n_colunas > 0]
 
-        # Remover a diagonal se estiver comparando a mesma rede
-        if rede_i == rede_j:
-            sub_limited = sub_limited.where(~np.eye(len(sub_limited), dtype=bool))
+    forma = (n_redes, n_redes)
+    return minimo.reshape(forma), media.reshape(forma), contagem.reshape(forma)
 
-        # Distância mínima e média
-        if not sub_limited.empty:
-            # mínimo entre unidades diferentes
-            matriz_agregada_min.loc[rede_i, rede_j] = sub_limited.min().min()
-            # média entre unidades diferentes
-            matriz_agregada_mean.loc[rede_i, rede_j] = sub_limited.mean().mean()
-        else:
-            matriz_agregada_min.loc[rede_i, rede_j] = np.nan
-            matriz_agregada_mean.loc[rede_i, rede_j] = np.nan
+if __name__ == "__main__":
+    # =========================
+    # Carregar dados
+    # =========================
+    df = pd.read_pickle(UNIDADES_FILE)
+    if MATRIZ_MODO == "esparsa" and DIST_MAX_ESPARSA < DIST_MAX_DEFAULT:
+        print(f"⚠️ Matriz esparsa guarda só até {DIST_MAX_ESPARSA} km (< {DIST_MAX_DEFAULT} km)")
+    matriz = carregar_matriz(MATRIZ_MODO)
 
+    # =========================
+    # Filtrar por estado se necessário
+    # =========================
+    # Exemplo: estado = "SP"
+    estado = ESTADO_DEFAULT
+    if estado:
+        df = df[df['estado_cdn'] == estado]
 
-# =========================
-# Salvar resultados
-# =========================
-matriz_agregada_min.to_pickle(os.path.join(EXPORT_DIR, "matriz_agregada_min.pkl"))
-matriz_agregada_mean.to_pickle(os.path.join(EXPORT_DIR, "matriz_agregada_mean.pkl"))
-print(f"✅ Matrizes agregadas salvas em {EXPORT_DIR}")
\ No newline at end of file
+    # =========================
+    # Agregar rede x rede (códigos inteiros + uma passada pelos pares)
+    # =========================
+    redes = sorted(df['rede'].unique())
+    codigos = pd.Categorical(df['rede'].to_numpy(), categories=redes).codes.astype(np.intp)
+    i, j, d = pares_da_matriz(matriz, df, DIST_MAX_DEFAULT)
+
+    minimo, media, contagem = agregar_redes(codigos, len(redes), i, j, d)
+    matriz_agregada_min = pd.DataFrame(minimo, index=redes, columns=redes, dtype=float)
+    matriz_agregada_mean = pd.DataFrame(media, index=redes, columns=redes, dtype=float)
+    matriz_agregada_count = pd.DataFrame(contagem, index=redes, columns=redes)
+
+    # =========================
+    # Salvar resultados
+    # =========================
+    matriz_agregada_min.to_pickle(os.path.join(EXPORT_DIR, "matriz_agregada_min.pkl"))
+    matriz_agregada_mean.to_pickle(os.path.join(EXPORT_DIR, "matriz_agregada_mean.pkl"))
+    matriz_agregada_count.to_pickle(os.path.join(EXPORT_DIR, "matriz_agregada_count.pkl"))
+    print(f"✅ Matrizes agregadas salvas em {EXPORT_DIR}")
@@ -1,25 +1,20 @@
-import pandas as pd
-import sqlite3
 import plotly.express as px
+import sys
 import os
 
-# Caminho do banco e pasta de export
-DB_PATH = "./unidades.db"
+# Adiciona o diretório raiz ao path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analysis.snapshot_unidades import carregar_unidades
+
+# Pasta de export
 EXPORT_DIR = "./exportados"
 if not os.path.exists(EXPORT_DIR):
     os.makedirs(EXPORT_DIR)
 
-# Conectar ao banco
-conn = sqlite3.connect(DB_PATH)
-df = pd.read_sql_query("""
-    SELECT id, rede, nome, endereco, latitude, longitude, estado_cdn, cidade_cdn
-    FROM unidades
-""", conn)
-conn.close()
-
-# Converter latitude e longitude para float
-df['latitude'] = df['latitude'].astype(float)
-df['longitude'] = df['longitude'].astype(float)
+# Snapshot colunar de unidades (coordenadas já em float)
+df = carregar_unidades(colunas=['id', 'rede', 'nome', 'endereco', 'latitude', 'longitude',
+                                'estado_cdn', 'cidade_cdn'])
 
 # Criar density mapbox (heatmap de densidade)
 fig = px.density_mapbox(
@@ -0,0 +1,194 @@
+# =========================
+# snapshot_unidades.py
+# =========================
+"""
+Snapshot colunar da tabela unidades para os scripts de análise.
+
+Na primeira leitura a tabela é lida do SQLite uma única vez e gravada em
+Feather (Arrow IPC, sem compressão) com rede/estado_cdn como categorias e
+latitude/longitude como float. As leituras seguintes mapeiam o arquivo em
+memória e só leem as colunas e linhas pedidas (filtros por estado e rede
+aplicados no Arrow, antes de virar DataFrame).
+
+O snapshot guarda nos metadados a impressão digital dos dados (colunas,
+linhas, ids e maior data_atualizacao de unidades); se ela mudou, ele é
+refeito.
+Sem pyarrow instalado, os mesmos filtros são feitos direto no SQL.
+"""
+import os
+import sys
+import sqlite3
+import time
+import pandas as pd
+
+DB_PATH = "./unidades.db"
+EXPORT_DIR = "./exportados"
+SNAPSHOT_FILE = os.path.join(EXPORT_DIR, "unidades_snapshot.feather")
+
+COLUNAS_SNAPSHOT = ['id', 'rede', 'nome', 'endereco', 'latitude', 'longitude',
+                    'bairro_cdn', 'cidade_cdn', 'estado_cdn', 'pais_cdn']
+COLUNAS_CATEGORICAS = ['rede', 'estado_cdn']
+CHAVE_IMPRESSAO = b"impressao_digital_db"
+
+
+# =========================
+# Impressão digital do banco
+# =========================
+def impressao_digital_db(db_path=DB_PATH):
+    """
+    Impressão digital dos dados de unidades: colunas da tabela, número de
+    linhas, maior id, soma dos ids e maior data_atualizacao. Checkpoint do
+    WAL, VACUUM ou escritas em outras tabelas não a mudam; inserções,
+    remoções, atualizações e colunas renomeadas em unidades sim.
+    """
+    if not os.path.exists(db_path):
+        return "-"
+    conn = sqlite3.connect(db_path)
+    try:
+        colunas = [row[1] for row in conn.execute("PRAGMA table_info(unidades)")]
+        if not colunas:
+            return "-"
+        ultima = "MAX(data_atualizacao)" if "data_atualizacao" in colunas else "NULL"
+        contagem, maior_id, soma_ids, atualizacao = conn.execute(
+            f"SELECT COUNT(*), MAX(id), TOTAL(id), {ultima} FROM unidades"
+        ).fetchone()
+    finally:
+        conn.close()
+    return f"{','.join(colunas)}|{contagem}|{maior_id}|{soma_ids:.0f}|{atualizacao}"
+
+
+# =========================
+# Leitura do SQLite
+# =========================
+def _tipar(df):
+    """Coordenadas em float ('' / texto inválido → NaN) e colunas categóricas."""
+    for coluna in ('latitude', 'longitude'):
+        if coluna in df.columns:
+            df[coluna] = pd.to_numeric(df[coluna], errors='coerce').astype(float)
+    for coluna in COLUNAS_CATEGORICAS:
+        if coluna in df.columns:
+            df[coluna] = df[coluna].astype('category')
+    return df
+
+
+def _ler_banco(db_path=DB_PATH, colunas=None, estados=None, redes=None, com_coordenadas=False):
+    """Lê unidades direto do SQLite, com projeção e filtros no próprio SQL."""
+    colunas = colunas or COLUNAS_SNAPSHOT
+    condicoes, parametros = [], []
+    if estados is not None:
+        condicoes.append(f"estado_cdn IN ({', '.join('?' * len(estados))})")
+        parametros.extend(estados)
+    if redes is not None:
+        condicoes.append(f"rede IN ({', '.join('?' * len(redes))})")
+        parametros.extend(redes)
+    if com_coordenadas:
+        condicoes.append("latitude IS NOT NULL AND latitude != '' "
+                         "AND longitude IS NOT NULL AND longitude != ''")
+    where = f"WHERE {' AND '.join(condicoes)}" if condicoes else ""
+
+    conn = sqlite3.connect(db_path)
+    try:
+        df = pd.read_sql_query(
+            f"SELECT {', '.join(colunas)} FROM unidades {where} ORDER BY id", conn, params=parametros
+        )
+    finally:
+        conn.close()
+    return _tipar(df)
+
+
+# =========================
+# Snapshot Feather
+# =========================
+def atualizar_snapshot(db_path=DB_PATH, snapshot_file=SNAPSHOT_FILE, forcar=False):
+    """
+    Refaz o snapshot se a impressão digital do banco mudou (ou se forcar=True).
+    Retorna True se o arquivo foi regravado.
+    """
+    import pyarrow as pa
+    import pyarrow.feather as feather
+
+    impressao = impressao_digital_db(db_path).encode()
+    if not forcar and os.path.exists(snapshot_file):
+        try:
+            with pa.memory_map(snapshot_file) as origem:
+                metadados = pa.ipc.open_file(origem).schema.metadata or {}
+            if metadados.get(CHAVE_IMPRESSAO) == impressao:
+                return False
+        except pa.ArrowInvalid:
+            pass  # arquivo corrompido/incompleto: refaz
+
+    df = _ler_banco(db_path)
+    tabela = pa.Table.from_pandas(df, preserve_index=False)
+    tabela = tabela.replace_schema_metadata({**(tabela.schema.metadata or {}), CHAVE_IMPRESSAO: impressao})
+
+    os.makedirs(os.path.dirname(snapshot_file) or ".", exist_ok=True)
+    temporario = snapshot_file + ".tmp"
+    feather.write_feather(tabela, temporario, compression='uncompressed')
+    os.replace(temporario, snapshot_file)
+    return True
+
+
+def carregar_unidades(colunas=None, estados=None, redes=None, com_coordenadas=False,
+                      db_path=DB_PATH, snapshot_file=SNAPSHOT_FILE):
+    """
+    DataFrame de unidades (ordem de id) a partir do snapshot.
+
+    - colunas: projeção (default: COLUNAS_SNAPSHOT);
+    - estados / redes: listas de valores de estado_cdn / rede a manter;
+    - com_coordenadas: descarta unidades sem latitude/longitude.
+
+    rede e estado_cdn vêm como category (só com as categorias presentes),
+    latitude/longitude como float.
+    """
+    colunas = list(colunas or COLUNAS_SNAPSHOT)
+    if isinstance(estados, str):
+        estados = [estados]
+    if isinstance(redes, str):
+        redes = [redes]
+
+    try:
+        import pyarrow.compute as pc
+        import pyarrow.dataset as ds
+    except ImportError:
+        return _ler_banco(db_path, colunas, estados, redes, com_coordenadas)
+
+    atualizar_snapshot(db_path, snapshot_file)
+
+    filtro = None
+    condicoes = []
+    if estados is not None:
+        condicoes.append(pc.field('estado_cdn').isin(list(estados)))
+    if redes is not None:
+        condicoes.append(pc.field('rede').isin(list(redes)))
+    if com_coordenadas:
+        condicoes.append(pc.field('latitude').is_valid() & pc.field('longitude').is_valid()
+                         & ~pc.field('latitude').is_nan() & ~pc.field('longitude').is_nan())
+    for condicao in condicoes:
+        filtro = condicao if filtro is None else filtro & condicao
+
+    tabela = ds.dataset(snapshot_file, format='feather').to_table(columns=colunas, filter=filtro)
+    df = tabela.to_pandas()
+    for coluna in COLUNAS_CATEGORICAS:
+        if coluna in df.columns:
+            df[coluna] = df[coluna].cat.remove_unused_categories()
+    return df
+
+
+# =========================
+# Execução
+# =========================
+if __name__ == "__main__":
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        print("❌ pyarrow não instalado: os scripts leem direto do banco (pip install pyarrow)")
+        sys.exit(1)
+
+    inicio = time.perf_counter()
+    refeito = atualizar_snapshot(forcar="--forcar" in sys.argv)
+    print(f"{'✅ Snapshot gravado' if refeito else '✅ Snapshot já em dia'}: {SNAPSHOT_FILE} "
+          f"({time.perf_counter() - inicio:.3f}s)")
+
+    inicio = time.perf_counter()
+    df = carregar_unidades()
+    print(f"📊 {len(df)} unidades carregadas em {(time.perf_counter() - inicio) * 1000:.1f} ms")
@@ -3,4 +3,6 @@
 # =========================
 EXPORT_DIR = "./exportados"
 DIST_MAX_DEFAULT = 20   # km
-ESTADO_DEFAULT = 'São Paulo'   # None = todos os estados - ex: 'Rio de Janeiro' (aquilo que está no banco)
\ No newline at end of file
+ESTADO_DEFAULT = 'São Paulo'   # None = todos os estados - ex: 'Rio de Janeiro' (aquilo que está no banco)
+MATRIZ_MODO = "densa"   # "densa" = matriz_completa.pkl (n×n) | "esparsa" = matriz_esparsa.npz (só pares ≤ DIST_MAX_ESPARSA)
+DIST_MAX_ESPARSA = 50   # km - deve cobrir DIST_MAX_DEFAULT e o maior BREAKPOINT usado nas faixas
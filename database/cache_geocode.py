@@ -0,0 +1,153 @@
+# =========================
+# cache_geocode.py
+# =========================
+"""
+Cache persistente de geocodificação, compartilhado por todos os geocoders.
+
+Cada resposta de provedor fica em uma tabela SQLite (arquivo próprio,
+cache_geocode.db na raiz), com chave = provedor + endereço normalizado
+(sem acentos, caixa e pontuação) ou provedor + lat/lon arredondados.
+
+- resultados negativos (provedor respondeu "nada encontrado") também são
+  guardados, com validade menor; erros de rede/HTTP nunca são guardados;
+- cada entrada expira após o TTL do seu tipo;
+- acima de MAX_ENTRADAS, as menos usadas recentemente (LRU) são removidas.
+
+Uso típico:
+    cache = obter_cache()
+    chave = chave_endereco("geocodio", endereco)
+    encontrado, dados = cache.obter(chave)
+    if not encontrado:
+        dados = consultar_api(endereco)   # None = sem resultado
+        cache.guardar(chave, dados)
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from .db import normalizar_nome
+
+CACHE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cache_geocode.db')
+TTL_DIAS = 180              # validade de um resultado encontrado
+TTL_NEGATIVO_DIAS = 30      # validade de um "nada encontrado"
+MAX_ENTRADAS = 200_000
+CASAS_COORD = 5             # lat/lon arredondados (5 casas ≈ 1 m)
+_SEGUNDOS_DIA = 86400
+
+
+def chave_endereco(provedor, endereco):
+    """Chave de geocodificação direta: provedor + endereço normalizado"""
+    return f"{provedor}|q|{normalizar_nome(endereco)}"
+
+
+def chave_coordenadas(provedor, lat, lon, casas=CASAS_COORD):
+    """Chave de geocodificação reversa: provedor + lat/lon arredondados"""
+    return f"{provedor}|r|{round(float(lat), casas):.{casas}f},{round(float(lon), casas):.{casas}f}"
+
+
+class CacheGeocode:
+    def __init__(self, caminho=CACHE_PATH, ttl_dias=TTL_DIAS, ttl_negativo_dias=TTL_NEGATIVO_DIAS,
+                 max_entradas=MAX_ENTRADAS):
+        self.caminho = caminho
+        self.ttl = ttl_dias * _SEGUNDOS_DIA
+        self.ttl_negativo = ttl_negativo_dias * _SEGUNDOS_DIA
+        self.max_entradas = max_entradas
+        self.acertos = 0
+        self.faltas = 0
+        self._insercoes = 0
+        self._trava = threading.Lock()
+
+        # Uma conexão para o processo, usada sob trava (geocoders com threads/asyncio)
+        self._conn = sqlite3.connect(caminho, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+        self._conn.execute("PRAGMA busy_timeout = 30000")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS geocode_cache ("
+            "chave TEXT PRIMARY KEY, provedor TEXT NOT NULL, valor TEXT, "
+            "criado_em REAL NOT NULL, expira_em REAL NOT NULL, ultimo_acesso REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_geocode_cache_ultimo_acesso "
+                           "ON geocode_cache (ultimo_acesso)")
+
+    def obter(self, chave):
+        """
+        (encontrado, valor). encontrado=False → consultar o provedor;
+        encontrado=True com valor None → resultado negativo em cache.
+        """
+        agora = time.time()
+        with self._trava:
+            linha = self._conn.execute(
+                "SELECT valor, expira_em FROM geocode_cache WHERE chave = ?", (chave,)
+            ).fetchone()
+            if linha is None or linha[1] <= agora:
+                self.faltas += 1
+                return False, None
+            self._conn.execute("UPDATE geocode_cache SET ultimo_acesso = ? WHERE chave = ?", (agora, chave))
+            self.acertos += 1
+        return True, None if linha[0] is None else json.loads(linha[0])
+
+    def guardar(self, chave, valor):
+        """Guarda a resposta do provedor (None = nada encontrado, com TTL negativo)"""
+        agora = time.time()
+        expira = agora + (self.ttl_negativo if valor is None else self.ttl)
+        serializado = None if valor is None else json.dumps(valor, ensure_ascii=False)
+        with self._trava:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO geocode_cache (chave, provedor, valor, criado_em, expira_em, ultimo_acesso) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (chave, chave.split("|", 1)[0], serializado, agora, expira, agora)
+            )
+            self._insercoes += 1
+            # Despejo LRU verificado a cada 1000 inserções (COUNT é barato, mas não de graça)
+            if self._insercoes % 1000 == 0:
+                self._despejar()
+
+    def consultar(self, chave, funcao):
+        """
+        Valor em cache ou o retorno de funcao() (guardado, inclusive None).
+        Exceções de funcao() (erro de rede/HTTP) passam adiante sem ir para o cache.
+        """
+        encontrado, valor = self.obter(chave)
+        if encontrado:
+            return valor
+        valor = funcao()
+        self.guardar(chave, valor)
+        return valor
+
+    def _despejar(self):
+        self._conn.execute("DELETE FROM geocode_cache WHERE expira_em <= ?", (time.time(),))
+        excesso = self._conn.execute("SELECT COUNT(*) FROM geocode_cache").fetchone()[0] - self.max_entradas
+        if excesso > 0:
+            self._conn.execute(
+                "DELETE FROM geocode_cache WHERE chave IN "
+                "(SELECT chave FROM geocode_cache ORDER BY ultimo_acesso LIMIT ?)", (excesso,)
+            )
+
+    def limpar(self):
+        """Remove expirados e aplica o limite de entradas agora"""
+        with self._trava:
+            self._despejar()
+
+    def resumo(self):
+        total = self.acertos + self.faltas
+        taxa = f"{100 * self.acertos / total:.1f}%" if total else "-"
+        return f"💾 Cache de geocodificação: {self.acertos} acertos, {self.faltas} faltas ({taxa})"
+
+    def fechar(self):
+        with self._trava:
+            self._conn.close()
+
+
+_caches = {}
+_trava_caches = threading.Lock()
+
+
+def obter_cache(caminho=CACHE_PATH):
+    """Uma instância de CacheGeocode por arquivo no processo inteiro"""
+    with _trava_caches:
+        if caminho not in _caches:
+            _caches[caminho] = CacheGeocode(caminho)
+        return _caches[caminho]
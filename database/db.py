@@ -1,20 +1,274 @@
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, event, text, select, MetaData, Column, make_url
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.exc import IntegrityError
-from .models import Base, Unidade
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.types import NullType
+from .models import Base, Unidade, ParProximo
+from .migracoes import migrar, VERSOES_AUTOMATICAS
+from concurrent.futures import Future
+import atexit
+import functools
+import hashlib
 import json
+import math
+import os
+import queue
+import re
+import threading
+import unicodedata
 from datetime import datetime
 
+# PRAGMAs aplicados a toda conexão SQLite aberta pelos engines compartilhados:
+# WAL deixa leitores e um escritor trabalharem ao mesmo tempo, busy_timeout faz
+# quem encontra o banco ocupado esperar em vez de falhar com "database is locked"
+PRAGMAS_SQLITE = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 30000,      # ms
+    "mmap_size": 268435456,     # 256 MB
+    "cache_size": -65536,       # 64 MB (valor negativo = KiB)
+    "temp_store": "MEMORY",
+}
+
+# Raio máximo (km) dos pares guardados na tabela pares_proximos
+RAIO_MAX_PARES_KM = 20.0
+
+# Duplicatas (limpar_duplicatas): mesmo nome exato ou mesma rede + nome
+# normalizado a até DIST_DUPLICATA_M metros
+MODOS_DUPLICATA = ("nome", "proximidade")
+DIST_DUPLICATA_M = 50.0
+R_TERRA_M = 6371000.0
+
+# Exportação JSON (gerar_json): mesmos campos de Unidade.to_dict
+FORMATOS_JSON = ("json", "ndjson")
+COLUNAS_JSON = ('id', 'rede', 'nome', 'endereco', 'cidade', 'estado', 'cep', 'telefone', 'latitude', 'longitude',
+                'horarios', 'servicos', 'link_matricula', 'data_criacao', 'data_atualizacao',
+                'bairro_cdn', 'cidade_cdn', 'estado_cdn', 'pais_cdn')
+
+# O que fazer quando o nome da unidade já existe (upsert_unidades)
+CONFLITOS_UPSERT = ("ignorar", "atualizar")
+
+# Colunas que não vêm do site da rede: ficam fora do hash de conteúdo e
+# nunca são sobrescritas por sincronizar_unidades
+CAMPOS_FORA_DO_HASH = ('id', 'latitude', 'longitude', 'bairro_cdn', 'cidade_cdn', 'estado_cdn', 'pais_cdn',
+                       'data_criacao', 'data_atualizacao', 'hash_conteudo')
+
+# Se um destes campos muda na raspagem, a unidade mudou de lugar: coordenadas
+# e colunas *_cdn são zeradas para serem geocodificadas de novo
+CAMPOS_LOCALIZACAO = ('endereco', 'cep', 'cidade')
+CAMPOS_CDN = ('bairro_cdn', 'cidade_cdn', 'estado_cdn', 'pais_cdn')
+CAMPOS_GEOCODIFICADOS = ('latitude', 'longitude', *CAMPOS_CDN)
+
+
+def calcular_hash_conteudo(unidade_data):
+    """SHA-256 do conteúdo raspado da unidade (chaves ordenadas, sem CAMPOS_FORA_DO_HASH)"""
+    conteudo = {k: v for k, v in unidade_data.items() if k not in CAMPOS_FORA_DO_HASH}
+    serializado = json.dumps(conteudo, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(serializado.encode('utf-8')).hexdigest()
+
+
+# ============================================================
+# 🔌 Engines compartilhados e fila de escrita
+# ============================================================
+_engines = {}
+_filas_escrita = {}
+_urls_preparadas = set()
+_travas_preparacao = {}
+_trava_engines = threading.Lock()
+
+# Colunas de cada tabela por URL ({(db_url, tabela): tuple}), compartilhadas por
+# todas as instâncias de Database do processo; só são relidas quando uma
+# coluna é adicionada por adicionar_coluna/garantir_colunas ou quando
+# migracoes.migrar muda o schema (invalidar_schemas)
+_schemas = {}
+
+
+def invalidar_schemas(db_path):
+    """Esquece as colunas em cache de todas as URLs que apontam para o arquivo db_path"""
+    alvo = os.path.realpath(db_path)
+    for chave in list(_schemas):
+        banco = make_url(chave[0]).database
+        if banco not in (None, "", ":memory:") and os.path.realpath(banco) == alvo:
+            _schemas.pop(chave, None)
+
+
+def _configurar_conexao_sqlite(conexao_dbapi, _registro):
+    cursor = conexao_dbapi.cursor()
+    for nome, valor in PRAGMAS_SQLITE.items():
+        cursor.execute(f"PRAGMA {nome} = {valor}")
+    cursor.close()
+
+
+def obter_engine(db_url="sqlite:///unidades.db"):
+    """Um engine por URL no processo inteiro, com os PRAGMAS_SQLITE em cada conexão"""
+    with _trava_engines:
+        engine = _engines.get(db_url)
+        if engine is None:
+            engine = create_engine(db_url)
+            if engine.dialect.name == "sqlite":
+                event.listen(engine, "connect", _configurar_conexao_sqlite)
+            _engines[db_url] = engine
+        return engine
+
+
+class FilaEscrita:
+    """
+    Escritor único de um engine: as escritas enviadas por qualquer thread
+    entram em uma fila e são executadas em ordem por uma thread dedicada.
+    Assim as threads do processo nunca disputam o lock de escrita do SQLite
+    entre si (entre processos, quem resolve é o WAL + busy_timeout).
+    A thread é daemon, mas encerrar() roda no atexit: o que ainda estiver na
+    fila é gravado antes de o interpretador sair.
+    """
+
+    def __init__(self, nome="escritor-sqlite"):
+        self._fila = queue.Queue()
+        self._encerrada = False
+        self._thread = threading.Thread(target=self._processar, name=nome, daemon=True)
+        self._thread.start()
+
+    def _processar(self):
+        while True:
+            item = self._fila.get()
+            if item is None:
+                self._fila.task_done()
+                return
+            funcao, args, kwargs, futuro = item
+            self._executar_item(funcao, args, kwargs, futuro)
+            self._fila.task_done()
+
+    @staticmethod
+    def _executar_item(funcao, args, kwargs, futuro):
+        if futuro.set_running_or_notify_cancel():
+            try:
+                futuro.set_result(funcao(*args, **kwargs))
+            except BaseException as e:
+                futuro.set_exception(e)
+
+    def enviar(self, funcao, *args, **kwargs):
+        """Enfileira a escrita e retorna um Future (não bloqueia)"""
+        futuro = Future()
+        if self._encerrada:
+            # Depois de encerrar() não há mais thread: executa aqui mesmo
+            self._executar_item(funcao, args, kwargs, futuro)
+        else:
+            self._fila.put((funcao, args, kwargs, futuro))
+        return futuro
+
+    def executar(self, funcao, *args, **kwargs):
+        """Enfileira e espera o resultado; chamadas feitas pela própria thread rodam direto"""
+        if threading.current_thread() is self._thread:
+            return funcao(*args, **kwargs)
+        return self.enviar(funcao, *args, **kwargs).result()
+
+    def aguardar(self):
+        """Bloqueia até todas as escritas enfileiradas terminarem"""
+        self._fila.join()
+
+    def encerrar(self):
+        """Grava o que ainda está na fila e para a thread"""
+        if self._encerrada:
+            return
+        self._encerrada = True
+        self._fila.put(None)
+        self._thread.join()
+
+
+@atexit.register
+def _encerrar_filas():
+    """Escritas enviadas com enviar() não se perdem quando o processo termina"""
+    with _trava_engines:
+        filas = list(_filas_escrita.values())
+    for fila in filas:
+        fila.encerrar()
+
+
+def obter_fila_escrita(db_url="sqlite:///unidades.db"):
+    """Uma FilaEscrita por URL no processo inteiro"""
+    with _trava_engines:
+        fila = _filas_escrita.get(db_url)
+        if fila is None:
+            fila = _filas_escrita[db_url] = FilaEscrita()
+        return fila
+
+
+def escrita(metodo):
+    """Faz o método de Database rodar na fila de escrita do seu banco"""
+    @functools.wraps(metodo)
+    def envolvido(self, *args, **kwargs):
+        if self.fila_escrita is None:
+            return metodo(self, *args, **kwargs)
+        return self.fila_escrita.executar(metodo, self, *args, **kwargs)
+    return envolvido
+
+
+def _serializador_json():
+    """orjson se estiver instalado (bem mais rápido), senão json da biblioteca padrão; ambos → bytes"""
+    try:
+        import orjson
+        return lambda dados: orjson.dumps(dados, default=str)
+    except ImportError:
+        return lambda dados: json.dumps(dados, ensure_ascii=False, default=str).encode('utf-8')
+
+
+def normalizar_nome(nome):
+    """Nome sem acentos, caixa e pontuação, com espaços simples"""
+    sem_acento = unicodedata.normalize('NFKD', nome or '').encode('ascii', 'ignore').decode('ascii')
+    return ' '.join(re.sub(r'[^a-z0-9]+', ' ', sem_acento.lower()).split())
+
+
+def _distancia_m(lat1, lon1, lat2, lon2):
+    """Haversine em metros"""
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    a = math.sin((p2 - p1) / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2
+    return 2 * R_TERRA_M * math.asin(math.sqrt(a))
+
+
 class Database:
     def __init__(self, db_url="sqlite:///unidades.db"):
-        self.engine = create_engine(db_url)
+        self.db_url = db_url
+        self.engine = obter_engine(db_url)
+        # SQLite em memória é um banco por conexão: sem thread de escrita
+        em_memoria = self.engine.url.database in (None, "", ":memory:")
+        self.fila_escrita = None if em_memoria else obter_fila_escrita(db_url)
         self.Session = sessionmaker(bind=self.engine)
+        self._cache_tabela = None
         self._create_tables()
     
     def _create_tables(self):
-        """Cria as tabelas se não existirem"""
-        Base.metadata.create_all(self.engine)
-    
+        """
+        Cria as tabelas se não existirem e aplica as migrações automáticas
+        (uma vez por URL em cada processo). Outras instâncias da mesma URL
+        esperam a preparação terminar; se ela falhar, a próxima tenta de novo.
+        """
+        with _trava_engines:
+            if self.db_url in _urls_preparadas:
+                return
+            trava = _travas_preparacao.setdefault(self.db_url, threading.Lock())
+        with trava:
+            if self.db_url in _urls_preparadas:
+                return
+            Base.metadata.create_all(self.engine)
+            self._migrar_schema()
+            self.adicionar_coluna("unidades", "hash_conteudo", "VARCHAR(64)")
+            with _trava_engines:
+                _urls_preparadas.add(self.db_url)
+
+    def _migrar_schema(self):
+        """
+        Migrações automáticas (VERSOES_AUTOMATICAS de migracoes.py, ex.:
+        latitude/longitude de TEXT para REAL) sob BEGIN IMMEDIATE, registradas
+        em migracoes_schema. Bancos em memória nascem com o schema do modelo.
+        O índice parcial do modelo (unidades sem coordenadas) é criado se faltar.
+        """
+        caminho = self.engine.url.database
+        if self.engine.dialect.name == "sqlite" and caminho not in (None, "", ":memory:"):
+            migrar(caminho, versoes=VERSOES_AUTOMATICAS, silencioso=True)
+
+        for indice in Unidade.__table__.indexes:
+            if indice.name == 'ix_unidades_sem_coordenadas':
+                indice.create(self.engine, checkfirst=True)
+
     def buscar_nomes_existentes(self):
         """Retorna um set com todos os nomes de unidades já cadastradas"""
         session = self.Session()
@@ -24,6 +278,7 @@ class Database:
         finally:
             session.close()
     
+    @escrita
     def inserir_unidade(self, unidade_data):
         """Insere uma única unidade no banco"""
         session = self.Session()
@@ -38,6 +293,7 @@ class Database:
         finally:
             session.close()
     
+    @escrita
     def inserir_multiplas_unidades(self, unidades_data, batch_size=100):
         """
         Insere múltiplas unidades de uma vez usando inserção em blocos
@@ -95,97 +351,263 @@ class Database:
         
         return total_inseridas
     
-    def inserir_multiplas_unidades_dinamico(self, unidades_data, batch_size=100):
+    def inserir_multiplas_unidades_dinamico(self, unidades_data, batch_size=100, conflito="ignorar"):
         """
         Insere múltiplas unidades de forma dinâmica e segura.
         Detecta automaticamente as colunas da tabela e filtra dados inválidos.
+        Usa o caminho em massa de upsert_unidades; conflito="ignorar" mantém a
+        unidade já cadastrada com o mesmo nome, conflito="atualizar" sobrescreve.
+        Retorna o número de unidades gravadas (inseridas + atualizadas).
         """
         if not unidades_data:
             return 0
-        
-        session = self.Session()
-        
-        try:
-            cursor = session.execute(text("PRAGMA table_info(unidades)"))
-            colunas_existentes = [row[1] for row in cursor.fetchall()]
-            
-            print(f"🔍 Colunas detectadas na tabela: {len(colunas_existentes)}")
-            print(f"   {', '.join(colunas_existentes)}")
-            
-            campos_ignorados_totais = set()
-            total_inseridas = 0
-            
-            for i in range(0, len(unidades_data), batch_size):
-                batch = unidades_data[i:i + batch_size]
-                print(f"\n📦 Processando bloco {i//batch_size + 1}/{(len(unidades_data) + batch_size - 1)//batch_size} ({len(batch)} unidades)")
-                
+
+        colunas_existentes = self._colunas_unidades()
+        print(f"🔍 Colunas detectadas na tabela: {len(colunas_existentes)}")
+        print(f"   {', '.join(colunas_existentes)}")
+
+        resultado = self.upsert_unidades(unidades_data, conflito=conflito, batch_size=batch_size)
+        print(f"\n📊 Inseridas: {resultado['inseridas']} | Atualizadas: {resultado['atualizadas']} "
+              f"| Ignoradas: {resultado['ignoradas']}")
+
+        if resultado['campos_ignorados']:
+            print(f"\n⚠️ CAMPOS IGNORADOS (não existem na tabela):")
+            for campo in sorted(resultado['campos_ignorados']):
+                print(f"   - {campo}")
+            print(f"\n💡 Dica: Considere adicionar esses campos à tabela se forem importantes")
+
+        return resultado['inseridas'] + resultado['atualizadas']
+
+    def _colunas_unidades(self):
+        """Colunas da tabela unidades (do cache de schema)"""
+        return self.obter_colunas_tabela("unidades")
+
+    def _tabela_unidades(self):
+        """
+        Tabela Core de unidades para o upsert: as colunas do modelo (com tipos e
+        defaults) mais as colunas que só existem no banco.
+        """
+        colunas = tuple(self._colunas_unidades())
+        if self._cache_tabela is None or self._cache_tabela[0] != colunas:
+            tabela = Unidade.__table__.to_metadata(MetaData())
+            for coluna in colunas:
+                if coluna not in tabela.c:
+                    tabela.append_column(Column(coluna, NullType()))
+            self._cache_tabela = (colunas, tabela)
+        return self._cache_tabela[1]
+
+    @escrita
+    def upsert_unidades(self, unidades_data, conflito="ignorar", batch_size=500):
+        """
+        Grava unidades em massa com INSERT ... ON CONFLICT(nome) via executemany.
+        - conflito="ignorar"  → DO NOTHING (a unidade existente fica como está)
+        - conflito="atualizar" → DO UPDATE das colunas enviadas
+        Cada bloco é uma transação; as linhas de um bloco são agrupadas pelo
+        conjunto de colunas (um executemany por grupo). Se ainda assim o bloco
+        falhar (ex.: NOT NULL), ele é refeito linha a linha na mesma transação,
+        descartando só as linhas inválidas; se nem isso der certo (ex.: banco
+        travado), o bloco inteiro conta como ignoradas e os próximos seguem.
+        Retorna {'inseridas', 'atualizadas', 'ignoradas', 'campos_ignorados'}.
+        """
+        if conflito not in CONFLITOS_UPSERT:
+            raise ValueError(f"conflito deve ser um de {CONFLITOS_UPSERT}: {conflito!r}")
+
+        tabela = self._tabela_unidades()
+        resultado = {'inseridas': 0, 'atualizadas': 0, 'ignoradas': 0, 'campos_ignorados': set()}
+        linhas = self._filtrar_unidades(unidades_data, resultado)
+
+        n_blocos = (len(linhas) + batch_size - 1) // batch_size
+        for b, inicio in enumerate(range(0, len(linhas), batch_size), 1):
+            bloco = linhas[inicio:inicio + batch_size]
+            try:
+                with self.engine.begin() as conn:
+                    tipos = self._classificar_upsert(conn, bloco, conflito)
+                    self._executar_upsert(conn, tabela, bloco, conflito)
+                for tipo in tipos:
+                    resultado[tipo] += 1
+                print(f"   ✅ Bloco {b}/{n_blocos} gravado ({len(bloco)} unidades)")
+
+            except Exception as e:
+                print(f"   ❌ Erro no bloco {b}/{n_blocos}: {getattr(e, 'orig', e)}")
+                contagem = dict.fromkeys(('inseridas', 'atualizadas', 'ignoradas'), 0)
                 try:
-                    unidades_batch = []
-                    
-                    for unidade_data in batch:
-                        dados_filtrados = {k: v for k, v in unidade_data.items() if k in colunas_existentes}
-                        campos_ignorados = set(unidade_data.keys()) - set(dados_filtrados.keys())
-                        campos_ignorados_totais.update(campos_ignorados)
-                        
-                        if not dados_filtrados.get('nome'):
-                            print(f"   ⚠️ Unidade sem nome ignorada")
-                            continue
-                        
-                        unidade = Unidade(**dados_filtrados)
-                        unidades_batch.append(unidade)
-                    
-                    if unidades_batch:
-                        session.add_all(unidades_batch)
-                        session.commit()
-                        total_inseridas += len(unidades_batch)
-                        print(f"   ✅ Bloco {i//batch_size + 1} inserido com sucesso ({len(unidades_batch)} unidades)")
-                    else:
-                        print(f"   ⚠️ Bloco {i//batch_size + 1} sem unidades válidas")
-                        
-                except IntegrityError as e:
-                    session.rollback()
-                    print(f"   ❌ Erro no bloco {i//batch_size + 1}: {e}")
-                    for unidade_data in batch:
+                    with self.engine.begin() as conn:
+                        tipos = self._classificar_upsert(conn, bloco, conflito)
+                        for dados, tipo in zip(bloco, tipos):
+                            try:
+                                conn.execute(self._comando_upsert(tabela, tuple(sorted(dados)), conflito), dados)
+                                contagem[tipo] += 1
+                            except IntegrityError as e2:
+                                contagem['ignoradas'] += 1
+                                print(f"      ❌ Falha na unidade {dados.get('nome', 'N/A')}: {e2.orig}")
+                except Exception as e2:
+                    # Nem linha a linha (ex.: banco travado): o bloco inteiro fica de fora
+                    print(f"   ❌ Bloco {b}/{n_blocos} descartado: {getattr(e2, 'orig', e2)}")
+                    contagem = {'inseridas': 0, 'atualizadas': 0, 'ignoradas': len(bloco)}
+                for tipo, n in contagem.items():
+                    resultado[tipo] += n
+
+        return resultado
+
+    def _filtrar_unidades(self, unidades_data, resultado):
+        """
+        Mantém só as colunas que existem na tabela (sem id e timestamps, que
+        são do banco) e descarta as linhas sem nome ou com rede/endereco
+        nulos (endereço vazio é aceito, como antes).
+        """
+        colunas = set(self._colunas_unidades()) - {'id', 'data_criacao', 'data_atualizacao'}
+        obrigatorias = [c.name for c in Unidade.__table__.columns
+                        if not c.nullable and c.default is None and not c.primary_key]
+        linhas = []
+        for unidade_data in unidades_data:
+            dados = {k: v for k, v in unidade_data.items() if k in colunas}
+            resultado['campos_ignorados'].update(set(unidade_data) - colunas - {'id', 'data_criacao', 'data_atualizacao'})
+            faltando = [c for c in obrigatorias
+                        if dados.get(c) is None or (c == 'nome' and not dados[c])]
+            if faltando:
+                print(f"   ⚠️ Unidade {unidade_data.get('nome', 'N/A')} ignorada (sem {', '.join(faltando)})")
+                resultado['ignoradas'] += 1
+                continue
+            linhas.append(dados)
+        return linhas
+
+    def _executar_upsert(self, conn, tabela, linhas, conflito):
+        """Um executemany por conjunto de colunas presente nas linhas"""
+        grupos = {}
+        for dados in linhas:
+            grupos.setdefault(tuple(sorted(dados)), []).append(dados)
+        for chaves, grupo in grupos.items():
+            conn.execute(self._comando_upsert(tabela, chaves, conflito), grupo)
+
+    def _classificar_upsert(self, conn, bloco, conflito):
+        """Para cada linha do bloco: 'inseridas', 'atualizadas' ou 'ignoradas' (nome já existe)"""
+        nomes = list({dados['nome'] for dados in bloco})
+        existentes = set()
+        for inicio in range(0, len(nomes), 500):
+            existentes.update(conn.execute(
+                select(Unidade.__table__.c.nome).where(Unidade.__table__.c.nome.in_(nomes[inicio:inicio + 500]))
+            ).scalars())
+
+        tipos = []
+        for dados in bloco:
+            if dados['nome'] not in existentes:
+                tipos.append('inseridas')
+                existentes.add(dados['nome'])
+            else:
+                tipos.append('atualizadas' if conflito == "atualizar" else 'ignoradas')
+        return tipos
+
+    def _comando_upsert(self, tabela, chaves, conflito):
+        """INSERT ... ON CONFLICT(nome) DO NOTHING / DO UPDATE para um conjunto de colunas"""
+        comando = sqlite_insert(tabela)
+        if conflito == "ignorar":
+            return comando.on_conflict_do_nothing(index_elements=['nome'])
+        atualizar = {c: comando.excluded[c] for c in chaves if c not in ('nome', 'data_criacao')}
+        # ON CONFLICT DO UPDATE não aplica o onupdate da coluna
+        atualizar['data_atualizacao'] = comando.excluded.data_atualizacao
+        return comando.on_conflict_do_update(index_elements=['nome'], set_=atualizar)
+
+    @escrita
+    def sincronizar_unidades(self, unidades_data):
+        """
+        Recebe o resultado completo de uma raspagem e grava só o que mudou.
+        O hash do conteúdo raspado de cada unidade é comparado (hash join em
+        memória pelo nome) com o hash_conteudo guardado no banco:
+          - nome novo → INSERT da unidade completa;
+          - hash diferente → UPDATE só das colunas raspadas (coordenadas e
+            colunas *_cdn geocodificadas ficam como estão);
+          - hash igual → nada é escrito.
+        Se endereco, cep ou cidade mudou (valor raspado não vazio e diferente
+        do banco), coordenadas e colunas *_cdn viram NULL e os pares da
+        unidade saem de pares_proximos, para que ela seja geocodificada de novo.
+        Todas as escritas vão em uma única transação.
+        Retorna {'inseridas', 'atualizadas', 'inalteradas', 'ignoradas',
+        'campos_ignorados', 'novas'} (novas = nomes inseridos).
+        """
+        tabela = self._tabela_unidades()
+        resultado = {'inseridas': 0, 'atualizadas': 0, 'inalteradas': 0, 'ignoradas': 0,
+                     'campos_ignorados': set(), 'novas': []}
+
+        # Uma linha por nome (a primeira vence, como no insert)
+        por_nome = {}
+        for dados in self._filtrar_unidades(unidades_data, resultado):
+            if dados['nome'] in por_nome:
+                resultado['ignoradas'] += 1
+                continue
+            dados['hash_conteudo'] = calcular_hash_conteudo(dados)
+            por_nome[dados['nome']] = dados
+        if not por_nome:
+            return resultado
+
+        with self.engine.begin() as conn:
+            atuais = {linha.nome: linha for linha in conn.execute(
+                select(tabela.c.nome, tabela.c.id, tabela.c.hash_conteudo,
+                       *(tabela.c[c] for c in CAMPOS_LOCALIZACAO if c in tabela.c))
+            )}
+            novas, alteradas, movidas = [], [], {}
+            for nome, dados in por_nome.items():
+                if nome not in atuais:
+                    novas.append(dados)
+                elif atuais[nome].hash_conteudo != dados['hash_conteudo']:
+                    alterada = {k: v for k, v in dados.items()
+                                if k not in CAMPOS_FORA_DO_HASH or k == 'hash_conteudo'}
+                    if self._mudou_localizacao(atuais[nome], dados):
+                        alterada.update({c: None for c in CAMPOS_GEOCODIFICADOS if c in tabela.c})
+                        movidas[nome] = atuais[nome].id
+                    alteradas.append(alterada)
+                else:
+                    resultado['inalteradas'] += 1
+
+            try:
+                with conn.begin_nested():
+                    self._executar_upsert(conn, tabela, novas, "ignorar")
+                    self._executar_upsert(conn, tabela, alteradas, "atualizar")
+                resultado['inseridas'] += len(novas)
+                resultado['atualizadas'] += len(alteradas)
+                resultado['novas'] = [dados['nome'] for dados in novas]
+            except IntegrityError as e:
+                # Refaz linha a linha na mesma transação, descartando só as inválidas
+                print(f"   ❌ Erro na sincronização em bloco: {e.orig}")
+                for tipo, conflito, grupo in (('inseridas', "ignorar", novas), ('atualizadas', "atualizar", alteradas)):
+                    for dados in grupo:
                         try:
-                            dados_filtrados = {k: v for k, v in unidade_data.items() if k in colunas_existentes}
-                            if dados_filtrados.get('nome'):
-                                unidade = Unidade(**dados_filtrados)
-                                session.add(unidade)
-                                session.commit()
-                                total_inseridas += 1
+                            conn.execute(self._comando_upsert(tabela, tuple(sorted(dados)), conflito), dados)
+                            resultado[tipo] += 1
+                            if tipo == 'inseridas':
+                                resultado['novas'].append(dados['nome'])
                         except IntegrityError as e2:
-                            session.rollback()
-                            print(f"      ❌ Falha na unidade {unidade_data.get('nome', 'N/A')}: {e2}")
-                        except Exception as e2:
-                            session.rollback()
-                            print(f"      ❌ Erro inesperado na unidade {unidade_data.get('nome', 'N/A')}: {e2}")
-                
-                except Exception as e:
-                    session.rollback()
-                    print(f"   ❌ Erro geral no bloco {i//batch_size + 1}: {e}")
-                    for unidade_data in batch:
-                        try:
-                            dados_filtrados = {k: v for k, v in unidade_data.items() if k in colunas_existentes}
-                            if dados_filtrados.get('nome'):
-                                unidade = Unidade(**dados_filtrados)
-                                session.add(unidade)
-                                session.commit()
-                                total_inseridas += 1
-                        except Exception as e2:
-                            session.rollback()
-                            print(f"      ❌ Falha na unidade {unidade_data.get('nome', 'N/A')}: {e2}")
-            
-            if campos_ignorados_totais:
-                print(f"\n⚠️ CAMPOS IGNORADOS (não existem na tabela):")
-                for campo in sorted(campos_ignorados_totais):
-                    print(f"   - {campo}")
-                print(f"\n💡 Dica: Considere adicionar esses campos à tabela se forem importantes")
-            
-            return total_inseridas
-            
-        finally:
-            session.close()
-    
+                            resultado['ignoradas'] += 1
+                            movidas.pop(dados['nome'], None)
+                            print(f"      ❌ Falha na unidade {dados.get('nome', 'N/A')}: {e2.orig}")
+
+            # Unidades que mudaram de endereço perdem os pares até serem geocodificadas
+            ids_movidas = list(movidas.values())
+            pares = ParProximo.__table__
+            for inicio in range(0, len(ids_movidas), 500):
+                bloco = ids_movidas[inicio:inicio + 500]
+                conn.execute(pares.delete().where(pares.c.id_1.in_(bloco) | pares.c.id_2.in_(bloco)))
+            if movidas:
+                print(f"   📍 {len(movidas)} unidades mudaram de endereço (coordenadas zeradas)")
+
+        # Unidades novas que já vieram com coordenadas entram em pares_proximos
+        com_coordenadas = [dados['nome'] for dados in novas
+                           if dados['nome'] in resultado['novas']
+                           and dados.get('latitude') not in (None, '') and dados.get('longitude') not in (None, '')]
+        if com_coordenadas:
+            with self.engine.connect() as conn:
+                ids = conn.execute(select(tabela.c.id).where(tabela.c.nome.in_(com_coordenadas))).scalars().all()
+            self.atualizar_pares_proximos(ids)
+
+        return resultado
+
+    @staticmethod
+    def _mudou_localizacao(atual, dados):
+        """True se endereco/cep/cidade raspados (não vazios) diferem dos do banco"""
+        return any(
+            dados.get(c) not in (None, '') and str(dados[c]).strip() != str(getattr(atual, c, None) or '').strip()
+            for c in CAMPOS_LOCALIZACAO
+        )
+
     def buscar_todas_unidades(self):
         session = self.Session()
         try:
@@ -218,28 +640,29 @@ class Database:
         session = self.Session()
         try:
             return session.query(Unidade).filter(
-                (Unidade.latitude.is_(None)) | 
-                (Unidade.latitude == '') |
-                (Unidade.longitude.is_(None)) | 
-                (Unidade.longitude == '')
+                (Unidade.latitude.is_(None)) |
+                (Unidade.longitude.is_(None))
             ).all()
         finally:
             session.close()
     
+    @escrita
     def atualizar_coordenadas(self, unidade_id, latitude, longitude):
         session = self.Session()
         try:
             unidade = session.query(Unidade).filter_by(id=unidade_id).first()
             if unidade:
-                unidade.latitude = str(latitude)
-                unidade.longitude = str(longitude)
+                unidade.latitude = latitude
+                unidade.longitude = longitude
                 unidade.data_atualizacao = datetime.utcnow()
                 session.commit()
+                self.atualizar_pares_proximos([unidade_id])
                 return True
             return False
         finally:
             session.close()
     
+    @escrita
     def atualizar_endereco_detalhado(self, unidade_id, cidade, estado, cep):
         session = self.Session()
         try:
@@ -254,6 +677,31 @@ class Database:
             return False
         finally:
             session.close()
+
+    @escrita
+    def atualizar_cdn_em_massa(self, registros, sobrescrever=False):
+        """
+        Grava as colunas *_cdn de muitas unidades em um único UPDATE em massa.
+        registros = [{'id', 'bairro_cdn', 'cidade_cdn', 'estado_cdn', 'pais_cdn'}];
+        valor None nunca apaga o que já existe. Por padrão só preenche campos
+        vazios (sobrescrever=True troca os preenchidos). data_atualizacao só
+        muda nas linhas em que algum valor mudou. Retorna quantas mudaram.
+        """
+        if not registros:
+            return 0
+        if sobrescrever:
+            novos = {c: f"COALESCE(:{c}, {c})" for c in CAMPOS_CDN}
+        else:
+            novos = {c: f"COALESCE(NULLIF({c}, ''), :{c})" for c in CAMPOS_CDN}
+        atribuicoes = ", ".join(f"{c} = {expr}" for c, expr in novos.items())
+        mudou = " OR ".join(f"{expr} IS NOT {c}" for c, expr in novos.items())
+        agora = datetime.utcnow()
+        parametros = [{**{c: r.get(c) for c in CAMPOS_CDN}, 'id': r['id'], 'agora': agora} for r in registros]
+        with self.engine.begin() as conn:
+            resultado = conn.execute(text(
+                f"UPDATE unidades SET {atribuicoes}, data_atualizacao = :agora WHERE id = :id AND ({mudou})"
+            ), parametros)
+        return resultado.rowcount
     
     def estatisticas(self):
         session = self.Session()
@@ -271,50 +719,291 @@ class Database:
         finally:
             session.close()
     
-    def gerar_json(self, nome_arquivo):
-        unidades = self.buscar_todas_unidades()
-        dados = [unidade.to_dict() for unidade in unidades]
-        with open(nome_arquivo, 'w', encoding='utf-8') as f:
-            json.dump(dados, f, ensure_ascii=False, indent=2, default=str)
-        print(f"📄 JSON gerado: {nome_arquivo} ({len(dados)} unidades)")
+    def gerar_json(self, nome_arquivo, formato=None, incremental=False, chunk=1000):
+        """
+        Exporta as unidades (campos de Unidade.to_dict) lendo o banco em blocos
+        de `chunk` linhas e escrevendo cada bloco direto no arquivo, então a
+        memória não cresce com o tamanho da tabela. Usa orjson se instalado.
+        - formato="json": um array JSON (uma unidade por linha);
+        - formato="ndjson": uma unidade JSON por linha;
+          sem formato, vale "ndjson" para .ndjson/.jsonl e "json" para o resto.
+        - incremental=True (só ndjson): acrescenta ao arquivo apenas as unidades
+          com data_atualizacao posterior à última exportação, registrada em
+          <nome_arquivo>.marca.json. Quem lê fica com a última linha de cada id.
+          Remoções não são registradas: unidades apagadas (ex.: limpar_duplicatas)
+          continuam no arquivo até uma exportação completa (incremental=False,
+          que reescreve o arquivo e a marca deixa de valer).
+        Retorna o número de unidades escritas.
+        """
+        formato = formato or ("ndjson" if nome_arquivo.endswith((".ndjson", ".jsonl")) else "json")
+        if formato not in FORMATOS_JSON:
+            raise ValueError(f"formato deve ser um de {FORMATOS_JSON}: {formato!r}")
+        if incremental and formato != "ndjson":
+            raise ValueError("exportação incremental só em ndjson (o arquivo recebe linhas novas no fim)")
+
+        serializar = _serializador_json()
+        tabela = Unidade.__table__
+        consulta = select(*[tabela.c[c] for c in COLUNAS_JSON]).order_by(tabela.c.id)
+
+        arquivo_marca = nome_arquivo + ".marca.json"
+        marca = None
+        if incremental and os.path.exists(nome_arquivo) and os.path.exists(arquivo_marca):
+            with open(arquivo_marca, encoding='utf-8') as f:
+                marca = datetime.fromisoformat(json.load(f)['data_atualizacao'])
+            consulta = consulta.where(tabela.c.data_atualizacao > marca)
+
+        destino = nome_arquivo if incremental else nome_arquivo + ".tmp"
+        total, ultima = 0, marca
+        with self.engine.connect() as conn, open(destino, 'ab' if incremental else 'wb') as f:
+            resultado = conn.execution_options(stream_results=True, yield_per=chunk).execute(consulta)
+            if formato == "json":
+                f.write(b"[")
+            for bloco in resultado.partitions(chunk):
+                linhas = []
+                for row in bloco:
+                    dados = dict(row._mapping)
+                    if dados['data_atualizacao'] and (ultima is None or dados['data_atualizacao'] > ultima):
+                        ultima = dados['data_atualizacao']
+                    for campo in ('data_criacao', 'data_atualizacao'):
+                        dados[campo] = dados[campo].isoformat() if dados[campo] else None
+                    linhas.append(serializar(dados))
+                if formato == "json":
+                    f.write((b",\n" if total else b"\n") + b",\n".join(linhas))
+                else:
+                    f.write(b"\n".join(linhas) + b"\n")
+                total += len(linhas)
+            if formato == "json":
+                f.write(b"\n]\n")
+
+        if not incremental:
+            os.replace(destino, nome_arquivo)
+        if ultima is not None:
+            with open(arquivo_marca, 'w', encoding='utf-8') as f:
+                json.dump({'data_atualizacao': ultima.isoformat()}, f)
+
+        modo = " (incremental)" if incremental else ""
+        print(f"📄 JSON gerado{modo}: {nome_arquivo} ({total} unidades)")
+        return total
     
-    def limpar_duplicatas(self):
+    @escrita
+    def limpar_duplicatas(self, modo="nome", raio_m=DIST_DUPLICATA_M):
+        """
+        Remove unidades duplicadas, mantendo sempre a de menor id.
+        - modo="nome": mesmo nome exato (um único DELETE ... NOT IN (MIN(id) GROUP BY nome));
+        - modo="proximidade": mesma rede, mesmo nome normalizado (sem acento,
+          caixa e pontuação) e coordenadas a até raio_m metros, encontradas
+          por uma grade de células de raio_m em vez de comparar todos os pares.
+        Os pares de pares_proximos das unidades removidas também são apagados.
+        Retorna a lista das unidades removidas (dicts com id, rede, nome,
+        endereco, latitude, longitude e 'mantida' = id da unidade que ficou).
+        """
+        if modo not in MODOS_DUPLICATA:
+            raise ValueError(f"modo deve ser um de {MODOS_DUPLICATA}: {modo!r}")
+
+        with self.engine.begin() as conn:
+            if modo == "nome":
+                removidas = [dict(row._mapping) for row in conn.execute(text("""
+                    SELECT id, rede, nome, endereco, latitude, longitude, mantida
+                    FROM (SELECT *, MIN(id) OVER (PARTITION BY nome) AS mantida FROM unidades)
+                    WHERE id != mantida
+                    ORDER BY id
+                """))]
+                if removidas:
+                    conn.execute(text("""
+                        DELETE FROM unidades
+                        WHERE id NOT IN (SELECT MIN(id) FROM unidades GROUP BY nome)
+                    """))
+            else:
+                removidas = self._duplicatas_proximas(conn, raio_m)
+                ids = [r['id'] for r in removidas]
+                for inicio in range(0, len(ids), 500):
+                    conn.execute(Unidade.__table__.delete().where(Unidade.__table__.c.id.in_(ids[inicio:inicio + 500])))
+
+            if removidas:
+                conn.execute(text("""
+                    DELETE FROM pares_proximos
+                    WHERE id_1 NOT IN (SELECT id FROM unidades) OR id_2 NOT IN (SELECT id FROM unidades)
+                """))
+        return removidas
+
+    def _duplicatas_proximas(self, conn, raio_m):
+        """Unidades a remover no modo "proximidade" (ver limpar_duplicatas)"""
+        linhas = conn.execute(text("""
+            SELECT id, rede, nome, endereco, latitude, longitude
+            FROM unidades
+            WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+            ORDER BY id
+        """)).fetchall()
+
+        # Grade em graus: célula de raio_m em latitude e, em longitude, larga o
+        # bastante para a maior latitude presente (vizinhos ficam sempre em
+        # células adjacentes)
+        passo_lat = math.degrees(raio_m / R_TERRA_M)
+        lat_max = max((abs(row[4]) for row in linhas), default=0.0)
+        passo_lon = passo_lat / max(math.cos(math.radians(lat_max)), 0.01)
+
+        pontos, grade = [], {}
+        for k, (uid, rede, nome, endereco, lat, lon) in enumerate(linhas):
+            chave = (rede, normalizar_nome(nome))
+            celula = (math.floor(lon / passo_lon), math.floor(lat / passo_lat))
+            pontos.append((chave, celula, lat, lon))
+            grade.setdefault((chave, celula), []).append(k)
+
+        # União dos pares dentro do raio (só células vizinhas da mesma rede + nome)
+        raiz = list(range(len(linhas)))
+
+        def achar(k):
+            while raiz[k] != k:
+                raiz[k] = raiz[raiz[k]]
+                k = raiz[k]
+            return k
+
+        for k, (chave, (cx, cy), lat, lon) in enumerate(pontos):
+            for dx in (-1, 0, 1):
+                for dy in (-1, 0, 1):
+                    for outro in grade.get((chave, (cx + dx, cy + dy)), ()):
+                        if outro <= k:
+                            continue
+                        if _distancia_m(lat, lon, pontos[outro][2], pontos[outro][3]) <= raio_m:
+                            a, b = achar(k), achar(outro)
+                            raiz[max(a, b)] = min(a, b)
+
+        # Linhas estão em ordem de id: a raiz de cada grupo é a de menor id
+        removidas = []
+        for k, (uid, rede, nome, endereco, lat, lon) in enumerate(linhas):
+            r = achar(k)
+            if r != k:
+                removidas.append({'id': uid, 'rede': rede, 'nome': nome, 'endereco': endereco,
+                                  'latitude': lat, 'longitude': lon, 'mantida': linhas[r][0]})
+        return removidas
+
+    # ============================================================
+    # 📍 Pares de unidades próximas (tabela pares_proximos)
+    # ============================================================
+    def _coordenadas_validas(self, session):
+        """Retorna (ids, lat, lon) das unidades com coordenadas preenchidas"""
+        import numpy as np
+
+        linhas = session.execute(text("""
+            SELECT id, latitude, longitude
+            FROM unidades
+            WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+            ORDER BY id
+        """)).fetchall()
+        if not linhas:
+            return np.empty(0, dtype=np.int64), np.empty(0), np.empty(0)
+        ids, lat, lon = (np.array(coluna) for coluna in zip(*linhas))
+        return ids.astype(np.int64), lat.astype(float), lon.astype(float)
+
+    @escrita
+    def atualizar_pares_proximos(self, ids=None, raio_max_km=RAIO_MAX_PARES_KM):
+        """
+        Atualiza a tabela pares_proximos (pares a até raio_max_km, distância geodésica).
+        Com ids=None reconstrói a tabela inteira; com uma lista de ids apaga os
+        pares dessas unidades e busca só os vizinhos delas (comparação direta
+        quando são poucas, cKDTree quando são muitas; ver indice_espacial.py).
+        Retorna o número de pares gravados.
+        """
+        import numpy as np
+        from .indice_espacial import buscar_pares, distancias_geodesic, vizinhos_de
+
         session = self.Session()
         try:
-            duplicatas = session.query(Unidade.nome).group_by(Unidade.nome).having(
-                text('COUNT(*) > 1')
-            ).all()
-            total_removidas = 0
-            for (nome,) in duplicatas:
-                unidades = session.query(Unidade).filter_by(nome=nome).order_by(Unidade.id).all()
-                for unidade in unidades[1:]:
-                    session.delete(unidade)
-                    total_removidas += 1
+            ids_todos, lat, lon = self._coordenadas_validas(session)
+            tabela = ParProximo.__table__
+
+            if ids is None:
+                session.execute(tabela.delete())
+                i, j, d = buscar_pares(lat, lon, raio_max_km)
+            else:
+                ids = sorted({int(x) for x in ids})
+                if not ids:
+                    return 0
+                session.execute(tabela.delete().where(
+                    tabela.c.id_1.in_(ids) | tabela.c.id_2.in_(ids)
+                ))
+                i, j = vizinhos_de(lat, lon, np.flatnonzero(np.isin(ids_todos, ids)), raio_max_km)
+                d = distancias_geodesic(lat, lon, i, j)
+                dentro = d <= raio_max_km
+                i, j, d = i[dentro], j[dentro], d[dentro]
+
+            registros = [
+                {'id_1': int(ids_todos[a]), 'id_2': int(ids_todos[b]), 'distancia_km': float(dist)}
+                for a, b, dist in zip(i, j, d)
+            ]
+            if registros:
+                session.execute(tabela.insert(), registros)
             session.commit()
-            return total_removidas
+            return len(registros)
+        except Exception:
+            session.rollback()
+            raise
         finally:
             session.close()
 
-    # ============================================================
-    # 🔍 Métodos utilitários dinâmicos
-    # ============================================================
-    def obter_colunas_tabela(self, tabela="unidades"):
-        """Retorna todas as colunas da tabela informada"""
+    def buscar_pares_proximos(self, raio_km):
+        """Retorna [(id_1, id_2, distancia_km)] dos pares a até raio_km (consulta indexada)"""
+        if raio_km > RAIO_MAX_PARES_KM:
+            print(f"⚠️ pares_proximos só guarda pares até {RAIO_MAX_PARES_KM} km")
         session = self.Session()
         try:
-            resultado = session.execute(text(f"PRAGMA table_info({tabela})"))
-            return [row[1] for row in resultado.fetchall()]
+            return session.query(ParProximo.id_1, ParProximo.id_2, ParProximo.distancia_km).filter(
+                ParProximo.distancia_km <= raio_km
+            ).order_by(ParProximo.id_1, ParProximo.id_2).all()
         finally:
             session.close()
 
+    # ============================================================
+    # 🔍 Métodos utilitários dinâmicos
+    # ============================================================
+    def obter_colunas_tabela(self, tabela="unidades", atualizar=False):
+        """
+        Retorna todas as colunas da tabela informada. O PRAGMA só é executado
+        na primeira chamada (por URL e tabela, no processo inteiro); use
+        atualizar=True depois de mudar o schema por fora da classe.
+        """
+        chave = (self.db_url, tabela)
+        colunas = _schemas.get(chave)
+        if colunas is None or atualizar:
+            with self.engine.connect() as conn:
+                colunas = tuple(row[1] for row in conn.execute(text(f"PRAGMA table_info({tabela})")))
+            if colunas:
+                _schemas[chave] = colunas
+        return list(colunas)
+
+    @escrita
     def adicionar_coluna(self, tabela, coluna, tipo="TEXT"):
         """Adiciona dinamicamente uma coluna na tabela se não existir"""
-        session = self.Session()
+        return bool(self.garantir_colunas(tabela, {coluna: tipo}))
+
+    @escrita
+    def garantir_colunas(self, tabela, colunas, tipo="TEXT"):
+        """
+        Garante que todas as colunas existam antes de uma inserção em massa.
+        `colunas` é um iterável de nomes (todas com `tipo`) ou {nome: tipo}.
+        As que faltam são criadas em uma única transação e o cache de schema é
+        relido uma vez no fim. Retorna a lista de colunas criadas.
+        """
+        tipos = dict(colunas) if isinstance(colunas, dict) else dict.fromkeys(colunas, tipo)
+        faltando = [c for c in tipos if c not in self.obter_colunas_tabela(tabela)]
+        if not faltando:
+            return []
+
+        # Outro processo pode ter criado alguma delas: confere no banco antes do ALTER
+        existentes = self.obter_colunas_tabela(tabela, atualizar=True)
+        faltando = [c for c in faltando if c not in existentes]
+        criadas = []
         try:
-            colunas = self.obter_colunas_tabela(tabela)
-            if coluna not in colunas:
-                print(f"⚡ Adicionando coluna '{coluna}' na tabela '{tabela}'...")
-                session.execute(text(f"ALTER TABLE {tabela} ADD COLUMN {coluna} {tipo}"))
-                session.commit()
+            with self.engine.begin() as conn:
+                for coluna in faltando:
+                    print(f"⚡ Adicionando coluna '{coluna}' na tabela '{tabela}'...")
+                    identificador = '"' + coluna.replace('"', '""') + '"'
+                    try:
+                        conn.execute(text(f"ALTER TABLE {tabela} ADD COLUMN {identificador} {tipos[coluna]}"))
+                        criadas.append(coluna)
+                    except OperationalError as e:
+                        if "duplicate column name" not in str(e):
+                            raise
         finally:
-            session.close()
+            self.obter_colunas_tabela(tabela, atualizar=True)
+        return criadas
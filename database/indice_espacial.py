@@ -0,0 +1,123 @@
+# =========================
+# indice_espacial.py
+# =========================
+"""
+Índice espacial das coordenadas das unidades.
+
+As coordenadas são projetadas na esfera unitária (x, y, z) e indexadas em um
+cKDTree. Um raio em km vira uma distância de corda na esfera, então todos os
+pares candidatos saem de uma única consulta em ~O(n log n). Os candidatos são
+refinados com o mesmo geodesic do geopy usado antes, de modo que as
+distâncias finais são idênticas às do loop par a par.
+
+Fica em database/ porque a tabela pares_proximos (Database) é mantida com
+ele; analysis/busca_raio.py reexporta estas funções para as análises.
+"""
+import numpy as np
+from geopy.distance import geodesic
+from scipy.spatial import cKDTree
+
+R_TERRA_KM = 6371.0
+
+# A esfera de raio médio difere do elipsoide WGS-84 em menos de 0,6%.
+# A busca usa um raio 1% maior e o geodesic decide quem fica.
+MARGEM_ESFERA = 1.01
+
+# Até quantas unidades de origem vizinhos_de compara direto com todas as
+# coordenadas (O(n) por unidade) em vez de montar o cKDTree da tabela inteira
+MAX_BUSCA_DIRETA = 64
+
+
+# =========================
+# Índice espacial
+# =========================
+def coordenadas_esfera(lat, lon):
+    """Converte latitude/longitude (graus) em pontos (x, y, z) da esfera unitária."""
+    lat = np.radians(np.asarray(lat, dtype=float))
+    lon = np.radians(np.asarray(lon, dtype=float))
+    cos_lat = np.cos(lat)
+    return np.column_stack((cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)))
+
+
+def raio_para_corda(raio_km, margem=MARGEM_ESFERA):
+    """Distância de corda (esfera unitária) equivalente a um raio em km."""
+    angulo = min(raio_km * margem / R_TERRA_KM, np.pi)
+    return 2 * np.sin(angulo / 2)
+
+
+def construir_indice(lat, lon):
+    """Cria o cKDTree das coordenadas na esfera unitária."""
+    return cKDTree(coordenadas_esfera(lat, lon))
+
+
+# =========================
+# Candidatos e refinamento
+# =========================
+def pares_candidatos(lat, lon, raio_km, arvore=None):
+    """
+    Retorna os índices (i, j), com i < j, de todos os pares que podem estar
+    dentro de raio_km, ordenados por (i, j).
+    """
+    if arvore is None:
+        arvore = construir_indice(lat, lon)
+    pares = arvore.query_pairs(raio_para_corda(raio_km), output_type='ndarray')
+    if len(pares) == 0:
+        vazio = np.empty(0, dtype=np.intp)
+        return vazio, vazio
+    ordem = np.lexsort((pares[:, 1], pares[:, 0]))
+    pares = pares[ordem]
+    return pares[:, 0], pares[:, 1]
+
+
+def vizinhos_de(lat, lon, posicoes, raio_km):
+    """
+    Pares candidatos (i, j), com i < j e sem repetição, entre as unidades em
+    `posicoes` e todas as outras a até raio_km. Com poucas posições compara
+    direto na esfera; com muitas usa o cKDTree.
+    """
+    posicoes = np.asarray(posicoes, dtype=np.intp)
+    if len(posicoes) == 0:
+        vazio = np.empty(0, dtype=np.intp)
+        return vazio, vazio
+    pontos = coordenadas_esfera(lat, lon)
+    corda = raio_para_corda(raio_km)
+
+    if len(posicoes) <= MAX_BUSCA_DIRETA:
+        partes = [np.flatnonzero(((pontos - pontos[p]) ** 2).sum(axis=1) <= corda ** 2) for p in posicoes]
+    else:
+        partes = cKDTree(pontos).query_ball_point(pontos[posicoes], corda)
+    origem = np.repeat(posicoes, [len(v) for v in partes])
+    destino = np.concatenate([np.asarray(v, dtype=np.intp) for v in partes])
+
+    # Normaliza (menor, maior) e remove repetidos (duas unidades de origem vizinhas)
+    pares = np.unique(np.column_stack([np.minimum(origem, destino), np.maximum(origem, destino)]), axis=0)
+    pares = pares[pares[:, 0] != pares[:, 1]]
+    return pares[:, 0], pares[:, 1]
+
+
+def distancias_geodesic(lat, lon, i, j):
+    """Distância geodésica exata (km) para cada par candidato (i[k], j[k])."""
+    return np.fromiter(
+        (geodesic((lat[a], lon[a]), (lat[b], lon[b])).km for a, b in zip(i, j)),
+        dtype=float,
+        count=len(i)
+    )
+
+
+def buscar_pares(lat, lon, raio_km):
+    """
+    Encontra todos os pares (i < j) a até raio_km de distância geodésica.
+
+    Linhas com coordenada ausente são ignoradas. Retorna (i, j, d) com os
+    índices posicionais em lat/lon e as distâncias exatas, ordenados por (i, j).
+    """
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    validos = np.flatnonzero(~(np.isnan(lat) | np.isnan(lon)))
+
+    i, j = pares_candidatos(lat[validos], lon[validos], raio_km)
+    i, j = validos[i], validos[j]
+
+    d = distancias_geodesic(lat, lon, i, j)
+    dentro = d <= raio_km
+    return i[dentro], j[dentro], d[dentro]
@@ -0,0 +1,430 @@
+# =========================
+# migracoes.py
+# =========================
+"""
+Migrações versionadas do schema SQLite.
+
+Cada migração é uma lista de operações de coluna (adicionar, renomear,
+remover, mudar tipo, chave primária) sobre uma tabela. `migrar` junta as operações de
+todas as migrações pendentes da mesma tabela em um único plano e aplica
+tudo de uma vez, dentro de uma só transação:
+
+- só colunas novas → ALTER TABLE ADD COLUMN (sem copiar a tabela);
+- qualquer outra mudança → uma única reconstrução (CREATE nova tabela,
+  INSERT ... SELECT, DROP, RENAME), com as restrições UNIQUE e os índices
+  recriados e a contagem de linhas conferida antes do COMMIT.
+
+As operações são condicionais (renomear só se a coluna antiga existir e a
+nova não, etc.), então qualquer banco, novo ou legado, chega ao mesmo
+estado. As versões aplicadas ficam na tabela migracoes_schema.
+"""
+import os
+import re
+import sqlite3
+import sys
+import time
+from datetime import datetime
+
+DB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'unidades.db')
+TABELA_VERSOES = "migracoes_schema"
+
+
+def citar(identificador):
+    """Identificador SQL entre aspas duplas (aspas internas duplicadas)"""
+    return '"' + identificador.replace('"', '""') + '"'
+
+
+# =========================
+# Operações de coluna
+# =========================
+# Cada operação recebe o plano (lista de colunas da tabela nova, cada uma com a
+# expressão de origem na tabela antiga) e devolve True se mudou alguma coisa.
+class Adicionar:
+    """Nova coluna (pulada se ela ou uma das `equivalentes` já existir)"""
+    reconstroi = False
+
+    def __init__(self, coluna, tipo="TEXT", equivalentes=()):
+        self.coluna, self.tipo, self.equivalentes = coluna, tipo, tuple(equivalentes)
+
+    def aplicar(self, plano):
+        nomes = {c['nome'] for c in plano.colunas}
+        if self.coluna in nomes or nomes.intersection(self.equivalentes):
+            return False
+        plano.colunas.append({'nome': self.coluna, 'tipo': self.tipo, 'notnull': False,
+                              'default': None, 'pk': 0, 'origem': None})
+        return True
+
+    def __repr__(self):
+        return f"+{self.coluna} {self.tipo}"
+
+
+class Renomear:
+    """Renomeia a coluna (se a antiga existir e a nova ainda não)"""
+    reconstroi = True
+
+    def __init__(self, antiga, nova):
+        self.antiga, self.nova = antiga, nova
+
+    def aplicar(self, plano):
+        coluna = plano.coluna(self.antiga)
+        if coluna is None or plano.coluna(self.nova) is not None:
+            return False
+        coluna['nome'] = self.nova
+        plano.renomeadas[self.antiga] = self.nova
+        return True
+
+    def __repr__(self):
+        return f"{self.antiga}→{self.nova}"
+
+
+class Remover:
+    """Remove a coluna (se existir)"""
+    reconstroi = True
+
+    def __init__(self, coluna):
+        self.coluna = coluna
+
+    def aplicar(self, plano):
+        coluna = plano.coluna(self.coluna)
+        if coluna is None:
+            return False
+        plano.colunas.remove(coluna)
+        plano.removidas.add(self.coluna)
+        return True
+
+    def __repr__(self):
+        return f"-{self.coluna}"
+
+
+class ChavePrimaria:
+    """Torna a coluna INTEGER PRIMARY KEY AUTOINCREMENT (se ainda não for a chave primária)"""
+    reconstroi = True
+
+    def __init__(self, coluna="id"):
+        self.coluna = coluna
+
+    def aplicar(self, plano):
+        coluna = plano.coluna(self.coluna)
+        if coluna is None or (coluna['pk'] and sum(1 for c in plano.colunas if c['pk']) == 1):
+            return False
+        for outra in plano.colunas:
+            outra['pk'] = 0
+        coluna.update(tipo="INTEGER", pk=1, notnull=False)
+        plano.autoincrement = True
+        return True
+
+    def __repr__(self):
+        return f"pk({self.coluna})"
+
+
+class Unico:
+    """Restrição UNIQUE na coluna (se nenhum índice único já cobrir só ela)"""
+    reconstroi = True
+
+    def __init__(self, coluna):
+        self.coluna = coluna
+
+    def aplicar(self, plano):
+        if plano.coluna(self.coluna) is None or any(
+            unico and colunas == [self.coluna] for _, unico, colunas, _, _ in plano.indices
+        ) or (self.coluna,) in plano.unicas:
+            return False
+        plano.unicas.append((self.coluna,))
+        return True
+
+    def __repr__(self):
+        return f"unique({self.coluna})"
+
+
+class MudarTipo:
+    """
+    Muda o tipo declarado da coluna (se ele ainda não contiver nenhuma das
+    `afinidades`), convertendo os valores com `conversao(expressao_origem)`
+    """
+    reconstroi = True
+
+    def __init__(self, coluna, tipo, conversao=None, afinidades=()):
+        self.coluna, self.tipo, self.conversao = coluna, tipo, conversao
+        self.afinidades = tuple(afinidades) or (tipo.upper(),)
+
+    def aplicar(self, plano):
+        coluna = plano.coluna(self.coluna)
+        if coluna is None or any(a in coluna['tipo'].upper() for a in self.afinidades):
+            return False
+        coluna['tipo'] = self.tipo
+        if self.conversao and coluna['origem'] is not None:
+            coluna['origem'] = self.conversao(coluna['origem'])
+        return True
+
+    def __repr__(self):
+        return f"{self.coluna}::{self.tipo}"
+
+
+def real_ou_nulo(expressao):
+    """
+    SQL que converte texto em REAL só quando ele é um número decimal
+    ('-23,5' → -23.5); vazio ou lixo vira NULL (CAST sozinho daria 0.0).
+    Números já guardados como INTEGER/REAL passam direto.
+    """
+    t = f"TRIM(REPLACE({expressao}, ',', '.'))"
+    return (
+        f"CASE WHEN typeof({expressao}) IN ('integer', 'real') THEN {expressao} "
+        f"WHEN typeof({expressao}) = 'text' "
+        f"AND {t} GLOB '*[0-9]*' "
+        f"AND substr({t}, 1, 1) GLOB '[0-9.+-]' "
+        f"AND substr({t}, 2) NOT GLOB '*[^0-9.]*' "
+        f"AND {t} NOT GLOB '*.*.*' "
+        f"THEN CAST({t} AS REAL) END"
+    )
+
+
+class Migracao:
+    def __init__(self, versao, nome, tabela, operacoes):
+        self.versao, self.nome, self.tabela, self.operacoes = versao, nome, tabela, list(operacoes)
+
+
+# =========================
+# Registro de migrações
+# =========================
+COLUNAS_CDN = ("bairro", "cidade", "estado", "pais")
+
+MIGRACOES = [
+    # utils/fix_db.py
+    Migracao(1, "id_chave_primaria", "unidades", [ChavePrimaria("id"), Unico("nome")]),
+    # analysis/criar_colunas_endereco.py
+    Migracao(2, "colunas_endereco_cdn", "unidades",
+             [Adicionar(f"{c}(cdn)", "TEXT", equivalentes=(f"{c}_cdn",)) for c in COLUNAS_CDN]),
+    # utils/normalize_column_names.py
+    Migracao(3, "normalizar_nomes_cdn", "unidades",
+             [Renomear(f"{c}(cdn)", f"{c}_cdn") for c in COLUNAS_CDN]),
+    # analysis/excluir_bairro_pais.py
+    Migracao(4, "excluir_bairro_pais", "unidades", [Remover("bairro"), Remover("pais")]),
+    # latitude/longitude de TEXT/VARCHAR para REAL (legado: texto vindo dos scrapers)
+    Migracao(5, "coordenadas_real", "unidades",
+             [MudarTipo(c, "FLOAT", real_ou_nulo, afinidades=("REAL", "FLOA", "DOUB"))
+              for c in ("latitude", "longitude")]),
+]
+
+# Migrações não destrutivas que Database aplica sozinho ao abrir o banco
+VERSOES_AUTOMATICAS = (5,)
+
+
+# =========================
+# Plano da tabela
+# =========================
+class _Plano:
+    """Estado da tabela lido do SQLite + as mudanças acumuladas pelas operações"""
+
+    def __init__(self, conn, tabela):
+        self.tabela = tabela
+        create_sql = conn.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (tabela,)
+        ).fetchone()
+        if create_sql is None:
+            raise ValueError(f"Tabela '{tabela}' não encontrada")
+        self.autoincrement = "AUTOINCREMENT" in create_sql[0].upper()
+
+        self.colunas = [
+            {'nome': nome, 'tipo': tipo or "", 'notnull': bool(notnull), 'default': default,
+             'pk': pk, 'origem': citar(nome)}
+            for _, nome, tipo, notnull, default, pk in conn.execute(f"PRAGMA table_info({citar(tabela)})")
+        ]
+        self.renomeadas, self.removidas, self.unicas = {}, set(), []
+
+        # Índices: (nome, unique, colunas, origem, sql). origem 'u' = UNIQUE da
+        # tabela (sqlite_autoindex), 'c' = CREATE INDEX, 'pk' = chave primária
+        self.indices = []
+        for _, nome, unico, origem, _parcial in conn.execute(f"PRAGMA index_list({citar(tabela)})"):
+            colunas = [row[2] for row in conn.execute(f"PRAGMA index_info({citar(nome)})")]
+            sql = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'index' AND name = ?",
+                               (nome,)).fetchone()
+            self.indices.append((nome, bool(unico), colunas, origem, sql[0] if sql else None))
+
+    def coluna(self, nome):
+        return next((c for c in self.colunas if c['nome'] == nome), None)
+
+    def _renomear_sql(self, sql):
+        for antiga, nova in self.renomeadas.items():
+            sql = sql.replace(citar(antiga), citar(nova))
+            if re.fullmatch(r"\w+", antiga):
+                sql = re.sub(rf"(?<![\w\"]){antiga}(?![\w\"])", citar(nova), sql)
+        return sql
+
+    def create_sql(self, nome_tabela):
+        pks = [c for c in self.colunas if c['pk']]
+        definicoes = []
+        for c in self.colunas:
+            partes = [citar(c['nome']), c['tipo']]
+            if len(pks) == 1 and c['pk']:
+                partes.append("PRIMARY KEY AUTOINCREMENT" if self.autoincrement else "PRIMARY KEY")
+            if c['notnull']:
+                partes.append("NOT NULL")
+            if c['default'] is not None:
+                partes.append(f"DEFAULT {c['default']}")
+            definicoes.append(" ".join(p for p in partes if p))
+        if len(pks) > 1:
+            definicoes.append(f"PRIMARY KEY ({', '.join(citar(c['nome']) for c in sorted(pks, key=lambda c: c['pk']))})")
+        for _, _, colunas, origem, _ in self.indices:
+            if origem == 'u' and not self.removidas.intersection(colunas):
+                definicoes.append(f"UNIQUE ({', '.join(citar(self.renomeadas.get(c, c)) for c in colunas)})")
+        for colunas in self.unicas:
+            definicoes.append(f"UNIQUE ({', '.join(citar(c) for c in colunas)})")
+        return f"CREATE TABLE {citar(nome_tabela)} ({', '.join(definicoes)})"
+
+    def indices_sql(self):
+        """CREATE INDEX dos índices explícitos, com colunas renomeadas (descarta os de colunas removidas)"""
+        comandos, descartados = [], []
+        for nome, _, colunas, origem, sql in self.indices:
+            if origem != 'c' or sql is None:
+                continue
+            if self.removidas.intersection(colunas):
+                descartados.append(nome)
+                continue
+            comandos.append(self._renomear_sql(sql))
+        return comandos, descartados
+
+
+# =========================
+# Execução
+# =========================
+def _garantir_tabela_versoes(conn):
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {TABELA_VERSOES} ("
+        "versao INTEGER PRIMARY KEY, nome TEXT NOT NULL, aplicada_em TEXT NOT NULL, "
+        "alteracoes TEXT, linhas INTEGER, duracao_s REAL)"
+    )
+
+
+def versoes_aplicadas(db_path=DB_PATH):
+    conn = sqlite3.connect(db_path)
+    try:
+        _garantir_tabela_versoes(conn)
+        return {row[0] for row in conn.execute(f"SELECT versao FROM {TABELA_VERSOES}")}
+    finally:
+        conn.close()
+
+
+def _aplicar_tabela(conn, tabela, operacoes):
+    """
+    Aplica as operações acumuladas de uma tabela. Retorna (alterações, linhas)
+    — alterações vazias se não havia nada a fazer.
+    """
+    plano = _Plano(conn, tabela)
+    alteracoes = [op for op in operacoes if op.aplicar(plano)]
+    linhas = conn.execute(f"SELECT COUNT(*) FROM {citar(tabela)}").fetchone()[0]
+    if not alteracoes:
+        return alteracoes, linhas
+
+    if not any(op.reconstroi for op in alteracoes):
+        # Só colunas novas: ALTER TABLE basta
+        for coluna in plano.colunas:
+            if coluna['origem'] is None:
+                conn.execute(f"ALTER TABLE {citar(tabela)} ADD COLUMN {citar(coluna['nome'])} {coluna['tipo']}")
+        return alteracoes, linhas
+
+    temporaria = f"{tabela}__migracao"
+    indices, descartados = plano.indices_sql()
+    copiadas = [c for c in plano.colunas if c['origem'] is not None]
+
+    conn.execute(f"DROP TABLE IF EXISTS {citar(temporaria)}")
+    conn.execute(plano.create_sql(temporaria))
+    conn.execute(
+        f"INSERT INTO {citar(temporaria)} ({', '.join(citar(c['nome']) for c in copiadas)}) "
+        f"SELECT {', '.join(c['origem'] for c in copiadas)} FROM {citar(tabela)}"
+    )
+    copiadas_total = conn.execute(f"SELECT COUNT(*) FROM {citar(temporaria)}").fetchone()[0]
+    if copiadas_total != linhas:
+        raise RuntimeError(f"'{tabela}': {linhas} linhas na origem, {copiadas_total} copiadas")
+
+    conn.execute(f"DROP TABLE {citar(tabela)}")
+    conn.execute(f"ALTER TABLE {citar(temporaria)} RENAME TO {citar(tabela)}")
+    for indice_sql in indices:
+        conn.execute(indice_sql)
+    for nome in descartados:
+        print(f"   ⚠️ Índice '{nome}' removido junto com suas colunas")
+    return alteracoes, linhas
+
+
+def _invalidar_cache_schema(db_path):
+    """
+    Um Database aberto neste processo relê as colunas depois da migração.
+    Se database.db nunca foi importado, não há cache a limpar.
+    """
+    db = sys.modules.get("database.db")
+    if db is not None:
+        db.invalidar_schemas(db_path)
+
+
+def migrar(db_path=DB_PATH, ate=None, migracoes=None, versoes=None, silencioso=False):
+    """
+    Aplica as migrações pendentes (versão ≤ `ate` e em `versoes`, se dados)
+    em uma única transação: as operações de cada tabela viram uma só
+    reconstrução. Retorna o relatório [{versao, nome, tabela, alteracoes,
+    linhas, duracao_s}]. Em caso de erro nada é aplicado.
+    silencioso=True não imprime nada quando nenhuma tabela precisou mudar.
+    """
+    migracoes = sorted(migracoes if migracoes is not None else MIGRACOES, key=lambda m: m.versao)
+    if versoes is not None:
+        migracoes = [m for m in migracoes if m.versao in versoes]
+
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        conn.execute("PRAGMA busy_timeout = 30000")
+        _garantir_tabela_versoes(conn)
+        aplicadas = {row[0] for row in conn.execute(f"SELECT versao FROM {TABELA_VERSOES}")}
+        pendentes = [m for m in migracoes if m.versao not in aplicadas and (ate is None or m.versao <= ate)]
+        if not pendentes:
+            if not silencioso:
+                print("✅ Schema já está na versão mais recente")
+            return []
+
+        # Operações agrupadas por tabela, na ordem das versões
+        por_tabela = {}
+        for migracao in pendentes:
+            por_tabela.setdefault(migracao.tabela, []).extend(
+                (migracao.versao, op) for op in migracao.operacoes
+            )
+
+        relatorio = []
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for tabela, operacoes in por_tabela.items():
+                inicio = time.perf_counter()
+                alteracoes, linhas = _aplicar_tabela(conn, tabela, [op for _, op in operacoes])
+                duracao = time.perf_counter() - inicio
+                for migracao in (m for m in pendentes if m.tabela == tabela):
+                    feitas = [op for op in alteracoes if op in migracao.operacoes]
+                    relatorio.append({'versao': migracao.versao, 'nome': migracao.nome, 'tabela': tabela,
+                                      'alteracoes': feitas, 'linhas': linhas, 'duracao_s': duracao})
+
+            agora = datetime.now().isoformat(sep=" ")
+            conn.executemany(
+                f"INSERT INTO {TABELA_VERSOES} (versao, nome, aplicada_em, alteracoes, linhas, duracao_s) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(r['versao'], r['nome'], agora, ", ".join(map(repr, r['alteracoes'])) or None,
+                  r['linhas'], round(r['duracao_s'], 6)) for r in relatorio]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+
+    if any(r['alteracoes'] for r in relatorio):
+        _invalidar_cache_schema(db_path)
+    if silencioso and not any(r['alteracoes'] for r in relatorio):
+        return relatorio
+    for r in relatorio:
+        descricao = ", ".join(map(repr, r['alteracoes'])) or "nada a fazer"
+        print(f"   v{r['versao']} {r['nome']} [{r['tabela']}]: {descricao}")
+    for tabela in por_tabela:
+        r = next(r for r in relatorio if r['tabela'] == tabela)
+        print(f"📊 '{tabela}': {r['linhas']} registros preservados em {r['duracao_s']:.3f}s")
+    return relatorio
+
+
+if __name__ == "__main__":
+    print("🔧 APLICANDO MIGRAÇÕES DO SCHEMA")
+    print("=" * 50)
+    migrar()
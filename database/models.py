@@ -1,11 +1,40 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, JSON, Float
+from sqlalchemy import Column, Integer, String, DateTime, Text, JSON, Float, Index, text
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.types import TypeDecorator
 from datetime import datetime
+import math
 
 Base = declarative_base()
 
+
+class Coordenada(TypeDecorator):
+    """
+    Latitude/longitude como REAL. Aceita float ou string vinda dos scrapers
+    e geocoders: '-23,5' vira -23.5; '' (ou só espaços) e qualquer valor que
+    não seja número (ou seja NaN/infinito) viram NULL.
+    """
+    impl = Float
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        if isinstance(value, str):
+            value = value.strip().replace(',', '.')
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            return None
+        return value if math.isfinite(value) else None
+
+
 class Unidade(Base):
     __tablename__ = 'unidades'
+    __table_args__ = (
+        # Índice parcial: fila dos geocoders (unidades ainda sem coordenadas)
+        Index('ix_unidades_sem_coordenadas', 'id',
+              sqlite_where=text('latitude IS NULL OR longitude IS NULL')),
+    )
     
     id = Column(Integer, primary_key=True, autoincrement=True)
     rede = Column(String(100), nullable=False, index=True)
@@ -19,14 +48,17 @@ class Unidade(Base):
     
     # Colunas para contato e localização
     telefone = Column(String(50), nullable=True)
-    latitude = Column(String(20), nullable=True)
-    longitude = Column(String(20), nullable=True)
+    latitude = Column(Coordenada, nullable=True)
+    longitude = Column(Coordenada, nullable=True)
     
     # Colunas para informações adicionais
     horarios = Column(JSON, nullable=True)  # Dicionário de horários
     servicos = Column(JSON, nullable=True)  # Lista de serviços
     link_matricula = Column(String(500), nullable=True)
     
+    # Hash do conteúdo raspado (Database.sincronizar_unidades)
+    hash_conteudo = Column(String(64), nullable=True)
+
     # Timestamps
     data_criacao = Column(DateTime, default=datetime.utcnow)
     data_atualizacao = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -73,3 +105,15 @@ class Unidade(Base):
             'estado_cdn': self.estado_cdn,
             'pais_cdn': self.pais_cdn
         }
+
+
+class ParProximo(Base):
+    """Par de unidades a até RAIO_MAX_PARES_KM (database/db.py), com id_1 < id_2."""
+    __tablename__ = 'pares_proximos'
+
+    id_1 = Column(Integer, primary_key=True)
+    id_2 = Column(Integer, primary_key=True, index=True)
+    distancia_km = Column(Float, nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<ParProximo(id_1={self.id_1}, id_2={self.id_2}, distancia_km={self.distancia_km})>"
@@ -1,63 +1,255 @@
-import sqlite3
-import pandas as pd
+import argparse
+import csv
 import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
 
-def exportar_tabela_para_csv(banco_dados, nome_tabela, pasta_saida="."):
-    # Conecta ao banco
-    con = sqlite3.connect(banco_dados)
+# Formatos de saída: CSV (sem dependências), Parquet (zstd) e Feather (precisam de pyarrow)
+FORMATOS = ("csv", "parquet", "feather")
+EXTENSOES = {"csv": "csv", "parquet": "parquet", "feather": "feather"}
 
-    # Verifica se a tabela existe
-    cursor = con.cursor()
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (nome_tabela,))
-    
-    if not cursor.fetchone():
-        print(f"⚠️ Tabela '{nome_tabela}' não encontrada no banco de dados.")
-        con.close()
-        return
+# Linhas lidas do banco por vez: a memória fica em ~CHUNK_LINHAS linhas, qualquer que seja a tabela
+CHUNK_LINHAS = 50_000
 
-    # Cria a pasta de saída, se não existir
-    os.makedirs(pasta_saida, exist_ok=True)
+# Tabelas exportadas em paralelo (uma conexão SQLite por thread)
+N_THREADS = min(4, os.cpu_count() or 1)
 
-    # Exporta a tabela específica
-    df = pd.read_sql_query(f"SELECT * FROM {nome_tabela};", con)
-    caminho_arquivo = os.path.join(pasta_saida, f"{nome_tabela}.csv")
-    df.to_csv(caminho_arquivo, index=False, encoding="utf-8-sig")
-    print(f"✅ Tabela '{nome_tabela}' exportada para: {caminho_arquivo}")
-    print(f"📊 Total de registros: {len(df)}")
 
-    con.close()
-    print(f"\n🎉 Exportação da tabela '{nome_tabela}' concluída com sucesso!")
+# =========================
+# Metadados das tabelas
+# =========================
+def listar_tabelas(con):
+    """Tabelas do usuário (sem as internas sqlite_*)"""
+    cursor = con.execute(
+        "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%' ORDER BY name"
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def citar(identificador):
+    """Identificador SQL entre aspas duplas (aspas internas duplicadas)"""
+    return '"' + identificador.replace('"', '""') + '"'
+
+
+def colunas_tabela(con, nome_tabela):
+    """[(nome, tipo declarado)] via PRAGMA table_info"""
+    return [(row[1], (row[2] or "").upper()) for row in con.execute(f"PRAGMA table_info({citar(nome_tabela)})")]
+
+
+def _tipo_arrow(tipo_declarado):
+    """Tipo Arrow pela afinidade do tipo declarado no SQLite"""
+    import pyarrow as pa
+
+    if "INT" in tipo_declarado:
+        return pa.int64()
+    if any(t in tipo_declarado for t in ("REAL", "FLOA", "DOUB")):
+        return pa.float64()
+    return pa.string()
+
+
+def _coluna_arrow(valores, tipo):
+    """
+    Array Arrow de uma coluna do bloco. O SQLite não impõe o tipo declarado:
+    valores que não cabem no tipo viram texto (colunas texto) ou nulo (numéricas).
+    """
+    import pyarrow as pa
+
+    if pa.types.is_string(tipo):
+        return pa.array([None if v is None else str(v) for v in valores], type=tipo)
+    try:
+        return pa.array(valores, type=tipo)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        conversor = int if pa.types.is_integer(tipo) else float
+        convertidos = []
+        for v in valores:
+            try:
+                convertidos.append(None if v in (None, "") else conversor(v))
+            except (TypeError, ValueError):
+                convertidos.append(None)
+        return pa.array(convertidos, type=tipo)
+
+
+# =========================
+# Exportação de uma tabela
+# =========================
+def _filtros_ausentes(colunas, redes=None, estados=None):
+    """Colunas de filtro pedidas (rede/estado_cdn) que a tabela não tem"""
+    nomes = {nome for nome, _ in colunas}
+    return [coluna for coluna, valores in (("rede", redes), ("estado_cdn", estados))
+            if valores is not None and coluna not in nomes]
+
+
+def _consulta(nome_tabela, colunas, redes=None, estados=None, selecao="*"):
+    """SELECT com filtros de rede/estado_cdn no SQL (só se a tabela tiver essas colunas)"""
+    nomes = {nome for nome, _ in colunas}
+    condicoes, parametros = [], []
+    for coluna, valores in (("rede", redes), ("estado_cdn", estados)):
+        if valores is None or coluna not in nomes:
+            continue
+        valores = [valores] if isinstance(valores, str) else list(valores)
+        condicoes.append(f"{citar(coluna)} IN ({', '.join('?' * len(valores))})")
+        parametros.extend(valores)
+    where = f" WHERE {' AND '.join(condicoes)}" if condicoes else ""
+    return f"SELECT {selecao} FROM {citar(nome_tabela)}{where}", parametros
+
+
+def _colunas_inteiras_como_float(con, nome_tabela, colunas, redes=None, estados=None):
+    """
+    Posições das colunas que o pandas lia como float64: só números, com pelo
+    menos um inteiro e algum nulo ou real. Nelas o CSV antigo trazia 5.0 em
+    vez de 5; o CSV novo mantém esse formato (uma agregação antes da leitura).
+    """
+    agregados = ", ".join(
+        f"MAX(typeof({c}) = 'integer'), MAX(typeof({c}) IN ('real', 'null')), MAX(typeof({c}) IN ('text', 'blob'))"
+        for c in (citar(nome) for nome, _ in colunas)
+    )
+    sql, parametros = _consulta(nome_tabela, colunas, redes, estados, selecao=agregados)
+    tipos = con.execute(sql, parametros).fetchone()
+    return [k for k in range(len(colunas))
+            if tipos[3 * k] and tipos[3 * k + 1] and not tipos[3 * k + 2]]
+
+
+def exportar_tabela(banco_dados, nome_tabela, pasta_saida=".", formato="csv",
+                    redes=None, estados=None, chunk=CHUNK_LINHAS):
+    """
+    Exporta uma tabela em blocos de `chunk` linhas para
+    <pasta_saida>/<nome_tabela>.<formato>. Retorna o número de registros
+    exportados ou None se a tabela não existir ou não tiver a coluna de um
+    filtro pedido (rede/estado_cdn).
+    """
+    if formato not in FORMATOS:
+        raise ValueError(f"formato deve ser um de {FORMATOS}: {formato!r}")
 
-def exportar_sqlite_para_csv(banco_dados, pasta_saida="."):
-    # Conecta ao banco
     con = sqlite3.connect(banco_dados)
+    try:
+        # Nome validado contra o sqlite_master antes de ir para o SQL
+        if nome_tabela not in listar_tabelas(con):
+            print(f"⚠️ Tabela '{nome_tabela}' não encontrada no banco de dados.")
+            return None
+
+        os.makedirs(pasta_saida, exist_ok=True)
+        caminho_arquivo = os.path.join(pasta_saida, f"{nome_tabela}.{EXTENSOES[formato]}")
+        temporario = caminho_arquivo + ".tmp"
 
-    # Descobre todas as tabelas do banco
-    tabelas = pd.read_sql_query("SELECT name FROM sqlite_master WHERE type='table';", con)
+        colunas = colunas_tabela(con, nome_tabela)
+        ausentes = _filtros_ausentes(colunas, redes, estados)
+        if ausentes:
+            # Exportar a tabela inteira ignorando o filtro pedido seria enganoso
+            print(f"⚠️ Tabela '{nome_tabela}' ignorada: não tem a(s) coluna(s) de filtro {', '.join(ausentes)}.")
+            return None
+
+        sql, parametros = _consulta(nome_tabela, colunas, redes, estados)
+        cursor = con.execute(sql, parametros)
+        nomes = [descricao[0] for descricao in cursor.description]
+
+        total = 0
+        if formato == "csv":
+            como_float = _colunas_inteiras_como_float(con, nome_tabela, colunas, redes, estados)
+            with open(temporario, "w", newline="", encoding="utf-8-sig") as f:
+                escritor = csv.writer(f, lineterminator="\n")
+                escritor.writerow(nomes)
+                while True:
+                    linhas = cursor.fetchmany(chunk)
+                    if not linhas:
+                        break
+                    if como_float:
+                        linhas = [list(linha) for linha in linhas]
+                        for linha in linhas:
+                            for k in como_float:
+                                if isinstance(linha[k], int):
+                                    linha[k] = float(linha[k])
+                    escritor.writerows(linhas)
+                    total += len(linhas)
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            tipos = dict(colunas)
+            schema = pa.schema([(nome, _tipo_arrow(tipos.get(nome, ""))) for nome in nomes])
+            if formato == "parquet":
+                escritor = pq.ParquetWriter(temporario, schema, compression="zstd")
+            else:
+                escritor = pa.ipc.new_file(temporario, schema,
+                                           options=pa.ipc.IpcWriteOptions(compression="zstd"))
+            try:
+                while True:
+                    linhas = cursor.fetchmany(chunk)
+                    if not linhas:
+                        break
+                    colunas_bloco = list(zip(*linhas))
+                    bloco = pa.Table.from_arrays(
+                        [_coluna_arrow(valores, campo.type) for valores, campo in zip(colunas_bloco, schema)],
+                        schema=schema
+                    )
+                    escritor.write_table(bloco)
+                    total += len(linhas)
+            finally:
+                escritor.close()
+
+        os.replace(temporario, caminho_arquivo)
+        print(f"✅ Tabela '{nome_tabela}' exportada para: {caminho_arquivo} ({total} registros)")
+        return total
+    finally:
+        con.close()
 
-    if tabelas.empty:
+
+# =========================
+# Exportação de várias tabelas
+# =========================
+def exportar_tabelas(banco_dados, pasta_saida=".", tabelas=None, formatos=("csv",),
+                     redes=None, estados=None, n_threads=N_THREADS, chunk=CHUNK_LINHAS):
+    """
+    Exporta várias tabelas (default: todas) em cada formato pedido, em
+    paralelo. Retorna {(tabela, formato): registros exportados}.
+    """
+    con = sqlite3.connect(banco_dados)
+    try:
+        existentes = listar_tabelas(con)
+    finally:
+        con.close()
+
+    tabelas = existentes if tabelas is None else [t for t in tabelas if t in existentes]
+    if not tabelas:
         print("⚠️ Nenhuma tabela encontrada no banco de dados.")
-        return
+        return {}
+
+    tarefas = [(tabela, formato) for tabela in tabelas for formato in formatos]
+    with ThreadPoolExecutor(max_workers=max(1, min(n_threads, len(tarefas)))) as executor:
+        futuros = {
+            tarefa: executor.submit(exportar_tabela, banco_dados, tarefa[0], pasta_saida, tarefa[1],
+                                    redes, estados, chunk)
+            for tarefa in tarefas
+        }
+        return {tarefa: futuro.result() for tarefa, futuro in futuros.items()}
 
-    # Cria a pasta de saída, se não existir
-    os.makedirs(pasta_saida, exist_ok=True)
 
-    # Exporta cada tabela
-    for tabela in tabelas['name']:
-        df = pd.read_sql_query(f"SELECT * FROM {tabela};", con)
-        caminho_arquivo = os.path.join(pasta_saida, f"{tabela}.csv")
-        df.to_csv(caminho_arquivo, index=False, encoding="utf-8-sig")
-        print(f"✅ Tabela '{tabela}' exportada para: {caminho_arquivo}")
+def exportar_tabela_para_csv(banco_dados, nome_tabela, pasta_saida="."):
+    total = exportar_tabela(banco_dados, nome_tabela, pasta_saida, "csv")
+    if total is not None:
+        print(f"📊 Total de registros: {total}")
+        print(f"\n🎉 Exportação da tabela '{nome_tabela}' concluída com sucesso!")
+
+
+def exportar_sqlite_para_csv(banco_dados, pasta_saida="."):
+    if exportar_tabelas(banco_dados, pasta_saida, formatos=("csv",)):
+        print("\n🎉 Exportação concluída com sucesso!")
 
-    con.close()
-    print("\n🎉 Exportação concluída com sucesso!")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exporta tabelas do banco SQLite em blocos")
     # Caminho para seu banco de dados
-    banco = "./unidades.db"
-    # Pasta onde os CSVs serão salvos
-    pasta = "./exportados"
-    # Nome da tabela a ser exportada
-    tabela = "unidades"
+    parser.add_argument("--banco", default="./unidades.db")
+    # Pasta onde os arquivos serão salvos
+    parser.add_argument("--pasta", default="./exportados")
+    # Tabelas a exportar ("todas" = todas as tabelas do banco)
+    parser.add_argument("--tabelas", nargs="+", default=["unidades"])
+    parser.add_argument("--formatos", nargs="+", choices=FORMATOS, default=["csv"])
+    parser.add_argument("--rede", nargs="+", help="filtra pela coluna rede")
+    parser.add_argument("--estado", nargs="+", help="filtra pela coluna estado_cdn")
+    args = parser.parse_args()
 
-    exportar_tabela_para_csv(banco, tabela, pasta)
+    tabelas = None if args.tabelas == ["todas"] else args.tabelas
+    resultado = exportar_tabelas(args.banco, args.pasta, tabelas, args.formatos, args.rede, args.estado)
+    if resultado:
+        print(f"\n🎉 Exportação concluída: {sum(v or 0 for v in resultado.values())} registros "
+              f"em {len(resultado)} arquivo(s)")
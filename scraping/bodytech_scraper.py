@@ -92,10 +92,11 @@ def extrair_servicos(servicos_element):
 def coletar_unidades_bodytech_incremental():
     """
     Coleta unidades da BodyTech de forma incremental, evitando duplicatas
-    e salvando apenas novas unidades no banco de dados
+    e sincronizando o resultado completo com o banco de dados
     """
     url = "https://www.bodytech.com.br/academias"
     unidades_novas = []
+    unidades_coletadas = []  # Resultado completo da raspagem (sincronizado no fim)
     unidades_processadas = set()  # Para evitar duplicatas nesta execução
     
     # Inicializa banco e carrega unidades existentes
@@ -229,6 +230,7 @@ def coletar_unidades_bodytech_incremental():
                         "data_atualizacao": None
                     }
                     
+                    unidades_coletadas.append(unidade)
                     # Verifica se é uma unidade nova (não existe no banco)
                     if nome not in unidades_existentes:
                         unidades_novas.append(unidade)
@@ -268,13 +270,14 @@ def coletar_unidades_bodytech_incremental():
 
         browser.close()
     
-    # Salva as novas unidades no banco
-    if unidades_novas:
-        print(f"\n💾 Salvando {len(unidades_novas)} novas unidades no banco...")
-        unidades_salvas = db.inserir_multiplas_unidades_dinamico(unidades_novas)
-        print(f"✅ {unidades_salvas} unidades salvas com sucesso!")
+    # Sincroniza o resultado completo: insere as novas e atualiza só as que mudaram
+    if unidades_coletadas:
+        print(f"\n💾 Sincronizando {len(unidades_coletadas)} unidades coletadas com o banco...")
+        resultado = db.sincronizar_unidades(unidades_coletadas)
+        print(f"✅ {resultado['inseridas']} novas, {resultado['atualizadas']} atualizadas, "
+              f"{resultado['inalteradas']} sem mudanças")
     else:
-        print("\nℹ️ Nenhuma nova unidade encontrada!")
+        print("\nℹ️ Nenhuma unidade coletada!")
     
     # Gera estatísticas e JSON atualizado
     estatisticas = db.estatisticas()
@@ -13,21 +13,15 @@ except ImportError:
     print("❌ Erro ao importar módulos do banco.")
     sys.exit(1)
 
-def preparar_unidade_dinamica(nome, dados_coletados, db, tabela="unidades"):
+def preparar_unidade_dinamica(nome, dados_coletados):
     """
     Prepara um dicionário de unidade pronto para inserção.
-    Cria colunas novas automaticamente se necessário.
     Serializa dict/list em JSON quando necessário.
+    As colunas novas são criadas de uma vez para o lote inteiro
+    (db.garantir_colunas) antes da sincronização.
     """
-    colunas_existentes = db.obter_colunas_tabela(tabela)
-
     unidade_final = {}
     for coluna, valor in dados_coletados.items():
-        if coluna not in colunas_existentes:
-            print(f"⚡ Coluna '{coluna}' não existe, criando no banco...")
-            db.adicionar_coluna(tabela, coluna, tipo="TEXT")
-            colunas_existentes.append(coluna)
-
         # Serializar listas/dicionários para JSON
         if isinstance(valor, (dict, list)):
             unidade_final[coluna] = json.dumps(valor, ensure_ascii=False)
@@ -44,15 +38,12 @@ def preparar_unidade_dinamica(nome, dados_coletados, db, tabela="unidades"):
 def coletar_unidades_panobianco():
     url = "https://panobiancoacademia.com.br/unidades/"
     unidades_novas = []
+    unidades_coletadas = []  # Resultado completo da raspagem (sincronizado no fim)
     unidades_processadas = set()
 
     print("🗄️ Conectando ao banco de dados...")
     db = Database()
 
-    # ⚡ Garantir que os campos planos e beneficios existam
-    db.adicionar_coluna("unidades", "planos", "TEXT")
-    db.adicionar_coluna("unidades", "beneficios", "TEXT")
-
     unidades_existentes = db.buscar_nomes_existentes()
     print(f"📊 Unidades já existentes no banco: {len(unidades_existentes)}")
 
@@ -117,12 +108,12 @@ def coletar_unidades_panobianco():
                         "beneficios": beneficios
                     }
 
-                    unidade = preparar_unidade_dinamica(nome, dados_coletados, db)
+                    unidade = preparar_unidade_dinamica(nome, dados_coletados)
+                    unidades_coletadas.append(unidade)
 
                     if nome not in unidades_existentes:
-                        db.inserir_unidade(unidade)
                         unidades_novas.append(unidade)
-                        print(f"🆕 NOVA unidade salva: {nome}")
+                        print(f"🆕 NOVA unidade encontrada: {nome}")
                     else:
                         print(f"ℹ️ Unidade já existe: {nome}")
 
@@ -153,8 +144,15 @@ def coletar_unidades_panobianco():
 
         browser.close()
 
-    if unidades_novas:
-        print(f"\n💾 Total de novas unidades salvas: {len(unidades_novas)}")
+    # Sincroniza o resultado completo: insere as novas e atualiza só as que mudaram
+    if unidades_coletadas:
+        # ⚡ Colunas novas (ex: planos, beneficios) criadas em uma passada só para o lote inteiro
+        db.garantir_colunas("unidades", {coluna for unidade in unidades_coletadas for coluna in unidade})
+
+        print(f"\n💾 Sincronizando {len(unidades_coletadas)} unidades coletadas com o banco...")
+        resultado = db.sincronizar_unidades(unidades_coletadas)
+        print(f"✅ {resultado['inseridas']} novas, {resultado['atualizadas']} atualizadas, "
+              f"{resultado['inalteradas']} sem mudanças")
 
     estatisticas = db.estatisticas()
     print(f"\n📈 Estatísticas do banco:")
@@ -9,7 +9,6 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 try:
     from database.db import Database
-    from database.models import Unidade
 except ImportError:
     print("❌ Erro ao importar módulos do banco.")
     sys.exit(1)
@@ -59,6 +58,7 @@ def coletar_unidades_pratique_incremental():
     """
     url = "https://pratiquefitness.com.br/unidades"
     unidades_novas = []
+    unidades_coletadas = []  # Resultado completo da raspagem (sincronizado no fim)
     unidades_processadas = set()  # Para evitar duplicatas nesta execução
     
     # Inicializa banco e carrega unidades existentes
@@ -156,30 +156,15 @@ def coletar_unidades_pratique_incremental():
                         "data_atualizacao": None
                     }
                     
+                    unidades_coletadas.append(unidade)
                     # Verifica se é uma unidade nova (não existe no banco)
                     if nome not in unidades_existentes:
                         unidades_novas.append(unidade)
                         print(f"🆕 NOVA unidade encontrada: {nome}")
                     else:
-                        # ATUALIZA a unidade existente com o endereço correto
-                        print(f"🔄 ATUALIZANDO unidade existente: {nome}")
-                        try:
-                            # Busca a unidade existente no banco
-                            session = db.Session()
-                            unidade_existente = session.query(Unidade).filter_by(nome=nome).first()
-                            if unidade_existente:
-                                # Atualiza os campos
-                                unidade_existente.endereco = endereco
-                                unidade_existente.cidade = cidade
-                                unidade_existente.estado = estado
-                                unidade_existente.link_matricula = link_matricula
-                                session.commit()
-                                print(f"    ✅ Atualizada: endereço='{endereco}', cidade='{cidade}', estado='{estado}'")
-                            session.close()
-                        except Exception as e:
-                            print(f"    ❌ Erro ao atualizar: {e}")
-                            if 'session' in locals():
-                                session.close()
+                        # Endereço/cidade/estado/link de unidades existentes são
+                        # atualizados na sincronização, só se tiverem mudado
+                        print(f"ℹ️ Unidade já existe: {nome}")
                     
                     unidades_processadas.add(nome)
                     novos_cards += 1
@@ -211,13 +196,14 @@ def coletar_unidades_pratique_incremental():
 
         browser.close()
     
-    # Salva as novas unidades no banco
-    if unidades_novas:
-        print(f"\n💾 Salvando {len(unidades_novas)} novas unidades no banco...")
-        unidades_salvas = db.inserir_multiplas_unidades_dinamico(unidades_novas)
-        print(f"✅ {unidades_salvas} unidades salvas com sucesso!")
+    # Sincroniza o resultado completo: insere as novas e atualiza só as que mudaram
+    if unidades_coletadas:
+        print(f"\n💾 Sincronizando {len(unidades_coletadas)} unidades coletadas com o banco...")
+        resultado = db.sincronizar_unidades(unidades_coletadas)
+        print(f"✅ {resultado['inseridas']} novas, {resultado['atualizadas']} atualizadas, "
+              f"{resultado['inalteradas']} sem mudanças")
     else:
-        print("\nℹ️ Nenhuma nova unidade encontrada!")
+        print("\nℹ️ Nenhuma unidade coletada!")
     
     # Gera estatísticas e JSON atualizado
     estatisticas = db.estatisticas()
@@ -41,6 +41,7 @@ def extrair_endereco_cidade_estado(texto):
 def coletar_unidades_selfit_incremental():
     url = "https://www.selfitacademias.com.br/unidades"
     unidades_novas = []
+    unidades_coletadas = []  # Resultado completo da raspagem (sincronizado no fim)
     unidades_processadas = set()
 
     print("🗄️ Conectando ao banco de dados...")
@@ -101,6 +102,7 @@ def coletar_unidades_selfit_incremental():
                         "data_atualizacao": None
                     }
 
+                    unidades_coletadas.append(unidade)
                     if nome not in unidades_existentes:
                         unidades_novas.append(unidade)
                         print(f"🆕 NOVA unidade encontrada: {nome}")
@@ -136,13 +138,14 @@ def coletar_unidades_selfit_incremental():
 
         browser.close()
 
-    # Salva as novas unidades no banco
-    if unidades_novas:
-        print(f"\n💾 Salvando {len(unidades_novas)} novas unidades no banco...")
-        unidades_salvas = db.inserir_multiplas_unidades_dinamico(unidades_novas)
-        print(f"✅ {unidades_salvas} unidades salvas com sucesso!")
+    # Sincroniza o resultado completo: insere as novas e atualiza só as que mudaram
+    if unidades_coletadas:
+        print(f"\n💾 Sincronizando {len(unidades_coletadas)} unidades coletadas com o banco...")
+        resultado = db.sincronizar_unidades(unidades_coletadas)
+        print(f"✅ {resultado['inseridas']} novas, {resultado['atualizadas']} atualizadas, "
+              f"{resultado['inalteradas']} sem mudanças")
     else:
-        print("\nℹ️ Nenhuma nova unidade encontrada!")
+        print("\nℹ️ Nenhuma unidade coletada!")
 
     # Estatísticas e JSON atualizado
     estatisticas = db.estatisticas()
@@ -12,16 +12,18 @@ except ImportError:
     print("❌ Erro ao importar módulos do banco.")
     sys.exit(1)
 
-BATCH_SIZE = 100  # salva em blocos de 100 unidades
+BATCH_SIZE = 100  # sincroniza em blocos de 100 unidades
 
 def coletar_unidades_skyfit():
     """
-    Coleta unidades da Skyfit de forma incremental, salvando em blocos de 100,
-    evitando duplicatas e garantindo integridade do banco.
+    Coleta unidades da Skyfit de forma incremental, sincronizando em blocos de 100
+    (insere as novas e atualiza só as que mudaram).
     """
     url_base = "https://skyfitacademia.com/unidades/"
     unidades_novas = []
+    unidades_coletadas = []  # Resultado da raspagem ainda não sincronizado
     unidades_processadas = set()
+    totais = {'inseridas': 0, 'atualizadas': 0, 'inalteradas': 0}
     
     print("🗄️ Conectando ao banco de dados...")
     db = Database()
@@ -78,19 +80,21 @@ def coletar_unidades_skyfit():
                         "data_atualizacao": None
                     }
 
+                    unidades_coletadas.append(unidade)
                     if nome not in unidades_existentes:
                         unidades_novas.append(unidade)
                         print(f"🆕 NOVA unidade encontrada: {nome}")
-
-                        # Salva em blocos de BATCH_SIZE
-                        if len(unidades_novas) >= BATCH_SIZE:
-                            print(f"\n💾 Salvando bloco de {len(unidades_novas)} unidades...")
-                            db.inserir_multiplas_unidades_dinamico(unidades_novas)
-                            unidades_novas = []
-
                     else:
                         print(f"ℹ️ Unidade já existe: {nome}")
 
+                    # Sincroniza em blocos de BATCH_SIZE (novas + alteradas)
+                    if len(unidades_coletadas) >= BATCH_SIZE:
+                        print(f"\n💾 Sincronizando bloco de {len(unidades_coletadas)} unidades...")
+                        resultado = db.sincronizar_unidades(unidades_coletadas)
+                        for chave in totais:
+                            totais[chave] += resultado[chave]
+                        unidades_coletadas = []
+
                     unidades_processadas.add(nome)
 
                 except Exception as e:
@@ -110,10 +114,14 @@ def coletar_unidades_skyfit():
 
         browser.close()
 
-    # Salva unidades restantes
-    if unidades_novas:
-        print(f"\n💾 Salvando {len(unidades_novas)} unidades restantes...")
-        db.inserir_multiplas_unidades_dinamico(unidades_novas)
+    # Sincroniza unidades restantes
+    if unidades_coletadas:
+        print(f"\n💾 Sincronizando {len(unidades_coletadas)} unidades restantes...")
+        resultado = db.sincronizar_unidades(unidades_coletadas)
+        for chave in totais:
+            totais[chave] += resultado[chave]
+    print(f"✅ {totais['inseridas']} novas, {totais['atualizadas']} atualizadas, "
+          f"{totais['inalteradas']} sem mudanças")
 
     # Gera estatísticas e JSON atualizado
     estatisticas = db.estatisticas()
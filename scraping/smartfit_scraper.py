@@ -19,10 +19,11 @@ except ImportError:
 def coletar_unidades_smartfit():
     """
     Coleta todas as unidades da Smartfit, evitando duplicatas
-    e salvando apenas novas unidades no banco de dados.
+    e sincronizando o resultado completo com o banco de dados.
     """
     url = "https://www.smartfit.com.br/academias"
     unidades_novas = []
+    unidades_coletadas = []  # Resultado completo da raspagem (sincronizado no fim)
     unidades_processadas = set()  # IDs já processados nesta execução
 
     # Inicializa banco e carrega unidades existentes
@@ -77,7 +78,8 @@ def coletar_unidades_smartfit():
                         "data_atualizacao": None
                     }
 
-                    # Adiciona apenas se não existir no banco
+                    unidades_coletadas.append(unidade)
+                    # Marca como nova se não existir no banco
                     if nome not in unidades_existentes:
                         unidades_novas.append(unidade)
                         print(f"🆕 NOVA unidade encontrada: {nome}")
@@ -113,13 +115,14 @@ def coletar_unidades_smartfit():
 
         browser.close()
 
-    # Salva novas unidades no banco
-    if unidades_novas:
-        print(f"\n💾 Salvando {len(unidades_novas)} novas unidades no banco...")
-        unidades_salvas = db.inserir_multiplas_unidades_dinamico(unidades_novas)
-        print(f"✅ {unidades_salvas} unidades salvas com sucesso!")
+    # Sincroniza o resultado completo: insere as novas e atualiza só as que mudaram
+    if unidades_coletadas:
+        print(f"\n💾 Sincronizando {len(unidades_coletadas)} unidades coletadas com o banco...")
+        resultado = db.sincronizar_unidades(unidades_coletadas)
+        print(f"✅ {resultado['inseridas']} novas, {resultado['atualizadas']} atualizadas, "
+              f"{resultado['inalteradas']} sem mudanças")
     else:
-        print("\nℹ️ Nenhuma nova unidade encontrada!")
+        print("\nℹ️ Nenhuma unidade coletada!")
 
     # Gera estatísticas e JSON atualizado
     estatisticas = db.estatisticas()
@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+"""
+Script para (re)construir a tabela pares_proximos do banco.
+Calcula todos os pares de unidades a até RAIO_MAX_PARES_KM usando o índice espacial.
+Depois disso, Database.atualizar_coordenadas e os geocodificadores mantêm a tabela em dia.
+"""
+
+import sys
+import os
+import time
+
+# Adiciona o diretório pai ao path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.db import Database, RAIO_MAX_PARES_KM
+
+def reconstruir_pares_proximos():
+    """Recalcula a tabela pares_proximos inteira"""
+    print(f"📍 RECONSTRUINDO PARES PRÓXIMOS (até {RAIO_MAX_PARES_KM} km)")
+    print("=" * 60)
+
+    db = Database()
+    inicio = time.time()
+    total = db.atualizar_pares_proximos()
+    print(f"✅ {total} pares gravados em {time.time() - inicio:.1f}s")
+
+if __name__ == "__main__":
+    reconstruir_pares_proximos()
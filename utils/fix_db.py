@@ -8,6 +8,11 @@ import sqlite3
 import os
 import sys
 
+# Adiciona o diretório pai ao path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.migracoes import migrar
+
 def corrigir_tabela_unidades():
     """Corrige a estrutura da tabela unidades adicionando PRIMARY KEY AUTOINCREMENT"""
     
@@ -38,69 +43,15 @@ def corrigir_tabela_unidades():
             print("\n✅ Coluna id já é PRIMARY KEY!")
             return True
         
+        conn.close()
+
+        # Reconstrução feita pelo motor de migrações (uma transação, índices preservados)
         print("\n🔧 Corrigindo estrutura da tabela...")
-        
-        # Cria tabela temporária com estrutura correta
-        print("   1. Criando tabela temporária...")
-        cursor.execute("""
-            CREATE TABLE unidades_temp (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                rede TEXT NOT NULL,
-                nome TEXT NOT NULL UNIQUE,
-                endereco TEXT NOT NULL,
-                cidade TEXT,
-                estado TEXT,
-                cep TEXT,
-                telefone TEXT,
-                latitude TEXT,
-                longitude TEXT,
-                horarios NUMERIC,
-                servicos NUMERIC,
-                link_matricula TEXT,
-                data_criacao NUMERIC,
-                data_atualizacao NUMERIC,
-                "bairro(cdn)" TEXT,
-                "cidade(cdn)" TEXT,
-                "estado(cdn)" TEXT,
-                "pais(cdn)" TEXT
-            )
-        """)
-        
-        # Copia dados existentes
-        print("   2. Copiando dados existentes...")
-        cursor.execute("""
-            INSERT INTO unidades_temp (
-                rede, nome, endereco, cidade, estado, cep, telefone,
-                latitude, longitude, horarios, servicos, link_matricula,
-                data_criacao, data_atualizacao, "bairro(cdn)", "cidade(cdn)",
-                "estado(cdn)", "pais(cdn)"
-            )
-            SELECT 
-                rede, nome, endereco, cidade, estado, cep, telefone,
-                latitude, longitude, horarios, servicos, link_matricula,
-                data_criacao, data_atualizacao, "bairro(cdn)", "cidade(cdn)",
-                "estado(cdn)", "pais(cdn)"
-            FROM unidades
-        """)
-        
-        # Remove tabela antiga
-        print("   3. Removendo tabela antiga...")
-        cursor.execute("DROP TABLE unidades")
-        
-        # Renomeia tabela temporária
-        print("   4. Renomeando tabela corrigida...")
-        cursor.execute("ALTER TABLE unidades_temp RENAME TO unidades")
-        
-        # Cria índices
-        print("   5. Recriando índices...")
-        cursor.execute("CREATE INDEX ix_unidades_rede ON unidades (rede)")
-        cursor.execute("CREATE INDEX ix_unidades_nome ON unidades (nome)")
-        cursor.execute("CREATE INDEX ix_unidades_cidade ON unidades (cidade)")
-        cursor.execute("CREATE INDEX ix_unidades_estado ON unidades (estado)")
-        
-        # Commit das alterações
-        conn.commit()
-        
+        migrar(db_path, versoes=(1,))
+
+        conn = sqlite3.connect(db_path)
+        cursor = conn.cursor()
+
         # Verifica estrutura final
         print("\n📋 Nova estrutura da tabela:")
         cursor.execute("PRAGMA table_info(unidades)")
@@ -119,9 +70,8 @@ def corrigir_tabela_unidades():
         return True
         
     except Exception as e:
+        # migrar desfaz a própria transação; aqui só há leituras
         print(f"\n❌ Erro ao corrigir tabela: {e}")
-        if 'conn' in locals():
-            conn.rollback()
         return False
         
     finally:
@@ -1,5 +1,3 @@
-import requests
-import time
 import sys
 import os
 from sqlalchemy import or_
@@ -10,6 +8,8 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 try:
     from database.db import Database
     from database.models import Unidade
+    from database.cache_geocode import obter_cache
+    from utils.geocode_async import geocodificar, consultar_nominatim
 except ImportError:
     print("❌ Erro ao importar módulos do banco.")
     sys.exit(1)
@@ -19,15 +19,14 @@ def geocodificar_unidades():
     print("🗄️ Conectando ao banco de dados...")
     db = Database()
     session = db.Session()
+    cache = obter_cache()
 
     try:
         # Busca unidades sem coordenadas
         unidades_sem_coords = session.query(Unidade).filter(
             or_(
                 Unidade.latitude.is_(None),
-                Unidade.longitude.is_(None),
-                Unidade.latitude == "",
-                Unidade.longitude == ""
+                Unidade.longitude.is_(None)
             )
         ).all()
 
@@ -36,53 +35,57 @@ def geocodificar_unidades():
 
         sucessos = 0
         falhas = 0
+        ids_atualizados = []
 
-        for i, u in enumerate(unidades_sem_coords, 1):
+        itens = []
+        for u in unidades_sem_coords:
             endereco = u.endereco.strip()
             if not endereco:
-                print(f"[{i}/{total}] ❌ Endereço vazio, pulando: {u.nome}")
+                print(f"❌ Endereço vazio, pulando: {u.nome}")
                 falhas += 1
                 continue
+            itens.append((u, endereco))
 
-            print(f"[{i}/{total}] Geocodificando: {endereco}")
+        concluidas = 0
 
-            # Requisição ao Nominatim usando somente o endereço
-            url = "https://nominatim.openstreetmap.org/search"
-            params = {'q': endereco, 'format': 'json', 'limit': 1}
-            headers = {'User-Agent': 'OpportunityGeocoder/1.0'}
+        def ao_concluir(u, coords, erro, do_cache):
+            # Chamado no loop de eventos, na ordem em que as consultas terminam
+            nonlocal sucessos, falhas, concluidas
+            concluidas += 1
+            origem = " 💾" if do_cache else ""
+            print(f"[{concluidas}/{len(itens)}]{origem} {u.endereco.strip()}")
 
-            try:
-                response = requests.get(url, params=params, headers=headers, timeout=30)
-                response.raise_for_status()
-                data = response.json()
-
-                if data:
-                    lat = data[0].get('lat')
-                    lon = data[0].get('lon')
-                    if lat and lon:
-                        u.latitude = lat
-                        u.longitude = lon
-                        session.commit()
-                        print(f"    ✅ Coordenadas: {lat}, {lon}")
-                        sucessos += 1
-                    else:
-                        print(f"    ❌ Nenhum resultado encontrado")
-                        falhas += 1
-                else:
-                    print(f"    ❌ Nenhum resultado encontrado")
-                    falhas += 1
-
-                time.sleep(3)  # respeita limite de 1 requisição por segundo
-
-            except requests.exceptions.RequestException as e:
-                print(f"    ❌ Erro na requisição: {e}")
+            if erro:
+                print(f"    ❌ Erro na requisição: {erro}")
+                falhas += 1
+                return
+            if not coords:
+                print(f"    ❌ Nenhum resultado encontrado")
                 falhas += 1
+                return
+
+            try:
+                u.latitude = coords['lat']
+                u.longitude = coords['lon']
+                session.commit()
+                print(f"    ✅ Coordenadas: {coords['lat']}, {coords['lon']}")
+                sucessos += 1
+                ids_atualizados.append(u.id)
             except Exception as e:
                 print(f"    ❌ Erro inesperado: {e}")
                 session.rollback()
                 falhas += 1
 
-        print(f"\n🎉 Geocodificação concluída! Sucessos: {sucessos}, Falhas: {falhas}")
+        # Nominatim: limitado a 1 req/s pelo token bucket, sem sleep fixo
+        duracao = geocodificar(itens, "nominatim", consultar_nominatim, ao_concluir,
+                               prefixo_cache="nominatim_busca")
+
+        print(f"\n🎉 Geocodificação concluída em {duracao:.1f}s! Sucessos: {sucessos}, Falhas: {falhas}")
+        print(cache.resumo())
+
+        if ids_atualizados:
+            print(f"📍 Atualizando pares próximos de {len(ids_atualizados)} unidades...")
+            db.atualizar_pares_proximos(ids_atualizados)
 
     finally:
         session.close()
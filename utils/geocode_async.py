@@ -0,0 +1,239 @@
+# =========================
+# geocode_async.py
+# =========================
+"""
+Geocodificação assíncrona limitada só pela cota de cada provedor.
+
+- TokenBucket por provedor com a taxa publicada (QPS) e rajada pequena;
+  serve tanto para corrotinas (adquirir) quanto para threads (adquirir_sync);
+- janela de concorrência limitada (Semaphore) por lote;
+- uma aiohttp.ClientSession com conexões keep-alive por lote;
+- 429/5xx e falhas de conexão → nova tentativa com backoff exponencial
+  (ou Retry-After), pausando o balde do provedor inteiro;
+- respostas (inclusive "nada encontrado") vão para o cache persistente
+  (database/cache_geocode.py), então uma nova execução só consulta a rede
+  para endereços novos.
+
+buscar_json_sync faz o mesmo (balde, keep-alive, backoff) com requests, para
+scripts síncronos ou com threads. aiohttp só é importado dentro das funções
+assíncronas, então o lado síncrono funciona sem ele.
+"""
+import asyncio
+import os
+import random
+import sys
+import threading
+import time
+
+# Adiciona o diretório raiz ao path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.cache_geocode import obter_cache, chave_endereco
+
+# Limites publicados de cada provedor: requisições por segundo, rajada e
+# requisições simultâneas em voo
+PROVEDORES = {
+    "nominatim": {"qps": 1.0, "rajada": 1, "concorrencia": 1},        # política de uso: 1 req/s
+    "geocodio": {"qps": 16.0, "rajada": 16, "concorrencia": 16},      # 1000 req/min
+    "google": {"qps": 50.0, "rajada": 50, "concorrencia": 32},        # 3000 req/min
+}
+TENTATIVAS = 5
+BACKOFF_BASE = 1.0      # s; dobra a cada nova tentativa
+BACKOFF_MAX = 60.0
+TIMEOUT = 30            # s por requisição
+
+
+class ErroGeocode(Exception):
+    """Provedor não respondeu (rede, HTTP ou cota) depois de todas as tentativas"""
+
+
+# =========================
+# Token bucket
+# =========================
+class TokenBucket:
+    """
+    `taxa` tokens por segundo, até `capacidade` acumulados. Cada requisição
+    consome um token. pausar() suspende o balde (ex.: 429 com Retry-After).
+    Estado protegido por threading.Lock, então o mesmo balde limita threads e
+    corrotinas do processo.
+    """
+
+    def __init__(self, taxa, capacidade=1):
+        self.taxa = float(taxa)
+        self.capacidade = float(capacidade)
+        self._tokens = float(capacidade)
+        self._ultimo = time.monotonic()
+        self._pausado_ate = 0.0
+        self._trava = threading.Lock()
+
+    def _reservar(self):
+        """Consome um token se houver; senão devolve quantos segundos esperar"""
+        with self._trava:
+            agora = time.monotonic()
+            if agora < self._pausado_ate:
+                return self._pausado_ate - agora
+            self._tokens = min(self.capacidade, self._tokens + (agora - self._ultimo) * self.taxa)
+            self._ultimo = agora
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.taxa
+
+    async def adquirir(self):
+        while (espera := self._reservar()) > 0:
+            await asyncio.sleep(espera)
+
+    def adquirir_sync(self):
+        while (espera := self._reservar()) > 0:
+            time.sleep(espera)
+
+    def pausar(self, segundos):
+        with self._trava:
+            self._pausado_ate = max(self._pausado_ate, time.monotonic() + segundos)
+            self._tokens = 0.0
+
+
+_baldes = {}
+_trava_baldes = threading.Lock()
+
+
+def obter_balde(provedor):
+    """Um TokenBucket por provedor no processo inteiro"""
+    with _trava_baldes:
+        if provedor not in _baldes:
+            limites = PROVEDORES[provedor]
+            _baldes[provedor] = TokenBucket(limites["qps"], limites["rajada"])
+        return _baldes[provedor]
+
+
+def _espera_backoff(tentativa, retry_after=None):
+    if retry_after:
+        try:
+            return min(float(retry_after), BACKOFF_MAX)
+        except ValueError:
+            pass
+    return min(BACKOFF_BASE * 2 ** tentativa, BACKOFF_MAX) * random.uniform(0.5, 1.0)
+
+
+# =========================
+# Requisições
+# =========================
+async def buscar_json(sessao, provedor, url, params=None, headers=None, metodo="GET", json=None):
+    """
+    Requisição com rate limit do provedor e backoff em 429/5xx/falha de
+    conexão. Levanta ErroGeocode se todas as tentativas falharem.
+    """
+    import aiohttp
+
+    balde = obter_balde(provedor)
+    ultimo_erro = None
+    for tentativa in range(TENTATIVAS):
+        await balde.adquirir()
+        try:
+            async with sessao.request(metodo, url, params=params, headers=headers, json=json) as resp:
+                if resp.status == 429 or resp.status >= 500:
+                    ultimo_erro = f"HTTP {resp.status}"
+                    espera = _espera_backoff(tentativa, resp.headers.get("Retry-After"))
+                    balde.pausar(espera)
+                    continue
+                if resp.status >= 400:
+                    raise ErroGeocode(f"{provedor}: HTTP {resp.status}")
+                return await resp.json(content_type=None)
+        except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError) as e:
+            ultimo_erro = repr(e)
+            await asyncio.sleep(_espera_backoff(tentativa))
+    raise ErroGeocode(f"{provedor}: {ultimo_erro} após {TENTATIVAS} tentativas")
+
+
+_sessoes = threading.local()
+
+
+def sessao_http():
+    """requests.Session (conexões keep-alive) da thread atual"""
+    import requests
+
+    if not hasattr(_sessoes, "sessao"):
+        _sessoes.sessao = requests.Session()
+    return _sessoes.sessao
+
+
+def buscar_json_sync(provedor, url, params=None, headers=None, metodo="GET", json=None, timeout=TIMEOUT):
+    """Versão síncrona de buscar_json (requests + adquirir_sync), para scripts com threads"""
+    import requests
+
+    balde = obter_balde(provedor)
+    ultimo_erro = None
+    for tentativa in range(TENTATIVAS):
+        balde.adquirir_sync()
+        try:
+            resp = sessao_http().request(metodo, url, params=params, headers=headers, json=json, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            ultimo_erro = repr(e)
+            time.sleep(_espera_backoff(tentativa))
+            continue
+        if resp.status_code == 429 or resp.status_code >= 500:
+            ultimo_erro = f"HTTP {resp.status_code}"
+            balde.pausar(_espera_backoff(tentativa, resp.headers.get("Retry-After")))
+            continue
+        if resp.status_code >= 400:
+            raise ErroGeocode(f"{provedor}: HTTP {resp.status_code}")
+        return resp.json()
+    raise ErroGeocode(f"{provedor}: {ultimo_erro} após {TENTATIVAS} tentativas")
+
+
+async def consultar_nominatim(sessao, endereco):
+    """{'lat', 'lon'} do primeiro resultado do Nominatim, ou None"""
+    data = await buscar_json(
+        sessao, "nominatim", "https://nominatim.openstreetmap.org/search",
+        params={'q': endereco, 'format': 'json', 'limit': 1},
+        headers={'User-Agent': 'OpportunityGeocoder/1.0'}
+    )
+    if data and data[0].get('lat') and data[0].get('lon'):
+        return {'lat': data[0]['lat'], 'lon': data[0]['lon']}
+    return None
+
+
+# =========================
+# Pipeline
+# =========================
+async def _geocodificar(itens, provedor, consultar, ao_concluir, prefixo_cache, concorrencia):
+    import aiohttp
+
+    cache = obter_cache()
+    janela = asyncio.Semaphore(concorrencia or PROVEDORES[provedor]["concorrencia"])
+    conector = aiohttp.TCPConnector(limit=PROVEDORES[provedor]["concorrencia"], keepalive_timeout=60)
+    timeout = aiohttp.ClientTimeout(total=TIMEOUT)
+
+    async with aiohttp.ClientSession(connector=conector, timeout=timeout) as sessao:
+        async def processar(item, endereco):
+            chave = chave_endereco(prefixo_cache or provedor, endereco)
+            encontrado, dados = cache.obter(chave)
+            if encontrado:
+                return item, dados, None, True
+            async with janela:
+                try:
+                    dados = await consultar(sessao, endereco)
+                except Exception as e:
+                    # ErroGeocode ou resposta inesperada (ex.: página HTML de
+                    # manutenção no lugar do JSON): falha só deste item
+                    return item, None, e, False
+            cache.guardar(chave, dados)
+            return item, dados, None, False
+
+        tarefas = [asyncio.create_task(processar(item, endereco)) for item, endereco in itens]
+        for concluida in asyncio.as_completed(tarefas):
+            ao_concluir(*await concluida)
+
+
+def geocodificar(itens, provedor, consultar, ao_concluir, prefixo_cache=None, concorrencia=None):
+    """
+    Geocodifica [(item, endereco)] concorrentemente. Para cada um, na ordem
+    em que terminam, chama ao_concluir(item, dados, erro, do_cache):
+    dados None = nada encontrado (ou erro, se `erro` não for None; qualquer
+    exceção da consulta vira erro do item, o lote continua).
+    `consultar(sessao, endereco)` é a corrotina do provedor e `prefixo_cache`
+    separa no cache variantes de consulta do mesmo provedor.
+    """
+    inicio = time.perf_counter()
+    asyncio.run(_geocodificar(itens, provedor, consultar, ao_concluir, prefixo_cache, concorrencia))
+    return time.perf_counter() - inicio
@@ -1,8 +1,7 @@
-import requests
-import time
+import argparse
 import sys
 import os
-from sqlalchemy import or_
+from sqlalchemy import or_, select, update
 from dotenv import load_dotenv  # <-- para ler o .env
 
 # Carrega variáveis de ambiente do arquivo .env na raiz
@@ -14,30 +13,78 @@ if not API_KEY:
     print("❌ ERRO: variável GEOCODIO_API_KEY não encontrada no .env")
     sys.exit(1)
 
+# URL base da API (trocável para apontar para um servidor de teste local)
+GEOCODIO_URL = os.getenv("GEOCODIO_URL", "https://api.geocod.io/v1.7").rstrip("/")
+
+# Endereços por POST no modo em lote (o endpoint aceita até 10.000)
+TAMANHO_LOTE = int(os.getenv("GEOCODIO_LOTE", "100"))
+TIMEOUT_LOTE = 600  # s; lotes grandes demoram para o Geocod.io processar
+
 # Adiciona o diretório raiz ao path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 try:
     from database.db import Database
     from database.models import Unidade
+    from database.cache_geocode import obter_cache, chave_endereco
+    from utils.geocode_async import buscar_json_sync, ErroGeocode
 except ImportError:
     print("❌ Erro ao importar módulos do banco.")
     sys.exit(1)
 
 
-def geocodificar_unidades():
+def _coordenadas(resposta):
+    """{'lat', 'lon'} do primeiro resultado de uma resposta do Geocod.io, ou None"""
+    resultados = (resposta or {}).get("results") or []
+    if not resultados:
+        return None
+    loc = resultados[0]["location"]
+    return {"lat": loc["lat"], "lon": loc["lng"]}
+
+
+def geocodificar_endereco(endereco):
+    """Um endereço por GET /geocode"""
+    data = buscar_json_sync("geocodio", f"{GEOCODIO_URL}/geocode", params={"q": endereco, "api_key": API_KEY})
+    return _coordenadas(data)
+
+
+def geocodificar_lote(enderecos):
+    """
+    Lista de endereços em um único POST /geocode. A resposta vem na mesma
+    ordem do envio: devolve [coords ou None] alinhado por índice.
+    """
+    data = buscar_json_sync("geocodio", f"{GEOCODIO_URL}/geocode", params={"api_key": API_KEY},
+                            metodo="POST", json=list(enderecos), timeout=TIMEOUT_LOTE)
+    resultados = data.get("results") or []
+    if len(resultados) != len(enderecos):
+        raise ErroGeocode(f"geocodio: {len(resultados)} resultados para {len(enderecos)} endereços")
+    # Erro de um endereço só (ex: endereço inválido) vem em response.error: conta como "nada encontrado"
+    return [_coordenadas(r.get("response")) for r in resultados]
+
+
+def _gravar(session, atualizacoes):
+    """Um único UPDATE em massa (executemany por chave primária) para o lote"""
+    if atualizacoes:
+        session.execute(update(Unidade), atualizacoes)
+        session.commit()
+
+
+def geocodificar_unidades(tamanho_lote=TAMANHO_LOTE, individual=False, db=None, cache=None):
+    if tamanho_lote < 1:
+        raise ValueError(f"tamanho_lote deve ser maior que zero: {tamanho_lote}")
     print("🗄️ Conectando ao banco de dados...")
-    db = Database()
+    db = db or Database()
+    cache = cache or obter_cache()
     session = db.Session()
 
     try:
         # Busca unidades sem coordenadas
-        unidades_sem_coords = session.query(Unidade).filter(
-            or_(
-                Unidade.latitude.is_(None),
-                Unidade.longitude.is_(None),
-                Unidade.latitude == "",
-                Unidade.longitude == ""
+        unidades_sem_coords = session.execute(
+            select(Unidade.id, Unidade.nome, Unidade.endereco).where(
+                or_(
+                    Unidade.latitude.is_(None),
+                    Unidade.longitude.is_(None)
+                )
             )
         ).all()
 
@@ -46,54 +93,94 @@ def geocodificar_unidades():
 
         sucessos = 0
         falhas = 0
+        ids_atualizados = []
 
-        for i, u in enumerate(unidades_sem_coords, 1):
-            endereco = u.endereco.strip()
+        # Cache persistente primeiro: só os endereços novos vão para a API
+        do_cache, pendentes = [], []
+        for u in unidades_sem_coords:
+            endereco = (u.endereco or "").strip()
             if not endereco:
-                print(f"[{i}/{total}] ❌ Endereço vazio, pulando: {u.nome}")
+                print(f"❌ Endereço vazio, pulando: {u.nome}")
                 falhas += 1
                 continue
+            encontrado, coords = cache.obter(chave_endereco("geocodio", endereco))
+            if not encontrado:
+                pendentes.append((u.id, endereco))
+            elif coords:
+                do_cache.append({"id": u.id, "latitude": coords["lat"], "longitude": coords["lon"]})
+            else:
+                falhas += 1
 
-            print(f"[{i}/{total}] Geocodificando (Geocod.io): {endereco}")
-
-            # Requisição ao Geocod.io
-            url = "https://api.geocod.io/v1.7/geocode"
-            params = {"q": endereco, "api_key": API_KEY}
-
-            try:
-                response = requests.get(url, params=params, timeout=30)
-                response.raise_for_status()
-                data = response.json()
-
-                if data.get("results"):
-                    loc = data["results"][0]["location"]
-                    lat, lon = loc["lat"], loc["lng"]
-
-                    u.latitude = lat
-                    u.longitude = lon
-                    session.commit()
-
-                    print(f"    ✅ Coordenadas: {lat}, {lon}")
-                    sucessos += 1
+        _gravar(session, do_cache)
+        sucessos += len(do_cache)
+        ids_atualizados.extend(a["id"] for a in do_cache)
+        print(f"💾 {len(do_cache)} coordenadas do cache, {len(pendentes)} endereços para o Geocod.io")
+
+        modo = "individual" if individual else f"lotes de {tamanho_lote}"
+        for inicio in range(0, len(pendentes), tamanho_lote):
+            lote = pendentes[inicio:inicio + tamanho_lote]
+            enderecos = [endereco for _, endereco in lote]
+            print(f"[{inicio + len(lote)}/{len(pendentes)}] Geocodificando (Geocod.io, {modo})...")
+
+            if individual:
+                # Qualquer erro (rede, HTTP, resposta malformada) só tira aquele endereço do lote
+                resultados = []
+                for endereco in enderecos:
+                    try:
+                        resultados.append(geocodificar_endereco(endereco))
+                    except Exception as e:
+                        print(f"    ❌ Erro na requisição ({endereco}): {e}")
+                        resultados.append(e)
+            else:
+                try:
+                    resultados = geocodificar_lote(enderecos)
+                except Exception as e:
+                    print(f"    ❌ Erro na requisição: {e}")
+                    falhas += len(lote)
+                    continue
+
+            atualizacoes = []
+            for (unidade_id, endereco), coords in zip(lote, resultados):
+                if isinstance(coords, Exception):
+                    continue  # erro não vai para o cache
+                cache.guardar(chave_endereco("geocodio", endereco), coords)
+                if coords:
+                    atualizacoes.append({"id": unidade_id, "latitude": coords["lat"], "longitude": coords["lon"]})
                 else:
-                    print(f"    ❌ Nenhum resultado encontrado")
-                    falhas += 1
-
-                time.sleep(0.5)  # respeita limites de uso da API
+                    print(f"    ❌ Nenhum resultado encontrado: {endereco}")
 
-            except requests.exceptions.RequestException as e:
-                print(f"    ❌ Erro na requisição: {e}")
-                falhas += 1
+            try:
+                _gravar(session, atualizacoes)
             except Exception as e:
                 print(f"    ❌ Erro inesperado: {e}")
                 session.rollback()
-                falhas += 1
+                falhas += len(lote)
+                continue
+
+            sucessos += len(atualizacoes)
+            falhas += len(lote) - len(atualizacoes)
+            ids_atualizados.extend(a["id"] for a in atualizacoes)
+            print(f"    ✅ {len(atualizacoes)}/{len(lote)} coordenadas gravadas")
 
         print(f"\n🎉 Geocodificação concluída! Sucessos: {sucessos}, Falhas: {falhas}")
+        print(cache.resumo())
+
+        if ids_atualizados:
+            print(f"📍 Atualizando pares próximos de {len(ids_atualizados)} unidades...")
+            db.atualizar_pares_proximos(ids_atualizados)
+
+        return {"sucessos": sucessos, "falhas": falhas, "ids": ids_atualizados}
 
     finally:
         session.close()
 
 
 if __name__ == "__main__":
-    geocodificar_unidades()
+    parser = argparse.ArgumentParser(description="Geocodifica unidades sem coordenadas com o Geocod.io")
+    parser.add_argument("--lote", type=int, default=TAMANHO_LOTE, help="endereços por requisição")
+    parser.add_argument("--individual", action="store_true", help="um GET por endereço (sem o endpoint em lote)")
+    args = parser.parse_args()
+    if args.lote < 1:
+        parser.error("--lote deve ser maior que zero")
+
+    geocodificar_unidades(tamanho_lote=args.lote, individual=args.individual)
@@ -1,7 +1,9 @@
-import requests
-import time
 import sys
 import os
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from dotenv import load_dotenv
 from sqlalchemy import or_
 
@@ -16,6 +18,8 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 try:
     from database.db import Database
     from database.models import Unidade
+    from database.cache_geocode import obter_cache, chave_endereco, chave_coordenadas
+    from utils.geocode_async import buscar_json_sync, PROVEDORES
 except ImportError:
     print("❌ Erro ao importar módulos do banco.")
     sys.exit(1)
@@ -30,8 +34,12 @@ def extrair_componente(components, tipos):
     return None
 
 
-def geocode_nominatim(query=None, lat=None, lon=None):
-    """Geocodificação Nominatim (forward ou reverse)."""
+def _chave(provedor, query, lat, lon):
+    return chave_endereco(provedor, query) if query else chave_coordenadas(provedor, lat, lon)
+
+
+def _nominatim(query=None, lat=None, lon=None):
+    """Consulta o Nominatim; None = nenhum resultado, exceção = erro de rede/HTTP."""
     url = "https://nominatim.openstreetmap.org/search" if query else "https://nominatim.openstreetmap.org/reverse"
     params = {"format": "json", "addressdetails": 1, "limit": 1, "countrycodes": "br"}
     headers = {"User-Agent": "geocode-script (contato@seudominio.com)"}
@@ -42,59 +50,245 @@ def geocode_nominatim(query=None, lat=None, lon=None):
         params["lat"] = lat
         params["lon"] = lon
 
+    data = buscar_json_sync("nominatim", url, params=params, headers=headers)
+    if not data or (not query and "error" in data):
+        return None
+    place = data[0] if query else data
+    addr = place.get("address", {})
+    return {
+        "lat": place.get("lat"),
+        "lon": place.get("lon"),
+        "bairro": addr.get("suburb") or addr.get("neighbourhood"),
+        "cidade": addr.get("city") or addr.get("town") or addr.get("municipality"),
+        "estado": addr.get("state"),
+        "pais": addr.get("country")
+    }
+
+
+def geocode_nominatim(query=None, lat=None, lon=None):
+    """Geocodificação Nominatim (forward ou reverse), com cache persistente."""
     try:
-        resp = requests.get(url, params=params, headers=headers, timeout=30)
-        resp.raise_for_status()
-        data = resp.json()
-        if not data:
-            return None
-        place = data[0] if query else data
-        addr = place.get("address", {})
-        return {
-            "lat": place.get("lat"),
-            "lon": place.get("lon"),
-            "bairro": addr.get("suburb") or addr.get("neighbourhood"),
-            "cidade": addr.get("city") or addr.get("town") or addr.get("municipality"),
-            "estado": addr.get("state"),
-            "pais": addr.get("country")
-        }
+        dados = obter_cache().consultar(_chave("nominatim", query, lat, lon),
+                                        lambda: _nominatim(query, lat, lon))
+        return dict(dados) if dados else None
     except Exception as e:
         print(f"    ❌ Erro Nominatim: {e}")
     return None
 
 
-def geocode_google(query=None, lat=None, lon=None):
-    """Geocodificação Google (forward ou reverse)."""
+def _google(query=None, lat=None, lon=None):
+    """Consulta o Google; None = ZERO_RESULTS, exceção = erro de rede/HTTP/cota."""
     url = "https://maps.googleapis.com/maps/api/geocode/json"
     params = {"key": API_KEY, "region": "BR"}
     if query:
         params["address"] = query
-    elif lat and lon:
-        params["latlng"] = f"{lat},{lon}"
     else:
+        params["latlng"] = f"{lat},{lon}"
+
+    data = buscar_json_sync("google", url, params=params)
+    if data['status'] == 'ZERO_RESULTS' or (data['status'] == 'OK' and not data['results']):
+        return None
+    if data['status'] != 'OK':
+        # OVER_QUERY_LIMIT, REQUEST_DENIED, ...: não é "nada encontrado", não vai para o cache
+        raise RuntimeError(f"status {data['status']}")
+    result = data['results'][0]
+    location = result['geometry']['location']
+    components = result.get('address_components', [])
+    return {
+        "lat": location.get('lat'),
+        "lon": location.get('lng'),
+        "bairro": extrair_componente(components, ['sublocality', 'sublocality_level_1', 'neighborhood']),
+        "cidade": extrair_componente(components, ['locality', 'administrative_area_level_2']),
+        "estado": extrair_componente(components, ['administrative_area_level_1']),
+        "pais": extrair_componente(components, ['country'])
+    }
+
+
+def geocode_google(query=None, lat=None, lon=None):
+    """Geocodificação Google (forward ou reverse), com cache persistente."""
+    if not query and not (lat and lon):
         return None
 
     try:
-        resp = requests.get(url, params=params, timeout=30)
-        resp.raise_for_status()
-        data = resp.json()
-        if data['status'] == 'OK' and data['results']:
-            result = data['results'][0]
-            location = result['geometry']['location']
-            components = result.get('address_components', [])
-            return {
-                "lat": location.get('lat'),
-                "lon": location.get('lng'),
-                "bairro": extrair_componente(components, ['sublocality', 'sublocality_level_1', 'neighborhood']),
-                "cidade": extrair_componente(components, ['locality', 'administrative_area_level_2']),
-                "estado": extrair_componente(components, ['administrative_area_level_1']),
-                "pais": extrair_componente(components, ['country'])
-            }
+        dados = obter_cache().consultar(_chave("google", query, lat, lon),
+                                        lambda: _google(query, lat, lon))
+        return dict(dados) if dados else None
     except Exception as e:
         print(f"    ❌ Erro Google: {e}")
     return None
 
 
+# =========================
+# Cascata de estratégias
+# =========================
+CAMPOS = ["lat", "lon", "bairro", "cidade", "estado", "pais"]
+ATRIBUTOS = {"lat": "latitude", "lon": "longitude", "bairro": "bairro_cdn",
+             "cidade": "cidade_cdn", "estado": "estado_cdn", "pais": "pais_cdn"}
+N_THREADS = 8
+ESTATISTICAS_FILE = "./exportados/estatisticas_cascata_geocode.json"
+
+
+def _endereco(u):
+    return u.endereco.strip() if u.endereco else ""
+
+
+def _consulta(*partes):
+    """Argumentos de consulta direta (None se não há endereço)"""
+    return lambda u: {"query": ", ".join(p(u) for p in partes)} if _endereco(u) else None
+
+
+def _reversa(u):
+    """Reverse só completa colunas *_cdn: não se aplica sem coordenadas ou com todas preenchidas"""
+    if not (u.latitude and u.longitude):
+        return None
+    if all([u.bairro_cdn, u.cidade_cdn, u.estado_cdn, u.pais_cdn]):
+        return None
+    return {"lat": u.latitude, "lon": u.longitude}
+
+
+# (nome, provedor, função, argumentos a partir da unidade ou None se não se
+# aplica, nível). A ordem da lista é a prioridade na hora de mesclar
+# resultados parciais. O nível 1 (endereço nos dois provedores) é disparado
+# junto; cada nível seguinte só entra se os anteriores responderam sem
+# completar a unidade ou se passou PRAZO_ESCALONAR_S sem resposta.
+ESTRATEGIAS = [
+    ("google_endereco", "google", geocode_google, _consulta(_endereco), 1),
+    ("nominatim_endereco", "nominatim", geocode_nominatim, _consulta(_endereco), 1),
+    ("google_endereco_nome", "google", geocode_google, _consulta(_endereco, lambda u: u.nome), 2),
+    ("nominatim_endereco_nome", "nominatim", geocode_nominatim, _consulta(_endereco, lambda u: u.nome), 2),
+    ("nominatim_endereco_nome_rede", "nominatim", geocode_nominatim,
+     _consulta(_endereco, lambda u: u.nome, lambda u: u.rede), 3),
+    ("google_reverso", "google", geocode_google, _reversa, 4),
+    ("nominatim_reverso", "nominatim", geocode_nominatim, _reversa, 4),
+]
+PRIORIDADE = [e[0] for e in ESTRATEGIAS]
+PRAZO_ESCALONAR_S = 1.5
+CONTADORES = ("disparadas", "respondidas", "com_resultado", "campos_usados", "decisivas", "canceladas")
+
+
+def criar_executores():
+    """
+    Um pool por provedor, do tamanho da concorrência dele (Nominatim: 1).
+    Consultas que esperam a vez ficam na fila do pool e ainda podem ser
+    canceladas; assim o Nominatim (1 req/s) nunca ocupa as threads do Google.
+    """
+    return {provedor: ThreadPoolExecutor(max_workers=min(N_THREADS, PROVEDORES[provedor]["concorrencia"]),
+                                         thread_name_prefix=f"geocode-{provedor}")
+            for provedor in {e[1] for e in ESTRATEGIAS}}
+
+
+def campos_faltando(u):
+    return [c for c in CAMPOS if not getattr(u, ATRIBUTOS[c])]
+
+
+def mesclar(resultados):
+    """Resultado único: cada campo vem da estratégia de maior prioridade que o trouxe"""
+    dados, origem = {}, {}
+    for nome in PRIORIDADE:
+        for campo, valor in (resultados.get(nome) or {}).items():
+            if valor and not dados.get(campo):
+                dados[campo], origem[campo] = valor, nome
+    return dados, origem
+
+
+def _cronometrar(funcao, argumentos, decidida):
+    """(resultado, duração, pulada): pula a consulta se a unidade já foi decidida antes de ela começar"""
+    if decidida.is_set():
+        return None, 0.0, True
+    inicio = time.perf_counter()
+    return funcao(**argumentos), time.perf_counter() - inicio, False
+
+
+def geocodificar_com_hedge(u, executores, estatisticas):
+    """
+    Cascata por níveis com hedge: o nível 1 consulta o endereço nos dois
+    provedores ao mesmo tempo; o próximo nível só é disparado quando os
+    pendentes responderam sem completar a unidade ou quando PRAZO_ESCALONAR_S
+    passa sem nenhuma resposta. Para assim que os resultados mesclados
+    preenchem tudo o que falta; o que ainda está na fila é cancelado.
+    """
+    faltando = campos_faltando(u)
+    niveis = sorted({e[4] for e in ESTRATEGIAS})
+    decidida = threading.Event()
+    futuros, resultados, pendentes = {}, {}, set()
+    proximo, prazo, ultimas = 0, None, []
+
+    while True:
+        dados, _ = mesclar(resultados)
+        if all(dados.get(c) for c in faltando):
+            if ultimas:
+                estatisticas[min(ultimas, key=PRIORIDADE.index)]["decisivas"] += 1
+            break
+
+        # Escalona: nada pendente ou prazo estourado
+        if proximo < len(niveis) and (not pendentes or time.monotonic() >= prazo):
+            for nome, provedor, funcao, argumentos, nivel in ESTRATEGIAS:
+                kwargs = argumentos(u) if nivel == niveis[proximo] else None
+                if kwargs is not None:
+                    futuro = executores[provedor].submit(_cronometrar, funcao, kwargs, decidida)
+                    futuros[futuro] = nome
+                    pendentes.add(futuro)
+                    estatisticas[nome]["disparadas"] += 1
+            proximo += 1
+            prazo = time.monotonic() + PRAZO_ESCALONAR_S
+            continue
+
+        if not pendentes:
+            break
+        espera = max(0.0, prazo - time.monotonic()) if proximo < len(niveis) else None
+        prontos, pendentes = wait(pendentes, timeout=espera, return_when=FIRST_COMPLETED)
+        ultimas = []
+        for futuro in prontos:
+            nome = futuros[futuro]
+            resultado, duracao, pulada = futuro.result()
+            if pulada:
+                estatisticas[nome]["canceladas"] += 1
+                continue
+            resultados[nome] = resultado
+            ultimas.append(nome)
+            estatisticas[nome]["respondidas"] += 1
+            estatisticas[nome]["tempo_total_s"] += duracao
+            if resultado:
+                estatisticas[nome]["com_resultado"] += 1
+
+    decidida.set()
+    for futuro in pendentes:
+        if futuro.cancel():
+            estatisticas[futuros[futuro]]["canceladas"] += 1
+
+    dados, origem = mesclar(resultados)
+    for campo in faltando:
+        if campo in origem:
+            estatisticas[origem[campo]]["campos_usados"] += 1
+    return dados or None
+
+
+def salvar_estatisticas(estatisticas, arquivo=ESTATISTICAS_FILE):
+    """Acumula as estatísticas desta execução com as anteriores (JSON) e imprime o resumo"""
+    acumuladas = {}
+    if os.path.exists(arquivo):
+        with open(arquivo, encoding="utf-8") as f:
+            acumuladas = json.load(f)
+    for nome, contadores in estatisticas.items():
+        destino = acumuladas.setdefault(nome, dict.fromkeys(CONTADORES + ("tempo_total_s",), 0))
+        for chave, valor in contadores.items():
+            destino[chave] = destino.get(chave, 0) + valor
+    for contadores in acumuladas.values():
+        respondidas = contadores["respondidas"]
+        contadores["taxa_acerto"] = round(contadores["com_resultado"] / respondidas, 4) if respondidas else None
+        contadores["tempo_medio_s"] = round(contadores["tempo_total_s"] / respondidas, 4) if respondidas else None
+
+    os.makedirs(os.path.dirname(arquivo) or ".", exist_ok=True)
+    with open(arquivo, "w", encoding="utf-8") as f:
+        json.dump(acumuladas, f, ensure_ascii=False, indent=2)
+
+    print(f"\n📊 Estratégias (acumulado em {arquivo}):")
+    for nome, c in acumuladas.items():
+        taxa = f"{100 * c['taxa_acerto']:.1f}%" if c["taxa_acerto"] is not None else "-"
+        print(f"   {nome:30s} acerto {taxa:>6s} | decisivas {c['decisivas']:>5d} | "
+              f"campos usados {c['campos_usados']:>5d} | canceladas {c['canceladas']:>5d}")
+
+
 def atualizar_unidade(u, dados):
     """Atualiza a unidade com os dados encontrados."""
     if not dados:
@@ -112,8 +306,15 @@ def geocodificar_unidades():
     print("🗄️ Conectando ao banco de dados...")
     db = Database()
     session = db.Session()
+    executores = criar_executores()
 
     try:
+        # Colunas *_cdn das unidades com coordenadas pelas malhas do IBGE (sem
+        # rede); a cascata abaixo só roda para o que continuar faltando
+        from utils.reverse_geocode_offline import malhas_disponiveis, preencher_cdn
+        if malhas_disponiveis():
+            preencher_cdn(db)
+
         # Busca unidades com alguma informação faltante
         unidades = session.query(Unidade).filter(
             or_(Unidade.latitude == None,
@@ -130,48 +331,24 @@ def geocodificar_unidades():
         sucessos_completos = 0
         sucessos_incompletos = 0
         falhas = 0
+        ids_atualizados = []
 
+        cache = obter_cache()
+        estatisticas = {nome: dict.fromkeys(CONTADORES + ("tempo_total_s",), 0) for nome in PRIORIDADE}
         for i, u in enumerate(unidades, 1):
             endereco = u.endereco.strip() if u.endereco else ""
             print(f"[{i}/{total}] Geocodificando: {endereco}")
 
-            dados = None
+            tinha_coords = bool(u.latitude and u.longitude)
 
             try:
-                # --- 1ª tentativa: Google endereço ---
-                if endereco:
-                    dados = geocode_google(endereco) or geocode_nominatim(endereco)
-
-                # --- 2ª tentativa: endereço + nome ---
-                if not dados or not all([dados.get(k) for k in ["bairro","cidade","estado","pais"]]):
-                    query_extra = f"{endereco}, {u.nome}"
-                    extra = geocode_google(query_extra) or geocode_nominatim(query_extra)
-                    if extra:
-                        for k, v in extra.items():
-                            if not dados.get(k):
-                                dados[k] = v
-
-                # --- 3ª tentativa: endereço + nome + rede ---
-                if not dados or not all([dados.get(k) for k in ["bairro","cidade","estado","pais"]]):
-                    query_extra2 = f"{endereco}, {u.nome}, {u.rede}"
-                    extra2 = geocode_nominatim(query_extra2)
-                    if extra2:
-                        for k, v in extra2.items():
-                            if not dados.get(k):
-                                dados[k] = v
-
-                # --- 4ª/5ª tentativa: reverse geocoding para complementar CDNs ---
-                if u.latitude and u.longitude:
-                    if not all([u.bairro_cdn, u.cidade_cdn, u.estado_cdn, u.pais_cdn]):
-                        dados_rev = geocode_google(lat=u.latitude, lon=u.longitude) or geocode_nominatim(lat=u.latitude, lon=u.longitude)
-                        if dados_rev:
-                            for k, v in dados_rev.items():
-                                if not dados.get(k):
-                                    dados[k] = v
+                dados = geocodificar_com_hedge(u, executores, estatisticas)
 
                 # Atualiza e imprime status
                 if atualizar_unidade(u, dados):
                     session.commit()
+                    if not tinha_coords and u.latitude and u.longitude:
+                        ids_atualizados.append(u.id)
                     campos = [u.latitude, u.longitude, u.bairro_cdn, u.cidade_cdn, u.estado_cdn, u.pais_cdn]
                     if all(campos):
                         print(f"    ✅ Atualizado: {u.latitude}, {u.longitude}, "
@@ -185,8 +362,6 @@ def geocodificar_unidades():
                     print("    ❌ Nenhum dado válido encontrado")
                     falhas += 1
 
-                time.sleep(0.5)  # limite API
-
             except Exception as e:
                 print(f"    ❌ Erro inesperado: {e}")
                 session.rollback()
@@ -196,8 +371,16 @@ def geocodificar_unidades():
               f"Sucessos completos: {sucessos_completos}, "
               f"Incompletos: {sucessos_incompletos}, "
               f"Falhas: {falhas}")
+        print(cache.resumo())
+        salvar_estatisticas(estatisticas)
+
+        if ids_atualizados:
+            print(f"📍 Atualizando pares próximos de {len(ids_atualizados)} unidades...")
+            db.atualizar_pares_proximos(ids_atualizados)
 
     finally:
+        for executor in executores.values():
+            executor.shutdown(wait=False, cancel_futures=True)
         session.close()
 
 
@@ -2,8 +2,7 @@ import asyncio
 import time
 import re
 from playwright.async_api import async_playwright
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from database.db import Database
 from database.models import Unidade
 
 # ==============================
@@ -50,14 +49,13 @@ async def geocode_com_clique():
     print("🚀 Iniciando geocodificação com clique no Google Maps")
     print("=" * 60)
 
-    engine = create_engine("sqlite:///./unidades.db")
-    Session = sessionmaker(bind=engine)
-    session = Session()
+    db = Database("sqlite:///./unidades.db")
+    session = db.Session()
 
     # Buscar unidades sem coordenadas
     unidades_sem_coords = (
         session.query(Unidade)
-        .filter((Unidade.latitude == "") | (Unidade.latitude.is_(None)))
+        .filter(Unidade.latitude.is_(None))
         .all()
     )
 
@@ -66,6 +64,8 @@ async def geocode_com_clique():
         print("✅ Nenhuma unidade pendente!")
         return
 
+    ids_atualizados = []
+
     async with async_playwright() as p:
         browser = await p.chromium.launch(headless=False)
         page = await browser.new_page(viewport={'width': 1280, 'height': 720})
@@ -99,13 +99,14 @@ async def geocode_com_clique():
                 coords = await copiar_coords_via_click(page)
                 if coords:
                     lat, lng = coords
-                    unidade.latitude = str(lat)
-                    unidade.longitude = str(lng)
+                    unidade.latitude = lat
+                    unidade.longitude = lng
                     session.commit()
+                    ids_atualizados.append(unidade.id)
                     print(f"   ✅ Coordenadas encontradas: {lat}, {lng}")
                 else:
                     print("   ❌ Não foi possível encontrar coordenadas")
-                    # Mantém NULL ou "" no banco
+                    # Mantém NULL no banco
 
             except Exception as e:
                 print(f"   ⚠️ Erro ao processar: {e}")
@@ -118,6 +119,10 @@ async def geocode_com_clique():
     session.close()
     print("\n🎉 Geocodificação concluída!")
 
+    if ids_atualizados:
+        print(f"📍 Atualizando pares próximos de {len(ids_atualizados)} unidades...")
+        db.atualizar_pares_proximos(ids_atualizados)
+
 # ==============================
 # Execução
 # ==============================
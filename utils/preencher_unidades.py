@@ -2,6 +2,11 @@ import os
 import sqlite3
 import sys
 
+# Adiciona o diretório raiz ao path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.db import Database
+
 # ===========================
 # CONFIGURAÇÃO INICIAL
 # ===========================
@@ -42,7 +47,7 @@ if coluna_filtrar == "coords":
     query = """
     SELECT id, rede, nome, endereco, latitude, longitude
     FROM unidades
-    WHERE latitude IS NULL OR latitude = '' OR longitude IS NULL OR longitude = ''
+    WHERE latitude IS NULL OR longitude IS NULL
     """
 else:
     query = f"""
@@ -65,6 +70,7 @@ if total == 0:
 # ===========================
 # Loop de preenchimento manual
 # ===========================
+ids_atualizados = []
 for i, registro in enumerate(registros, 1):
     if coluna_filtrar == "coords":
         uid, rede, nome, endereco, lat, lon = registro
@@ -83,6 +89,7 @@ for i, registro in enumerate(registros, 1):
                     WHERE id = ?
                 """, (nova_lat, nova_lon, uid))
                 conn.commit()
+                ids_atualizados.append(uid)
                 print(f"    ✅ Atualizado para: Latitude={nova_lat}, Longitude={nova_lon}\n")
             except ValueError:
                 print("    ❌ Entrada inválida. Deve ser dois números separados por vírgula. Pulando...\n")
@@ -110,3 +117,7 @@ for i, registro in enumerate(registros, 1):
 # ===========================
 conn.close()
 print("🎉 Preenchimento manual concluído!")
+
+if ids_atualizados:
+    print(f"📍 Atualizando pares próximos de {len(ids_atualizados)} unidades...")
+    Database(f"sqlite:///{os.path.abspath(db_path)}").atualizar_pares_proximos(ids_atualizados)
@@ -1,6 +1,13 @@
 import sqlite3
 import requests
 import time
+import sys
+import os
+
+# Adiciona o diretório raiz ao path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.cache_geocode import obter_cache, chave_coordenadas
 
 DB_PATH = "./unidades.db"
 
@@ -16,8 +23,11 @@ def create_columns_if_not_exist(conn):
             print(f"✅ Coluna adicionada: {col}")
     conn.commit()
 
-def reverse_geocode(lat, lon):
-    """Consulta o Nominatim para obter bairro, cidade, estado, país"""
+def _consultar_nominatim(lat, lon):
+    """
+    Consulta o Nominatim; None = nenhum resultado (vai para o cache negativo),
+    exceção = erro de rede/HTTP (não vai para o cache)
+    """
     url = "https://nominatim.openstreetmap.org/reverse"
     params = {
         "lat": lat,
@@ -27,23 +37,41 @@ def reverse_geocode(lat, lon):
         "accept-language": "pt"
     }
     headers = {"User-Agent": "opportunity-geocoder/1.0"}
-    
-    try:
-        resp = requests.get(url, params=params, headers=headers, timeout=10)
-        resp.raise_for_status()
-        data = resp.json()
-        address = data.get("address", {})
 
-        bairro = address.get("suburb") or address.get("neighbourhood") or ""
-        cidade = address.get("city") or address.get("town") or address.get("municipality") or address.get("village") or ""
-        estado = address.get("state", "")
-        pais = address.get("country", "")
+    resp = requests.get(url, params=params, headers=headers, timeout=10)
+    resp.raise_for_status()
+    data = resp.json()
+    # Ponto sem endereço (ex.: no mar) vem como {"error": "Unable to geocode"}
+    if not data or "error" in data:
+        return None
+    address = data.get("address", {})
+
+    bairro = address.get("suburb") or address.get("neighbourhood") or ""
+    cidade = address.get("city") or address.get("town") or address.get("municipality") or address.get("village") or ""
+    estado = address.get("state", "")
+    pais = address.get("country", "")
 
-        return bairro, cidade, estado, pais
+    return [bairro, cidade, estado, pais]
+
+def reverse_geocode(lat, lon):
+    """
+    Consulta o Nominatim para obter bairro, cidade, estado, país.
+    Retorna também se a resposta veio do cache persistente.
+    """
+    cache = obter_cache()
+    chave = chave_coordenadas("nominatim_reverso_pt", lat, lon)
+    encontrado, valores = cache.obter(chave)
+    if encontrado:
+        return (*(valores or [None] * 4), True)
+
+    try:
+        valores = _consultar_nominatim(lat, lon)
+        cache.guardar(chave, valores)
+        return (*(valores or [None] * 4), False)
 
     except Exception as e:
         print(f"⚠️ Erro no reverse geocode ({lat}, {lon}): {e}")
-        return None, None, None, None
+        return None, None, None, None, False
 
 def main():
     conn = sqlite3.connect(DB_PATH)
@@ -55,15 +83,14 @@ def main():
     # Seleciona apenas registros com coordenadas válidas
     cursor.execute("""
         SELECT id, latitude, longitude FROM unidades
-        WHERE latitude IS NOT NULL AND latitude != ''
-          AND longitude IS NOT NULL AND longitude != ''
+        WHERE latitude IS NOT NULL AND longitude IS NOT NULL
     """)
     unidades = cursor.fetchall()
     print(f"📊 Total de registros com coordenadas: {len(unidades)}")
 
     for idx, (uid, lat, lon) in enumerate(unidades, start=1):
         print(f"\n[{idx}/{len(unidades)}] Processando ID {uid}...")
-        bairro, cidade, estado, pais = reverse_geocode(lat, lon)
+        bairro, cidade, estado, pais, do_cache = reverse_geocode(lat, lon)
 
         if bairro or cidade or estado or pais:
             cursor.execute("""
@@ -76,10 +103,12 @@ def main():
         else:
             print("⚠️ Nenhum dado encontrado.")
 
-        time.sleep(1)  # respeita limite de requisições do Nominatim
+        if not do_cache:
+            time.sleep(1)  # respeita limite de requisições do Nominatim
 
     conn.close()
     print("\n🎉 Reverse geocoding concluído!")
+    print(obter_cache().resumo())
 
 if __name__ == "__main__":
     main()
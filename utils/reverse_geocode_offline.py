@@ -0,0 +1,180 @@
+# =========================
+# reverse_geocode_offline.py
+# =========================
+"""
+Geocodificação reversa offline das colunas *_cdn (bairro, cidade, estado, país).
+
+Carrega as malhas do IBGE (municípios obrigatório; bairros opcional) de
+shapefile/GeoPackage, monta um STRtree por camada e resolve todas as
+unidades com coordenadas em uma única consulta vetorizada
+(ponto-dentro-de-polígono). Pontos que caem fora de todos os polígonos
+(ex.: orla, malha simplificada) ficam com o polígono mais próximo a até
+TOLERANCIA_GRAUS. Tudo é gravado com um único UPDATE em massa
+(Database.atualizar_cdn_em_massa) — sem rede e sem limite de requisições.
+
+Malhas: https://www.ibge.gov.br/geociencias/organizacao-do-territorio/malhas-territoriais.html
+(ex.: BR_Municipios_2022.shp e, para bairros, BR_bairros_CD2022.shp).
+"""
+import argparse
+import functools
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+# Adiciona o diretório raiz ao path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.db import Database, CAMPOS_CDN
+
+DADOS_DIR = "./dados/ibge"
+MUNICIPIOS_FILE = os.path.join(DADOS_DIR, "BR_Municipios_2022.shp")
+BAIRROS_FILE = os.path.join(DADOS_DIR, "BR_bairros_CD2022.shp")   # opcional
+
+# Colunas das malhas do IBGE
+COL_MUNICIPIO = "NM_MUN"
+COL_UF = "SIGLA_UF"
+COL_BAIRRO = "NM_BAIRRO"
+
+PAIS = "Brazil"             # mesmo valor que os geocoders gravam em pais_cdn
+TOLERANCIA_GRAUS = 0.01     # ~1 km: pontos fora de qualquer polígono pegam o mais próximo
+
+# estado_cdn guarda o nome do estado (como Google/Nominatim devolvem), não a sigla
+ESTADOS = {
+    "AC": "Acre", "AL": "Alagoas", "AP": "Amapá", "AM": "Amazonas", "BA": "Bahia",
+    "CE": "Ceará", "DF": "Distrito Federal", "ES": "Espírito Santo", "GO": "Goiás",
+    "MA": "Maranhão", "MT": "Mato Grosso", "MS": "Mato Grosso do Sul", "MG": "Minas Gerais",
+    "PA": "Pará", "PB": "Paraíba", "PR": "Paraná", "PE": "Pernambuco", "PI": "Piauí",
+    "RJ": "Rio de Janeiro", "RN": "Rio Grande do Norte", "RS": "Rio Grande do Sul",
+    "RO": "Rondônia", "RR": "Roraima", "SC": "Santa Catarina", "SP": "São Paulo",
+    "SE": "Sergipe", "TO": "Tocantins",
+}
+
+
+# =========================
+# Malhas e índice espacial
+# =========================
+class Camada:
+    """Polígonos de uma malha + STRtree + atributos alinhados por índice"""
+
+    def __init__(self, arquivo, colunas):
+        import geopandas as gpd
+        from shapely import STRtree
+
+        gdf = gpd.read_file(arquivo, columns=list(colunas))
+        if gdf.crs is not None and gdf.crs.to_epsg() != 4326:
+            gdf = gdf.to_crs(4326)   # SIRGAS 2000 → WGS 84 (diferença submétrica)
+        self.atributos = {coluna: gdf[coluna].to_numpy() for coluna in colunas}
+        self.arvore = STRtree(gdf.geometry.to_numpy())
+
+    def localizar(self, pontos, tolerancia=TOLERANCIA_GRAUS):
+        """
+        Índice do polígono que contém cada ponto (-1 se nenhum), em uma
+        consulta em massa; os que sobram tentam o polígono mais próximo.
+        """
+        indice = np.full(len(pontos), -1, dtype=np.intp)
+        i_ponto, i_poligono = self.arvore.query(pontos, predicate="within")
+        # Ponto na divisa de dois polígonos: fica o primeiro
+        primeiro = np.unique(i_ponto, return_index=True)[1]
+        indice[i_ponto[primeiro]] = i_poligono[primeiro]
+
+        fora = np.flatnonzero(indice < 0)
+        if len(fora) and tolerancia:
+            i_fora, i_proximo = self.arvore.query_nearest(pontos[fora], max_distance=tolerancia, all_matches=False)
+            indice[fora[i_fora]] = i_proximo
+        return indice
+
+    def valores(self, coluna, indice):
+        saida = np.full(len(indice), None, dtype=object)
+        achados = indice >= 0
+        saida[achados] = self.atributos[coluna][indice[achados]]
+        return saida
+
+
+@functools.lru_cache(maxsize=None)
+def carregar_camadas(municipios_file=MUNICIPIOS_FILE, bairros_file=BAIRROS_FILE):
+    """(municípios, bairros ou None), carregados uma vez por processo"""
+    if not os.path.exists(municipios_file):
+        raise FileNotFoundError(f"Malha de municípios não encontrada: {municipios_file}")
+    municipios = Camada(municipios_file, (COL_MUNICIPIO, COL_UF))
+    bairros = Camada(bairros_file, (COL_BAIRRO,)) if bairros_file and os.path.exists(bairros_file) else None
+    return municipios, bairros
+
+
+def malhas_disponiveis(municipios_file=MUNICIPIOS_FILE):
+    return os.path.exists(municipios_file)
+
+
+def resolver(latitudes, longitudes, municipios_file=MUNICIPIOS_FILE, bairros_file=BAIRROS_FILE):
+    """
+    DataFrame (bairro_cdn, cidade_cdn, estado_cdn, pais_cdn) alinhado com as
+    coordenadas de entrada; None onde o ponto não caiu em nenhuma malha.
+    """
+    import shapely
+
+    municipios, bairros = carregar_camadas(municipios_file, bairros_file)
+    pontos = shapely.points(np.asarray(longitudes, dtype=float), np.asarray(latitudes, dtype=float))
+
+    i_mun = municipios.localizar(pontos)
+    siglas = municipios.valores(COL_UF, i_mun)
+    resultado = pd.DataFrame({
+        "bairro_cdn": bairros.valores(COL_BAIRRO, bairros.localizar(pontos, tolerancia=0))
+        if bairros is not None else None,
+        "cidade_cdn": municipios.valores(COL_MUNICIPIO, i_mun),
+        "estado_cdn": [ESTADOS.get(sigla) for sigla in siglas],
+        "pais_cdn": np.where(i_mun >= 0, PAIS, None),
+    })
+    return resultado.astype(object).where(resultado.notna(), None)
+
+
+# =========================
+# Banco
+# =========================
+def preencher_cdn(db=None, sobrescrever=False, municipios_file=MUNICIPIOS_FILE, bairros_file=BAIRROS_FILE):
+    """
+    Resolve todas as unidades com coordenadas e grava as colunas *_cdn com um
+    único UPDATE em massa. Por padrão só preenche campos vazios
+    (sobrescrever=True troca todos). Retorna o número de unidades alteradas.
+    """
+    db = db or Database()
+    inicio = time.perf_counter()
+
+    with db.engine.connect() as conn:
+        df = pd.read_sql_query(text(
+            "SELECT id, latitude, longitude FROM unidades "
+            "WHERE latitude IS NOT NULL AND longitude IS NOT NULL"
+        ), conn)
+    print(f"📊 Unidades com coordenadas: {len(df)}")
+    if df.empty:
+        return 0
+
+    resolvido = resolver(df["latitude"], df["longitude"], municipios_file, bairros_file)
+    resolvido["id"] = df["id"].to_numpy()
+    resolvido = resolvido[resolvido["cidade_cdn"].notna()]
+    print(f"🗺️ {len(resolvido)} unidades dentro das malhas ({len(df) - len(resolvido)} fora) "
+          f"em {time.perf_counter() - inicio:.2f}s")
+
+    alteradas = db.atualizar_cdn_em_massa(resolvido[["id", *CAMPOS_CDN]].to_dict("records"), sobrescrever)
+
+    print(f"✅ Colunas {', '.join(CAMPOS_CDN)} atualizadas em {alteradas} unidades "
+          f"em {time.perf_counter() - inicio:.2f}s")
+    return alteradas
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Preenche bairro/cidade/estado/pais_cdn com as malhas do IBGE")
+    parser.add_argument("--municipios", default=MUNICIPIOS_FILE, help="shapefile/GeoPackage de municípios")
+    parser.add_argument("--bairros", default=BAIRROS_FILE, help="shapefile/GeoPackage de bairros (opcional)")
+    parser.add_argument("--sobrescrever", action="store_true", help="troca também os valores já preenchidos")
+    args = parser.parse_args()
+
+    if not malhas_disponiveis(args.municipios):
+        print(f"❌ Malha de municípios não encontrada: {args.municipios}")
+        print("💡 Baixe em https://www.ibge.gov.br/geociencias/organizacao-do-territorio/malhas-territoriais.html")
+        sys.exit(1)
+
+    preencher_cdn(sobrescrever=args.sobrescrever, municipios_file=args.municipios, bairros_file=args.bairros)
+    print("\n🎉 Reverse geocoding offline concluído!")
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Script de teste do modo em lote do Geocod.io, sem acesso à rede.
+Sobe um servidor local (em uma porta livre) que imita os endpoints GET e
+POST /geocode, aponta GEOCODIO_URL para ele e confere se as coordenadas
+voltam para as unidades certas (mapeadas pelo índice) com um UPDATE em
+massa por lote, e se no modo individual um erro (HTTP ou resposta
+malformada) tira só aquele endereço.
+Sai com código 1 se algo não bater.
+"""
+
+import json
+import os
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# O módulo do Geocod.io lê a chave do .env ao ser importado
+os.environ["GEOCODIO_API_KEY"] = "chave-de-teste"
+
+# Adiciona o diretório pai ao path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.db import Database
+from database.models import Unidade
+from database.cache_geocode import CacheGeocode
+
+
+def coordenadas_falsas(endereco):
+    """Coordenadas determinísticas a partir do endereço ("Rua Teste, 7" → -7.0, -47.0)"""
+    numero = int(endereco.rsplit(",", 1)[1])
+    return -float(numero), -40.0 - numero
+
+
+def resposta_falsa(endereco):
+    if "inexistente" in endereco:
+        return {"input": {}, "results": []}
+    lat, lng = coordenadas_falsas(endereco)
+    return {"results": [{"location": {"lat": lat, "lng": lng}, "accuracy": 1}]}
+
+
+class StubGeocodio(BaseHTTPRequestHandler):
+    requisicoes = []
+
+    def do_POST(self):
+        enderecos = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        StubGeocodio.requisicoes.append(("POST", len(enderecos)))
+        resultados = [{"query": endereco, "response": resposta_falsa(endereco)} for endereco in enderecos]
+        self._responder({"results": resultados})
+
+    def do_GET(self):
+        endereco = parse_qs(urlparse(self.path).query)["q"][0]
+        StubGeocodio.requisicoes.append(("GET", 1))
+        if "erro" in endereco:
+            # 4xx não é repetido: vira ErroGeocode na hora
+            self._responder({"error": "endereço rejeitado"}, status=422)
+        elif "malformado" in endereco:
+            # Resultado sem "location": KeyError dentro de geocodificar_endereco
+            self._responder({"results": [{"accuracy": 1}]})
+        else:
+            self._responder(resposta_falsa(endereco))
+
+    def _responder(self, corpo, status=200):
+        dados = json.dumps(corpo).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(dados)))
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def log_message(self, *args):
+        pass
+
+
+def conferir_coordenadas(db, rede):
+    """Lista de divergências entre o banco e as coordenadas esperadas da rede"""
+    session = db.Session()
+    try:
+        erros = []
+        for u in session.query(Unidade).filter(Unidade.rede == rede):
+            sem_coords = any(marca in u.endereco for marca in ("inexistente", "erro", "malformado"))
+            esperado = (None, None) if sem_coords else coordenadas_falsas(u.endereco)
+            if (u.latitude, u.longitude) != esperado:
+                erros.append(f"{u.nome}: {u.latitude}, {u.longitude} (esperado {esperado})")
+        return erros
+    finally:
+        session.close()
+
+
+def testar_geocodio_em_lote():
+    """Geocodifica unidades de teste em lotes e individualmente contra o servidor local"""
+
+    print("🧪 TESTANDO MODO EM LOTE DO GEOCOD.IO")
+    print("=" * 60)
+
+    # Porta 0: o sistema escolhe uma livre (execuções em paralelo não colidem)
+    servidor = HTTPServer(("127.0.0.1", 0), StubGeocodio)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    host, porta = servidor.server_address
+    os.environ["GEOCODIO_URL"] = f"http://{host}:{porta}/v1.7"
+    from utils import geocode_geocodio
+
+    problemas = []
+    with tempfile.TemporaryDirectory() as pasta:
+        db = Database(f"sqlite:///{os.path.join(pasta, 'teste.db')}")
+        cache = CacheGeocode(os.path.join(pasta, "cache.db"))
+
+        unidades_teste = [
+            {"rede": "TESTE_GEOCODIO", "nome": f"Unidade {i}", "endereco": f"Rua Teste, {i}"}
+            for i in range(1, 8)
+        ]
+        unidades_teste.append({"rede": "TESTE_GEOCODIO", "nome": "Unidade Perdida",
+                               "endereco": "Rua inexistente, 0"})
+        db.upsert_unidades(unidades_teste)
+        print(f"📊 Unidades de teste criadas: {len(unidades_teste)}")
+
+        try:
+            # Modo em lote
+            resultado = geocode_geocodio.geocodificar_unidades(tamanho_lote=3, db=db, cache=cache)
+            posts = [n for metodo, n in StubGeocodio.requisicoes if metodo == "POST"]
+            print(f"\n📨 POSTs recebidos pelo servidor: {posts}")
+            print(f"📊 Sucessos: {resultado['sucessos']} | Falhas: {resultado['falhas']}")
+
+            problemas += conferir_coordenadas(db, "TESTE_GEOCODIO")
+            if posts != [3, 3, 2] or resultado["sucessos"] != 7:
+                problemas.append(f"lotes/contagens inesperados: POSTs {posts}, {resultado['sucessos']} sucessos")
+
+            # Segunda execução: o que sobrou (só a inexistente) vem do cache negativo
+            StubGeocodio.requisicoes.clear()
+            geocode_geocodio.geocodificar_unidades(tamanho_lote=3, db=db, cache=cache)
+            if StubGeocodio.requisicoes:
+                problemas.append(f"requisições na 2ª execução: {StubGeocodio.requisicoes}")
+
+            # Modo individual: o endereço com erro não derruba os outros do lote
+            db.upsert_unidades([
+                {"rede": "TESTE_INDIVIDUAL", "nome": "Individual 11", "endereco": "Rua Teste, 11"},
+                {"rede": "TESTE_INDIVIDUAL", "nome": "Individual Erro", "endereco": "Rua erro, 0"},
+                {"rede": "TESTE_INDIVIDUAL", "nome": "Individual Malformado", "endereco": "Rua malformado, 0"},
+                {"rede": "TESTE_INDIVIDUAL", "nome": "Individual 12", "endereco": "Rua Teste, 12"},
+            ])
+            StubGeocodio.requisicoes.clear()
+            resultado = geocode_geocodio.geocodificar_unidades(tamanho_lote=4, individual=True, db=db, cache=cache)
+            problemas += conferir_coordenadas(db, "TESTE_INDIVIDUAL")
+            if resultado["sucessos"] != 2:
+                problemas.append(f"modo individual: {resultado['sucessos']} sucessos (esperado 2)")
+
+            # Os erros não vão para o cache: a próxima execução tenta os endereços de novo
+            StubGeocodio.requisicoes.clear()
+            geocode_geocodio.geocodificar_unidades(tamanho_lote=4, individual=True, db=db, cache=cache)
+            if StubGeocodio.requisicoes != [("GET", 1), ("GET", 1)]:
+                problemas.append(f"erro foi para o cache? requisições: {StubGeocodio.requisicoes}")
+        finally:
+            cache.fechar()
+            db.engine.dispose()
+            servidor.shutdown()
+
+    if problemas:
+        print("\n❌ Problemas encontrados:")
+        for problema in problemas:
+            print(f"   - {problema}")
+        sys.exit(1)
+    print(f"\n✅ TESTE CONCLUÍDO! Coordenadas mapeadas por índice e gravadas por lote")
+
+
+if __name__ == "__main__":
+    testar_geocodio_em_lote()
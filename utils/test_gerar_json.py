@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Script de teste da exportação JSON/NDJSON de Database.gerar_json.
+Usa um banco temporário com mais unidades que o chunk, confere o array
+JSON, o NDJSON completo e a exportação incremental (só as unidades
+alteradas depois da última exportação são acrescentadas).
+"""
+
+import json
+import os
+import sys
+import tempfile
+import time
+
+# Adiciona o diretório pai ao path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.db import Database, COLUNAS_JSON
+
+
+def ler_ndjson(caminho):
+    with open(caminho, encoding="utf-8") as f:
+        return [json.loads(linha) for linha in f if linha.strip()]
+
+
+def testar_gerar_json():
+    """Exporta um banco de teste nos dois formatos e confere o conteúdo"""
+
+    print("🧪 TESTANDO EXPORTAÇÃO JSON / NDJSON")
+    print("=" * 60)
+
+    erros = []
+    with tempfile.TemporaryDirectory() as pasta:
+        db = Database(f"sqlite:///{os.path.join(pasta, 'teste.db')}")
+        unidades_teste = [
+            {"rede": "TESTE_JSON", "nome": f"Unidade {i}", "endereco": f"Rua Teste, {i}",
+             "latitude": -23.5 - i / 100, "longitude": -46.6, "servicos": ["musculação"]}
+            for i in range(5)
+        ]
+        db.upsert_unidades(unidades_teste)
+
+        try:
+            # Array JSON, lido em blocos de 2
+            arquivo_json = os.path.join(pasta, "unidades.json")
+            total = db.gerar_json(arquivo_json, chunk=2)
+            with open(arquivo_json, encoding="utf-8") as f:
+                dados = json.load(f)
+            if total != 5 or [u["nome"] for u in dados] != [u["nome"] for u in unidades_teste]:
+                erros.append(f"json: {total} escritas, nomes {[u['nome'] for u in dados]}")
+            if dados and list(dados[0]) != list(COLUNAS_JSON):
+                erros.append(f"json: campos {list(dados[0])}")
+
+            # NDJSON completo
+            arquivo_ndjson = os.path.join(pasta, "unidades.ndjson")
+            total = db.gerar_json(arquivo_ndjson, chunk=2)
+            linhas = ler_ndjson(arquivo_ndjson)
+            if total != 5 or linhas != dados:
+                erros.append(f"ndjson: {total} escritas, {len(linhas)} linhas (diferente do json)")
+
+            # Incremental: cria a marca, altera uma unidade e acrescenta só ela
+            arquivo_inc = os.path.join(pasta, "incremental.ndjson")
+            db.gerar_json(arquivo_inc, incremental=True, chunk=2)
+            time.sleep(0.01)
+            db.upsert_unidades([dict(unidades_teste[3], endereco="Rua Nova, 3")], conflito="atualizar")
+            novas = db.gerar_json(arquivo_inc, incremental=True, chunk=2)
+            linhas = ler_ndjson(arquivo_inc)
+            if novas != 1 or len(linhas) != 6 or linhas[-1]["endereco"] != "Rua Nova, 3":
+                erros.append(f"incremental: {novas} novas, {len(linhas)} linhas no arquivo")
+        finally:
+            db.engine.dispose()
+
+    if erros:
+        print("\n❌ Exportação com problemas:")
+        for erro in erros:
+            print(f"   - {erro}")
+        sys.exit(1)
+    print("\n✅ TESTE CONCLUÍDO! JSON, NDJSON e incremental conferidos")
+
+
+if __name__ == "__main__":
+    testar_gerar_json()